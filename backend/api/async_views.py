@@ -0,0 +1,100 @@
+"""
+Асинхронные входы для самых частых чтений под ASGI
+(foodgram.asgi_urls): рецепты, теги, ингредиенты и /users/me/.
+Экспериментально: это обертки над синхронными вью, а не отдельная
+асинхронная реализация, и на замерах benchmarks/load.py ASGI пока
+медленнее WSGI при любом числе клиентов.
+
+Ответы, которые уже лежат в кеше (справочники по ETag, /users/me/
+с токеном из api.authentication), собираются без синхронной вью и
+DRF. Остальное выполняют обычные синхронные вью. И то и другое идет
+в потоке через sync_to_async: обращения к кешу (redis) и к базе
+блокирующие и не должны останавливать цикл событий воркера.
+Одновременно таких запросов не больше ASYNC_DB_CONCURRENCY на процесс,
+чтобы тысяча клиентов не открыла тысячу соединений с базой.
+Async ORM в Django 4.0 нет, поэтому работа с базой остается в
+синхронном коде
+"""
+import asyncio
+import weakref
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.urls import resolve
+from rest_framework.renderers import JSONRenderer
+
+from api.authentication import cached_user
+from api.cache import user_me_key
+from api.views import IngredientViewSet, TagsViewSet
+
+READ_METHODS = ('GET', 'HEAD')
+
+_slots = weakref.WeakKeyDictionary()
+
+
+def db_slots():
+    """Семафор создается в цикле событий воркера при первом запросе"""
+    loop = asyncio.get_running_loop()
+    if loop not in _slots:
+        _slots[loop] = asyncio.Semaphore(settings.ASYNC_DB_CONCURRENCY)
+    return _slots[loop]
+
+
+def wants_json(request):
+    """Формат по умолчанию: без ?format= и не браузерный API"""
+    return ('format' not in request.GET
+            and 'text/html' not in request.headers.get('Accept', ''))
+
+
+def catalog_response(viewset):
+    def fast_path(request, **kwargs):
+        if not wants_json(request):
+            return None
+        return viewset.cached_catalog_response(
+            request, viewset.catalog_etag(request))
+    return fast_path
+
+
+def me_response(request):
+    user = cached_user(request) if wants_json(request) else None
+    if user is None:
+        return None
+    data = cache.get(user_me_key(user.pk))
+    if data is None:
+        return None
+    return HttpResponse(JSONRenderer().render(data),
+                        content_type='application/json')
+
+
+def async_view(path, fast_path=None):
+    """
+    Асинхронная обертка над синхронной вью, которая отвечает на path
+    в foodgram.urls: fast_path(request, **kwargs) отдает ответ из кеша
+    или None, тогда запрос уходит в синхронную вью
+    """
+    sync_view = resolve(path, urlconf='foodgram.urls').func
+
+    async def view(request, *args, **kwargs):
+        async with db_slots():
+            if fast_path is not None and request.method in READ_METHODS:
+                response = await sync_to_async(fast_path)(request, **kwargs)
+                if response is not None:
+                    return response
+            return await sync_to_async(sync_view)(request, *args, **kwargs)
+
+    # Как у APIView.as_view: CSRF проверяет DRF
+    view.csrf_exempt = True
+    return view
+
+
+recipes = async_view('/api/recipes/')
+recipe_detail = async_view('/api/recipes/1/')
+tags = async_view('/api/tags/', catalog_response(TagsViewSet))
+tag_detail = async_view('/api/tags/1/', catalog_response(TagsViewSet))
+ingredients = async_view('/api/ingredients/',
+                         catalog_response(IngredientViewSet))
+ingredient_detail = async_view('/api/ingredients/1/',
+                               catalog_response(IngredientViewSet))
+users_me = async_view('/api/users/me/', me_response)
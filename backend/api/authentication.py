@@ -0,0 +1,125 @@
+"""
+TokenAuthentication без запроса к базе на каждый API-запрос.
+
+Пара (user, token) ищется в LRU процесса (TOKEN_CACHE_SIZE записей,
+живут TOKEN_CACHE_TTL секунд), затем, если задан TOKEN_CACHE_ALIAS,
+в общем кеше и только потом в базе. Выход (удаление токена) и любое
+сохранение пользователя (пароль, is_active, роль) удаляют запись
+сигналами api.signals в этом процессе и в общем кеше; LRU других
+процессов доживает не дольше TTL.
+
+Пользователь из кеша (from_token_cache) может отставать по полям,
+которые меняет UPDATE в обход save(), например shopping_list_version:
+такие поля перечитываются из базы (recipes.shopping.current_version).
+Сохраняется он только с update_fields (User.save)
+"""
+import copy
+import threading
+import time
+from collections import Counter, OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.authentication import (TokenAuthentication,
+                                           get_authorization_header)
+
+
+class TokenCache:
+    """LRU с TTL и опциональным общим кешем Django"""
+
+    def __init__(self, size, ttl, alias=None):
+        self.size = size
+        self.ttl = ttl
+        self.alias = alias
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.stats = Counter()
+
+    @property
+    def shared(self):
+        return caches[self.alias] if self.alias else None
+
+    @staticmethod
+    def shared_key(key):
+        return f'auth-token:{key}'
+
+    def get(self, key):
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] > now:
+                self.entries.move_to_end(key)
+                self.stats['hits'] += 1
+                return entry[1]
+        if self.shared is not None:
+            value = self.shared.get(self.shared_key(key))
+            if value is not None:
+                self.stats['shared_hits'] += 1
+                self.put(key, value, shared=False)
+                return value
+        self.stats['misses'] += 1
+        return None
+
+    def put(self, key, value, shared=True):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+        if shared and self.shared is not None:
+            self.shared.set(self.shared_key(key), value, self.ttl)
+
+    def evict(self, keys=(), user_id=None):
+        """Удаляет токены keys и все записи пользователя user_id"""
+        keys = set(keys)
+        with self.lock:
+            if user_id is not None:
+                keys.update(
+                    key for key, (_, (user, _)) in self.entries.items()
+                    if user.pk == user_id)
+            for key in keys:
+                if self.entries.pop(key, None) is not None:
+                    self.stats['evictions'] += 1
+        if keys and self.shared is not None:
+            self.shared.delete_many(
+                [self.shared_key(key) for key in keys])
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+        self.stats.clear()
+
+
+token_cache = TokenCache(settings.TOKEN_CACHE_SIZE,
+                         settings.TOKEN_CACHE_TTL,
+                         settings.TOKEN_CACHE_ALIAS)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    def authenticate_credentials(self, key):
+        # Вью может менять request.user, поэтому в кеше лежит копия
+        cached = token_cache.get(key)
+        if cached is None:
+            user, token = super().authenticate_credentials(key)
+            token_cache.put(key, (copy.copy(user), token))
+            return user, token
+        user, token = cached
+        user = copy.copy(user)
+        user.from_token_cache = True
+        return user, token
+
+
+def cached_user(request):
+    """
+    Пользователь по заголовку Authorization только из кеша токенов,
+    без запроса к базе (для api.async_views); None, если его там нет
+    """
+    auth = get_authorization_header(request).split()
+    keyword = CachedTokenAuthentication.keyword.lower().encode()
+    if len(auth) != 2 or auth[0].lower() != keyword:
+        return None
+    try:
+        cached = token_cache.get(auth[1].decode())
+    except UnicodeError:
+        return None
+    return cached[0] if cached else None
@@ -0,0 +1,87 @@
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+from recipes.models import CatalogVersion
+
+# Сколько версия справочника живет в общем кеше без записей
+CATALOG_VERSION_TIMEOUT = 60
+
+
+def get_version(name):
+    """
+    Текущее поколение данных name. Ключи кеша, в которые входит
+    поколение, устаревают сразу после bump_version
+    """
+    return cache.get_or_set(f'version:{name}', 1, timeout=None)
+
+
+def bump_version(name):
+    key = f'version:{name}'
+    try:
+        return cache.incr(key)
+    except ValueError:
+        cache.set(key, 2, timeout=None)
+        return 2
+
+
+def model_counts(model):
+    """
+    Поколение count списков модели model: растет при записи в саму
+    модель и в то, по чему список фильтруется для всех (api.signals)
+    """
+    return f'counts:{model._meta.label_lower}'
+
+
+def user_counts(user_id):
+    """
+    Поколение count списков, которые фильтруются по избранному,
+    корзине или подпискам пользователя user_id: растет только при
+    его собственных изменениях
+    """
+    return f'counts:user:{user_id}'
+
+
+def catalog_version_key(name):
+    return f'catalog-version:{name}'
+
+
+def read_catalog_version(name):
+    version = CatalogVersion.objects.filter(name=name).values_list(
+        'version', flat=True).first()
+    return version or 1
+
+
+def get_catalog_version(name):
+    """
+    Версия справочника name. По ней строятся ETag и ключи кеша, которые
+    обязаны совпадать во всех процессах: хранится она в базе, а
+    читается из общего кеша, в базу - только на промахе
+    """
+    key = catalog_version_key(name)
+    version = cache.get(key)
+    if version is None:
+        version = read_catalog_version(name)
+        # add, а не set: версию, которую положил bump_catalog_version
+        # после коммита, не затираем прочитанной до него
+        cache.add(key, version, CATALOG_VERSION_TIMEOUT)
+    return version
+
+
+def bump_catalog_version(name):
+    """
+    Вызывается в транзакции записи в справочник. Общий кеш получает
+    новую версию после коммита; если процесс упадет раньше, старая
+    доживет не дольше CATALOG_VERSION_TIMEOUT
+    """
+    versions = CatalogVersion.objects.filter(name=name)
+    if not versions.update(version=F('version') + 1):
+        CatalogVersion.objects.get_or_create(name=name)
+        versions.update(version=F('version') + 1)
+    transaction.on_commit(lambda: cache.set(
+        catalog_version_key(name), read_catalog_version(name),
+        CATALOG_VERSION_TIMEOUT))
+
+
+def user_me_key(user_id):
+    """Ключ готового ответа /api/users/me/ (см. api.signals)"""
+    return f'users:me:{user_id}'
@@ -0,0 +1,78 @@
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from drf_extra_fields.fields import Base64ImageField
+from PIL import Image
+from rest_framework import serializers
+
+
+class ImageVariantsField(serializers.ReadOnlyField):
+    """
+    Ссылки на уменьшенные копии картинки рецепта:
+    {"thumbnail": {"webp": url, "jpeg": url}, "card": {...}}.
+    Пока копии не построены или устарели, отдает пустой словарь -
+    фронтенд показывает исходную image
+    """
+    def __init__(self, **kwargs):
+        kwargs['source'] = '*'
+        super().__init__(**kwargs)
+
+    def to_representation(self, recipe):
+        variants = recipe.image_variants
+        if not variants or variants.get('source') != recipe.image.name:
+            return {}
+        request = self.context.get('request')
+        result = {}
+        for variant, formats in variants.items():
+            if variant == 'source':
+                continue
+            result[variant] = {}
+            for fmt, name in formats.items():
+                url = default_storage.url(name)
+                if request is not None:
+                    url = request.build_absolute_uri(url)
+                result[variant][fmt] = url
+        return result
+
+
+class HeaderCheckedImageField(serializers.ImageField):
+    """
+    ImageField, который проверяет только заголовок картинки: формат
+    и размеры. Стандартный verify() читает и разбирает файл целиком
+    """
+    FORMATS = {'JPEG': 'jpg', 'PNG': 'png', 'GIF': 'gif'}
+
+    def to_internal_value(self, data):
+        file_object = serializers.FileField.to_internal_value(self, data)
+        try:
+            image = Image.open(file_object)
+        except (OSError, Image.DecompressionBombError):
+            self.fail('invalid_image')
+        finally:
+            file_object.seek(0)
+        if (image.format not in self.FORMATS
+                or image.width * image.height > Image.MAX_IMAGE_PIXELS):
+            self.fail('invalid_image')
+        file_object.name = f'{uuid4()}.{self.FORMATS[image.format]}'
+        file_object.content_type = Image.MIME[image.format]
+        return file_object
+
+
+class RecipeImageField(Base64ImageField, HeaderCheckedImageField):
+    """
+    Картинка рецепта: строка base64 в JSON, как раньше, или файл
+    из multipart/form-data, который уже лежит во временном файле
+    (api.uploads). Размер ограничен IMAGE_UPLOAD_MAX_SIZE
+    """
+    default_error_messages = {
+        'too_large': 'Файл больше допустимого размера',
+    }
+
+    def to_internal_value(self, data):
+        if not isinstance(data, str):
+            return HeaderCheckedImageField.to_internal_value(self, data)
+        # base64 длиннее файла на треть, большой отклоняем до декодирования
+        if len(data) * 3 // 4 > settings.IMAGE_UPLOAD_MAX_SIZE:
+            self.fail('too_large')
+        return super().to_internal_value(data)
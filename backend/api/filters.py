@@ -1,5 +1,7 @@
+from django.db.models import Exists, OuterRef
 from rest_framework import filters
 from rest_framework.filters import SearchFilter
+from recipes.models import FollowOnRecipe, Recipe, ShopList, Tag
 
 
 class IsFavoritedFilter(filters.BaseFilterBackend):
@@ -14,8 +16,9 @@ class IsFavoritedFilter(filters.BaseFilterBackend):
             return queryset
 
         if user.is_authenticated:
-            return queryset.filter(followers__user=user)
-        return None
+            return queryset.filter(Exists(FollowOnRecipe.objects.filter(
+                user=user, recipe=OuterRef('pk'))))
+        return queryset.none()
 
 
 class IsInShoppingCartFilter(filters.BaseFilterBackend):
@@ -30,8 +33,9 @@ class IsInShoppingCartFilter(filters.BaseFilterBackend):
             return queryset
 
         if user.is_authenticated:
-            return queryset.filter(users_shoplist__user=user)
-        return None
+            return queryset.filter(Exists(ShopList.objects.filter(
+                user=user, recipe=OuterRef('pk'))))
+        return queryset.none()
 
 
 class AuthorIdFilter(filters.BaseFilterBackend):
@@ -48,13 +52,21 @@ class AuthorIdFilter(filters.BaseFilterBackend):
 
 class TagsSlugFilter(filters.BaseFilterBackend):
     """
-    Фильтрация по имени тега
+    Фильтрация по имени тега. EXISTS вместо JOIN, поэтому
+    DISTINCT по всей строке рецепта не нужен. Slug переводятся в id
+    одним запросом на запрос к API, подзапрос идет только по таблице
+    связей recipe_id, tag_id без join с тегами
     """
     def filter_queryset(self, request, queryset, view):
         tags = request.query_params.getlist('tags')
-        if tags:
-            return queryset.filter(tags__slug__in=tags).distinct()
-        return queryset
+        if not tags:
+            return queryset
+        tag_ids = list(Tag.objects.filter(slug__in=tags).order_by(
+        ).values_list('id', flat=True))
+        if not tag_ids:
+            return queryset.none()
+        return queryset.filter(Exists(Recipe.tags.through.objects.filter(
+            recipe=OuterRef('pk'), tag_id__in=tag_ids)))
 
 
 class IngredientSearchFilter(SearchFilter):
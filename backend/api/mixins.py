@@ -0,0 +1,108 @@
+import hashlib
+
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.http import parse_etags
+from rest_framework import status
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.renderers import JSONRenderer
+
+from api.cache import get_catalog_version
+from recipes.shopping import current_version, shopping_list
+
+
+class CatalogCacheMixin:
+    """
+    Условный GET для справочников. ETag строится из версии справочника
+    catalog_version (api.cache: в базе, ее поднимают сигналы в
+    транзакции записи, читается из общего кеша) и адреса запроса.
+    Совпавший If-None-Match получает 304 без запросов к базе,
+    остальные — заранее отрендеренный JSON этой версии
+    """
+    catalog_version = None
+    catalog_cache_timeout = 60 * 60 * 24
+
+    def perform_authentication(self, request):
+        # Чтение справочников не зависит от пользователя: не ходим
+        # в базу за токеном, пока request.user не понадобится
+        if request.method not in SAFE_METHODS:
+            super().perform_authentication(request)
+
+    def list(self, request, *args, **kwargs):
+        return self.catalog_response(
+            request, lambda: super(CatalogCacheMixin, self).list(
+                request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.catalog_response(
+            request, lambda: super(CatalogCacheMixin, self).retrieve(
+                request, *args, **kwargs))
+
+    @classmethod
+    def catalog_etag(cls, request):
+        version = get_catalog_version(cls.catalog_version)
+        path = hashlib.md5(request.get_full_path().encode()).hexdigest()
+        return f'"{cls.catalog_version}-{version}-{path}"'
+
+    @classmethod
+    def cached_catalog_response(cls, request, etag):
+        """
+        304 или готовый JSON без чтения справочника; None, если ответа
+        этой версии еще нет в кеше. Годится и для api.async_views
+        """
+        headers = {'ETag': etag, 'Cache-Control': 'no-cache'}
+        if_none_match = request.headers.get('If-None-Match')
+        if if_none_match:
+            etags = parse_etags(if_none_match)
+            if etag in etags or '*' in etags:
+                return HttpResponse(status=status.HTTP_304_NOT_MODIFIED,
+                                    headers=headers)
+        body = cache.get(f'catalog:{etag}')
+        if body is None:
+            return None
+        return cls.catalog_body_response(body, etag)
+
+    @staticmethod
+    def catalog_body_response(body, etag):
+        return HttpResponse(body, content_type='application/json',
+                            headers={'ETag': etag,
+                                     'Cache-Control': 'no-cache'})
+
+    def catalog_response(self, request, render):
+        if request.accepted_renderer.format != 'json':
+            return render()
+
+        etag = self.catalog_etag(request)
+        cached = self.cached_catalog_response(request, etag)
+        if cached is not None:
+            return cached
+        response = render()
+        if response.status_code != status.HTTP_200_OK:
+            return response
+        body = JSONRenderer().render(response.data)
+        cache.set(f'catalog:{etag}', body, self.catalog_cache_timeout)
+        return self.catalog_body_response(body, etag)
+
+
+class ShoppingListMixin:
+    """
+    Условный GET для списка покупок. ETag строится из версии списка
+    у пользователя (ее поднимает любая его правка) и формата ответа,
+    так что неизменившийся список отдается 304 без запроса к строкам
+    """
+    def shopping_list_response(self, request, fmt, render):
+        user = request.user
+        etag = f'"shopping-list-{user.pk}-{current_version(user)}-{fmt}"'
+        headers = {'ETag': etag, 'Cache-Control': 'private, no-cache'}
+
+        if_none_match = request.headers.get('If-None-Match')
+        if if_none_match:
+            etags = parse_etags(if_none_match)
+            if etag in etags or '*' in etags:
+                return HttpResponse(status=status.HTTP_304_NOT_MODIFIED,
+                                    headers=headers)
+
+        response = render(shopping_list(user))
+        for header, value in headers.items():
+            response[header] = value
+        return response
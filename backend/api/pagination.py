@@ -1,5 +1,188 @@
-from rest_framework.pagination import PageNumberPagination
+import hashlib
+from datetime import datetime
+
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Exists, QuerySet, Value
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import (Cursor, CursorPagination,
+                                       PageNumberPagination)
+from rest_framework.response import Response
+
+from api.cache import get_version, model_counts, user_counts
+
+
+class CachedCountPaginator(Paginator):
+    """
+    Paginator, который берет count из кеша. Ключ — SQL запроса
+    без пагинации, то есть нормализованный набор фильтров, плюс
+    поколения данных из api.signals: модели списка и, если задан
+    user_id, избранного, корзины и подписок этого пользователя.
+    Для больших таблиц без фильтров count берется из оценки
+    планировщика Postgres
+    """
+    count_cache_timeout = 30
+    estimate_threshold = 100_000
+
+    def __init__(self, *args, user_id=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.user_id = user_id
+
+    def generations(self, queryset):
+        names = [model_counts(queryset.model)]
+        if self.user_id is not None:
+            names.append(user_counts(self.user_id))
+        return ':'.join(str(get_version(name)) for name in names)
+
+    @cached_property
+    def count(self):
+        if not isinstance(self.object_list, QuerySet):
+            return super().count
+        queryset = self.count_queryset(self.object_list)
+        estimate = self.estimate(queryset)
+        if estimate is not None:
+            return estimate
+
+        sql, params = queryset.query.sql_with_params()
+        digest = hashlib.md5(f'{sql}{params!r}'.encode()).hexdigest()
+        key = f'count:{self.generations(queryset)}:{digest}'
+        count = cache.get(key)
+        if count is None:
+            count = queryset.count()
+            cache.set(key, count, self.count_cache_timeout)
+        return count
+
+    @staticmethod
+    def count_queryset(queryset):
+        """
+        Убирает сортировку и флаги-аннотации (Exists, Value): на число
+        строк они не влияют, а COUNT с ними считается через подзапрос
+        """
+        queryset = queryset.order_by()
+        query = queryset.query
+        query.annotations = {
+            alias: annotation
+            for alias, annotation in query.annotations.items()
+            if not isinstance(annotation, (Exists, Value))
+        }
+        if query.annotation_select_mask is not None:
+            query.set_annotation_mask(
+                query.annotation_select_mask & set(query.annotations))
+        return queryset
+
+    def estimate(self, queryset):
+        query = queryset.query
+        connection = connections[queryset.db]
+        if (connection.vendor != 'postgresql' or query.where
+                or query.annotations or query.distinct):
+            return None
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT reltuples FROM pg_class WHERE relname = %s',
+                (queryset.model._meta.db_table,))
+            row = cursor.fetchone()
+        if row is None or row[0] < self.estimate_threshold:
+            return None
+        return int(row[0])
 
 
 class CustomPageSizePagination(PageNumberPagination):
     page_size_query_param = 'limit'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        # Фильтры is_favorited, is_in_shopping_cart и подписки зависят
+        # от пользователя, его count живет в его поколении
+        self.user_id = request.user.pk
+        return super().paginate_queryset(queryset, request, view)
+
+    def django_paginator_class(self, queryset, page_size):
+        return CachedCountPaginator(queryset, page_size,
+                                    user_id=self.user_id)
+
+
+class KeysetPagination(CursorPagination):
+    """
+    Курсорная пагинация без COUNT(*) и OFFSET. Порядок берется
+    из атрибута cursor_ordering вьюсета
+    """
+    page_size = 6
+    page_size_query_param = 'limit'
+    ordering = ('-pub_date', '-id')
+
+    def get_ordering(self, request, queryset, view):
+        return getattr(view, 'cursor_ordering', self.ordering)
+
+    def decode_cursor(self, request):
+        # Пустой ?cursor= — первая страница в курсорном режиме
+        if not request.query_params.get(self.cursor_query_param):
+            return None
+        return super().decode_cursor(request)
+
+
+class FeedPagination(KeysetPagination):
+    """
+    Курсор ленты подписок (recipes.feed.read): pub_date и id
+    последнего рецепта страницы в формате курсоров KeysetPagination
+    """
+    max_page_size = 50
+
+    def paginate_feed(self, request, read):
+        """read(position, limit) -> [(pub_date, id), ...]"""
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        position = None
+        cursor = self.decode_cursor(request)
+        if cursor is not None and cursor.position:
+            try:
+                pub_date, pk = cursor.position.rsplit('|', 1)
+                position = (datetime.fromisoformat(pub_date), int(pk))
+            except ValueError:
+                raise NotFound(self.invalid_cursor_message)
+        rows = read(position, self.page_size)
+        self.next_position = None
+        if len(rows) == self.page_size:
+            pub_date, pk = rows[-1]
+            self.next_position = f'{pub_date.isoformat()}|{pk}'
+        return rows
+
+    def get_next_link(self):
+        if self.next_position is None:
+            return None
+        return self.encode_cursor(
+            Cursor(offset=0, reverse=False, position=self.next_position))
+
+    def get_paginated_response(self, data):
+        return Response({'next': self.get_next_link(), 'results': data})
+
+
+class CursorOrPageSizePagination(CustomPageSizePagination):
+    """
+    По умолчанию page/limit, как ждет фронтенд. Если в запросе есть
+    параметр cursor, включается KeysetPagination
+    """
+    cursor_pagination_class = KeysetPagination
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = None
+        cursor_param = self.cursor_pagination_class.cursor_query_param
+        if cursor_param in request.query_params:
+            self.keyset = self.cursor_pagination_class()
+            return self.keyset.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+    def get_paginated_response_schema(self, schema):
+        if self.keyset:
+            return self.keyset.get_paginated_response_schema(schema)
+        return super().get_paginated_response_schema(schema)
+
+    def to_html(self):
+        if self.keyset:
+            return self.keyset.to_html()
+        return super().to_html()
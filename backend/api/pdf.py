@@ -0,0 +1,106 @@
+import os
+
+from django.conf import settings
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.utils import simpleSplit
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+
+FONT = 'DejaVuSans'
+FONT_PATH = os.path.join(settings.BASE_DIR, 'DejaVuSans.ttf')
+
+
+def register_fonts():
+    """
+    Разбор TTF занимает больше времени, чем сама верстка списка,
+    поэтому шрифт регистрируется один раз на процесс (ApiConfig.ready)
+    """
+    if FONT not in pdfmetrics.getRegisteredFontNames():
+        pdfmetrics.registerFont(TTFont(FONT, FONT_PATH))
+
+
+class ShoppingListLayout:
+    """
+    Верстка списка покупок на A4: заголовок и номер страницы на каждой
+    странице, строки в две колонки, длинные названия переносятся
+    в пределах колонки, одна позиция не разрывается между колонками
+    """
+    margin = 40
+    columns = 2
+    gutter = 20
+    title_size = 16
+    font_size = 11
+    leading = 15
+    item_gap = 4
+
+    def __init__(self, file, title):
+        register_fonts()
+        self.title = title
+        self.width, self.height = A4
+        self.column_width = (
+            self.width - 2 * self.margin
+            - self.gutter * (self.columns - 1)) / self.columns
+        self.pdf = canvas.Canvas(file, pagesize=A4)
+        self.pdf.setTitle(title)
+        self.pages = 0
+        self.start_page()
+
+    def start_page(self):
+        if self.pages:
+            self.pdf.showPage()
+        self.pages += 1
+        top = self.height - self.margin
+        self.pdf.setFont(FONT, self.title_size)
+        self.pdf.drawString(self.margin, top - self.title_size, self.title)
+        self.pdf.setFont(FONT, self.font_size - 2)
+        self.pdf.drawRightString(self.width - self.margin,
+                                 top - self.title_size,
+                                 f'стр. {self.pages}')
+        line_y = top - self.title_size - 8
+        self.pdf.line(self.margin, line_y, self.width - self.margin, line_y)
+        self.pdf.setFont(FONT, self.font_size)
+        self.column = 0
+        self.top = line_y - self.leading
+        self.y = self.top
+
+    def next_column(self):
+        self.column += 1
+        if self.column == self.columns:
+            self.start_page()
+        else:
+            self.y = self.top
+
+    def add_item(self, text):
+        lines = simpleSplit(text, FONT, self.font_size,
+                            self.column_width - 10)
+        if self.y - self.leading * (len(lines) - 1) < self.margin:
+            self.next_column()
+        x = self.margin + self.column * (self.column_width + self.gutter)
+        self.pdf.drawString(x, self.y, '•')
+        for line in lines:
+            self.pdf.drawString(x + 10, self.y, line)
+            self.y -= self.leading
+        self.y -= self.item_gap
+
+    def save(self):
+        self.pdf.save()
+        return self.pages
+
+
+def shopping_list_title(user):
+    return f'Список покупок. Автор {user.first_name} {user.last_name}'
+
+
+def render_shopping_list(file, title, items):
+    """
+    Пишет PDF в file (например, в HttpResponse) и возвращает число
+    страниц. items - словари ingredient__name,
+    ingredient__measurement_unit и count
+    """
+    layout = ShoppingListLayout(file, title)
+    for item in items:
+        layout.add_item(
+            f'{item["ingredient__name"].capitalize()} - {item["count"]} '
+            f'{item["ingredient__measurement_unit"]}')
+    return layout.save()
@@ -0,0 +1,36 @@
+import csv
+import io
+
+from rest_framework.renderers import BaseRenderer
+
+
+class ShoppingListTextRenderer(BaseRenderer):
+    """Список покупок текстом: одна строка на ингредиент"""
+    media_type = 'text/plain'
+    format = 'txt'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if not isinstance(data, list):
+            return str(data).encode(self.charset)
+        return ''.join(
+            f'{item["name"].capitalize()} - {item["amount"]} '
+            f'{item["measurement_unit"]}\n'
+            for item in data
+        ).encode(self.charset)
+
+
+class ShoppingListCSVRenderer(BaseRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+    charset = 'utf-8'
+    header = ('name', 'measurement_unit', 'amount')
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if not isinstance(data, list):
+            return str(data).encode(self.charset)
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=self.header)
+        writer.writeheader()
+        writer.writerows(data)
+        return buffer.getvalue().encode(self.charset)
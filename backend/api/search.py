@@ -0,0 +1,90 @@
+import threading
+from bisect import bisect_left
+
+from recipes.models import Ingredient
+
+from api.cache import get_catalog_version
+
+
+def search_terms(query):
+    """Слова запроса так же, как их делит SearchFilter в DRF"""
+    return query.replace('\x00', '').replace(',', ' ').split()
+
+
+def normalize(text):
+    """Ключ поиска: без регистра, ё = е, одиночные пробелы"""
+    return ' '.join(text.casefold().replace('ё', 'е').split())
+
+
+class IngredientIndex:
+    """
+    Индекс ингредиентов в памяти воркера для автодополнения.
+    Строится лениво из Ingredient и перестраивается, когда меняется
+    версия 'ingredients' (api.cache, см. api.signals). Версия читается
+    при каждом поиске: поиск идет только на промахе кеша ответов,
+    а ответ не должен быть старше ETag, под которым его закешируют
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.version = None
+        # (ключи, строки) меняются одним присваиванием: поток, который
+        # сейчас ищет, не сложит новые ключи со старыми строками
+        self.index = ([], [])
+
+    def refresh(self):
+        version = get_catalog_version('ingredients')
+        if version == self.version:
+            return
+        with self.lock:
+            if version == self.version:
+                return
+            entries = sorted(
+                (normalize(name), pk, {
+                    'id': pk,
+                    'name': name,
+                    'measurement_unit': measurement_unit,
+                })
+                for pk, name, measurement_unit
+                in Ingredient.objects.values_list(
+                    'id', 'name', 'measurement_unit')
+            )
+            self.index = ([key for key, _, _ in entries],
+                          [row for _, _, row in entries])
+            self.version = version
+
+    @staticmethod
+    def prefix_range(keys, prefix):
+        start = end = bisect_left(keys, prefix)
+        while end < len(keys) and keys[end].startswith(prefix):
+            end += 1
+        return range(start, end)
+
+    def search(self, query):
+        """
+        Сначала совпадения с начала названия: каждое слово запроса -
+        начало названия, как у search_fields = ('^name',) в DRF, или
+        весь запрос - начало названия. Затем названия, где слова
+        запроса встречаются внутри. Внутри групп - по id.
+        Сравнение без учета регистра, ё = е, пробелы схлопываются
+        """
+        self.refresh()
+        keys, rows = self.index
+        terms = [normalize(term) for term in search_terms(query)]
+        if not terms:
+            return sorted(rows, key=lambda row: row['id'])
+        longest = max(terms, key=len)
+        prefix = {
+            position for position in self.prefix_range(keys, longest)
+            if all(keys[position].startswith(term) for term in terms)
+        }
+        prefix.update(self.prefix_range(keys, ' '.join(terms)))
+        substring = [
+            row for position, (key, row) in enumerate(zip(keys, rows))
+            if position not in prefix and all(term in key for term in terms)
+        ]
+        return (sorted((rows[position] for position in prefix),
+                       key=lambda row: row['id'])
+                + sorted(substring, key=lambda row: row['id']))
+
+
+ingredient_index = IngredientIndex()
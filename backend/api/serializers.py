@@ -1,8 +1,15 @@
+import json
+
+from django.db import transaction
+from django.db.models import Prefetch, prefetch_related_objects
+from django.http import Http404, QueryDict
 from django.shortcuts import get_object_or_404
 from drf_extra_fields.fields import Base64ImageField
 from rest_framework import serializers
-from recipes.models import (FollowOnRecipe, Ingredient, IngredientAmount,
-                            Recipe, ShopList, Tag)
+from api.fields import ImageVariantsField, RecipeImageField
+from recipes.models import (ExportJob, FollowOnRecipe, Ingredient,
+                            IngredientAmount, Recipe, ShopList, Tag)
+from recipes.shopping import apply_delta, cart_users
 from users.serializers import CustomUserSerializer
 
 
@@ -43,14 +50,23 @@ class RecipeReadSerializer(serializers.ModelSerializer):
     is_in_shopping_cart = serializers.SerializerMethodField(
         method_name='get_is_in_shopping_cart'
     )
+    image_variants = ImageVariantsField()
 
     class Meta:
         model = Recipe
         fields = ('id', 'tags', 'author', 'ingredients',
                   'is_favorited', 'is_in_shopping_cart',
-                  'name', 'image', 'text', 'cooking_time')
+                  'name', 'image', 'image_variants', 'text', 'cooking_time')
+
+    def to_representation(self, instance):
+        # Флаг подписки на автора уже посчитан в RecipeQuerySet
+        if hasattr(instance, 'is_author_subscribed'):
+            instance.author.is_subscribed = instance.is_author_subscribed
+        return super().to_representation(instance)
 
     def get_is_favorited(self, obj):
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         user = self.context['request'].user
         if user.is_authenticated:
             return FollowOnRecipe.objects.filter(
@@ -58,6 +74,8 @@ class RecipeReadSerializer(serializers.ModelSerializer):
         return False
 
     def get_is_in_shopping_cart(self, obj):
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         user = self.context['request'].user
         if user.is_authenticated:
             return ShopList.objects.filter(recipe=obj, user=user).exists()
@@ -81,76 +99,131 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
         read_only=True,
         source='ingredient_amounts')
     tags = TagSerializer(many=True, read_only=True)
-    image = Base64ImageField(max_length=None, use_url=True)
+    image = RecipeImageField(max_length=None, use_url=True)
 
     class Meta:
         model = Recipe
         fields = ('ingredients', 'tags', 'image',
                   'name', 'text', 'cooking_time')
 
+    def initial_list(self, name):
+        """
+        Список из запроса. В multipart/form-data ingredients приходят
+        JSON-строкой '[{"id": 1, "amount": 2}]', tags - JSON-строкой
+        или повторяющимся полем tags=1&tags=2
+        """
+        if not isinstance(self.initial_data, QueryDict):
+            return self.initial_data.get(name)
+        values = self.initial_data.getlist(name)
+        if len(values) != 1:
+            return values
+        try:
+            value = json.loads(values[0])
+        except ValueError:
+            raise serializers.ValidationError(
+                {name: 'Ожидается JSON-список'})
+        return value if isinstance(value, list) else values
+
     def validate(self, data):
-        ingredients_data = self.initial_data.get('ingredients')
+        ingredients_data = self.initial_list('ingredients')
         if not ingredients_data:
             raise serializers.ValidationError('Добавьте минимум 1 ингредиент')
 
-        ingredients_unique_list = []
+        ingredients = {}
         for ingredient in ingredients_data:
-            if int(ingredient['amount']) < 1:
+            amount = int(ingredient['amount'])
+            if amount < 1:
                 raise serializers.ValidationError(
                     'Укажите значение "amount" больше 0'
                 )
-            ingredient_to_check = get_object_or_404(Ingredient,
-                                                    id=ingredient['id']
-                                                    )
-            if ingredient_to_check in ingredients_unique_list:
+            ingredient_id = int(ingredient['id'])
+            if ingredient_id in ingredients:
                 raise serializers.ValidationError(
                     'Несколько одинаковых ингредиентов. Не повторяйтесь')
-            ingredients_unique_list.append(ingredient_to_check)
+            ingredients[ingredient_id] = amount
 
-        data['ingredients'] = ingredients_data
+        found = Ingredient.objects.filter(
+            id__in=ingredients).count()
+        if found != len(ingredients):
+            raise Http404('Ингредиент не найден')
+
+        data['ingredients'] = ingredients
 
         return data
 
+    @transaction.atomic
     def create(self, validated_data):
         author = self.context['request'].user
         image = validated_data.pop('image')
-        ingredients_data = validated_data.pop('ingredients')
+        ingredients = validated_data.pop('ingredients')
 
         recipe = Recipe.objects.create(author=author,
                                        image=image,
                                        **validated_data)
-        tags = self.initial_data.get('tags')
+        tags = self.initial_list('tags')
         recipe.tags.set(tags)
 
-        for ingredient in ingredients_data:
-            id = ingredient.get('id')
-            amount = int(ingredient.get('amount'))
-            IngredientAmount.objects.create(
-                ingredient_id=id,
-                recipe=recipe,
-                amount=amount
-            )
+        IngredientAmount.objects.bulk_create(
+            IngredientAmount(recipe=recipe, ingredient_id=ingredient_id,
+                             amount=amount)
+            for ingredient_id, amount in ingredients.items()
+        )
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
-        instance.ingredients.clear()
-        instance.tags.clear()
-
-        ingredients_data = validated_data.pop('ingredients')
-        tags = self.initial_data.get('tags')
-        for tag in tags:
-            instance.tags.add(tag)
-
-        for ingredient in ingredients_data:
-            ingredient_id = ingredient.get('id')
-            ingredient_amount = ingredient.get('amount')
-            IngredientAmount.objects.create(
-                recipe=instance,
-                ingredient_id=ingredient_id,
-                amount=ingredient_amount
-            )
+        ingredients = validated_data.pop('ingredients')
+        tags = self.initial_list('tags')
+        # set() сам удаляет лишние теги и добавляет недостающие
+        instance.tags.set(tags)
+
+        current = {
+            ingredient_amount.ingredient_id: ingredient_amount
+            for ingredient_amount in instance.ingredient_amounts.all()
+        }
+        # Сдвиг сумм в списках покупок тех, у кого рецепт в корзине
+        deltas = {
+            ingredient_id: -ingredient_amount.amount
+            for ingredient_id, ingredient_amount in current.items()
+        }
+        for ingredient_id, amount in ingredients.items():
+            deltas[ingredient_id] = deltas.get(ingredient_id, 0) + amount
+        changed = []
+        for ingredient_id, amount in ingredients.items():
+            ingredient_amount = current.get(ingredient_id)
+            if ingredient_amount and ingredient_amount.amount != amount:
+                ingredient_amount.amount = amount
+                changed.append(ingredient_amount)
+
+        removed = current.keys() - ingredients.keys()
+        if removed:
+            # Без сигналов: суммы в списках покупок сдвигаются ниже
+            removed_amounts = instance.ingredient_amounts.filter(
+                ingredient_id__in=removed)
+            removed_amounts._raw_delete(removed_amounts.db)
+        if changed:
+            IngredientAmount.objects.bulk_update(changed, ('amount',))
+        IngredientAmount.objects.bulk_create(
+            IngredientAmount(recipe=instance, ingredient_id=ingredient_id,
+                             amount=amount)
+            for ingredient_id, amount in ingredients.items()
+            if ingredient_id not in current
+        )
+        if any(deltas.values()):
+            apply_delta(cart_users(instance.pk), deltas)
         return super().update(instance, validated_data)
 
+    def to_representation(self, instance):
+        # Ответ читает ингредиенты и теги одним запросом на связь
+        prefetch_related_objects(
+            [instance],
+            Prefetch('ingredient_amounts',
+                     queryset=IngredientAmount.objects.select_related(
+                         'ingredient')),
+            'tags',
+        )
+        return super().to_representation(instance)
+
 
 class ShopListCreateSerializer(serializers.ModelSerializer):
     image = Base64ImageField()
@@ -190,7 +263,43 @@ class ShopListCreateSerializer(serializers.ModelSerializer):
 
 
 class RecipeFavoriteSerializer(serializers.ModelSerializer):
+    image_variants = ImageVariantsField()
 
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'image_variants', 'cooking_time')
+
+
+class ExportJobSerializer(serializers.ModelSerializer):
+    url = serializers.HyperlinkedIdentityField(
+        view_name='api:shopping_cart_export')
+
+    class Meta:
+        model = ExportJob
+        fields = ('id', 'url', 'status', 'error', 'created', 'finished')
+
+
+class RecipeIdsSerializer(serializers.Serializer):
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=100,
+    )
+
+
+class BatchSerializer(serializers.Serializer):
+    requests = serializers.ListField(
+        child=serializers.CharField(),
+        allow_empty=False,
+    )
+
+    def validate_requests(self, value):
+        max_requests = self.context['max_requests']
+        if len(value) > max_requests:
+            raise serializers.ValidationError(
+                f'Не больше {max_requests} запросов за раз')
+        for url in value:
+            if not url.startswith('/api/'):
+                raise serializers.ValidationError(
+                    f'{url}: нужен относительный адрес, начинающийся с /api/')
+        return value
@@ -0,0 +1,100 @@
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from recipes.models import (FollowOnRecipe, FollowOnUser, Ingredient, Recipe,
+                            ShopList, Tag)
+from rest_framework.authtoken.models import Token
+from users.models import User
+
+from api.authentication import token_cache
+from api.cache import (bump_catalog_version, bump_version, model_counts,
+                       user_counts, user_me_key)
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=Recipe)
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=User)
+def bump_counts_version(sender, **kwargs):
+    """
+    Запись в рецепты, теги или пользователей сбрасывает закешированные
+    count у пагинатора списков рецептов или пользователей
+    """
+    model = User if sender is User else Recipe
+    bump_version(model_counts(model))
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def bump_counts_version_on_tags(sender, action, **kwargs):
+    if action.startswith('post_'):
+        bump_version(model_counts(Recipe))
+
+
+@receiver(post_save, sender=FollowOnRecipe)
+@receiver(post_save, sender=ShopList)
+@receiver(post_save, sender=FollowOnUser)
+@receiver(post_delete, sender=FollowOnRecipe)
+@receiver(post_delete, sender=ShopList)
+@receiver(post_delete, sender=FollowOnUser)
+def bump_user_counts_version(sender, instance, **kwargs):
+    """
+    Избранное, корзина и подписки меняют count только у списков
+    самого пользователя (is_favorited, is_in_shopping_cart,
+    subscriptions), остальные кешированные count остаются
+    """
+    bump_version(user_counts(instance.user_id))
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def bump_tags_version(sender, **kwargs):
+    bump_catalog_version('tags')
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def bump_ingredients_version(sender, **kwargs):
+    """Перестроить api.search.ingredient_index во всех воркерах"""
+    bump_catalog_version('ingredients')
+
+
+def drop_cached_me(user_id):
+    """
+    Ответ /users/me/ удаляется сразу и еще раз после коммита: иначе
+    параллельный запрос успел бы закешировать профиль до записи
+    """
+    key = user_me_key(user_id)
+    cache.delete(key)
+    transaction.on_commit(lambda: cache.delete(key))
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def drop_user_me(sender, instance, **kwargs):
+    """
+    Профиль, пароль, роль, is_active: /users/me/ соберется заново,
+    а токены пользователя пройдут проверку в базе
+    """
+    drop_cached_me(instance.pk)
+    keys = ()
+    if token_cache.shared is not None:
+        keys = Token.objects.filter(user=instance).values_list(
+            'key', flat=True)
+    token_cache.evict(keys, user_id=instance.pk)
+
+
+@receiver(post_delete, sender=Token)
+def drop_token(sender, instance, **kwargs):
+    """Выход (auth/token/logout) удаляет токен"""
+    token_cache.evict((instance.key,))
+
+
+@receiver(post_save, sender=FollowOnUser)
+@receiver(post_delete, sender=FollowOnUser)
+def drop_user_me_on_follow(sender, instance, **kwargs):
+    # is_subscribed в /users/me/ - подписка пользователя на самого себя
+    if instance.user_id == instance.author_id:
+        drop_cached_me(instance.user_id)
@@ -0,0 +1,35 @@
+from django.conf import settings
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+
+class UploadTooLarge(APIException):
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_detail = 'Файл больше допустимого размера'
+    default_code = 'upload_too_large'
+
+    def __init__(self):
+        limit = settings.IMAGE_UPLOAD_MAX_SIZE // (1024 * 1024)
+        super().__init__(f'{self.default_detail} ({limit} МБ)')
+
+
+class LimitedTemporaryFileUploadHandler(TemporaryFileUploadHandler):
+    """
+    Пишет файлы multipart-запроса кусками сразу во временный файл,
+    в памяти держится только текущий кусок. Загрузка обрывается,
+    как только файл перерос IMAGE_UPLOAD_MAX_SIZE, не дочитывая тело
+    """
+    def handle_raw_input(self, input_data, META, content_length, boundary,
+                         encoding=None):
+        # Заведомо большое тело отклоняем до чтения
+        limit = (settings.IMAGE_UPLOAD_MAX_SIZE
+                 + settings.DATA_UPLOAD_MAX_MEMORY_SIZE)
+        if content_length > limit:
+            raise UploadTooLarge()
+
+    def receive_data_chunk(self, raw_data, start):
+        if start + len(raw_data) > settings.IMAGE_UPLOAD_MAX_SIZE:
+            self.file.close()
+            raise UploadTooLarge()
+        return super().receive_data_chunk(raw_data, start)
@@ -1,7 +1,8 @@
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
-from api.views import (IngredientViewSet, RecipeViewSet, TagsViewSet,
-                       DownloadShopGetView)
+from api.views import (BatchView, ExportJobView, FeedView,
+                       IngredientViewSet, RecipeViewSet, ShoppingListView,
+                       TagsViewSet, DownloadShopGetView)
 
 app_name = 'api'
 
@@ -14,6 +15,12 @@ router.register(r'recipes', RecipeViewSet, basename='recipes')
 urlpatterns = [
     path('recipes/download_shopping_cart/', DownloadShopGetView.as_view(),
          name='download_shopping_cart'),
+    path('recipes/download_shopping_cart/<int:pk>/', ExportJobView.as_view(),
+         name='shopping_cart_export'),
+    path('recipes/shopping_list/', ShoppingListView.as_view(),
+         name='shopping_list'),
+    path('recipes/feed/', FeedView.as_view(), name='feed'),
+    path('batch/', BatchView.as_view(), name='batch'),
     path('', include(router.urls)),
 
 ]
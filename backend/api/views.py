@@ -1,50 +1,89 @@
+import json
+
+from django.http import FileResponse, HttpRequest, QueryDict
 from django.http.response import HttpResponse
 from django.shortcuts import get_object_or_404
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
-from reportlab.pdfgen import canvas
+from django.urls import Resolver404, resolve
 from rest_framework import status, viewsets
 from rest_framework.decorators import action
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from recipes.models import (FollowOnRecipe, Ingredient, IngredientAmount,
-                            Recipe, ShopList, Tag)
+from recipes import feed
+from recipes.exports import enqueue as enqueue_export
+from recipes.models import (ExportJob, FollowOnRecipe, Ingredient, Recipe,
+                            ShopList, Tag)
+from api.cache import bump_version, user_counts
 from api.filters import (AuthorIdFilter, IsFavoritedFilter,
                          IsInShoppingCartFilter, TagsSlugFilter,
                          IngredientSearchFilter)
-from api.pagination import CustomPageSizePagination
+from api.mixins import CatalogCacheMixin, ShoppingListMixin
+from api.pagination import CursorOrPageSizePagination, FeedPagination
+from api.pdf import render_shopping_list, shopping_list_title
+from api.renderers import (ShoppingListCSVRenderer,
+                           ShoppingListTextRenderer)
 from api.permissions import IsAdminAuthorOrReadPost, IsAdminOrReadOnly
-from api.serializers import (IngredientReadSerializer, RecipeCreateSerializer,
-                             RecipeFavoriteSerializer, RecipeReadSerializer,
+from api.search import ingredient_index
+from api.uploads import LimitedTemporaryFileUploadHandler
+from api.serializers import (BatchSerializer, ExportJobSerializer,
+                             IngredientReadSerializer,
+                             RecipeCreateSerializer, RecipeFavoriteSerializer,
+                             RecipeIdsSerializer, RecipeReadSerializer,
                              TagSerializer)
-from django.db.models import Sum
+from django.db import IntegrityError, transaction
 
 
-class TagsViewSet(viewsets.ModelViewSet):
+class TagsViewSet(CatalogCacheMixin, viewsets.ModelViewSet):
+    catalog_version = 'tags'
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     permission_classes = (IsAdminOrReadOnly,)
     pagination_class = None
 
 
-class IngredientViewSet(viewsets.ModelViewSet):
+class IngredientViewSet(CatalogCacheMixin, viewsets.ModelViewSet):
+    catalog_version = 'ingredients'
     queryset = Ingredient.objects.all()
     serializer_class = IngredientReadSerializer
     permission_classes = (IsAdminOrReadOnly, )
     filter_backends = (IngredientSearchFilter,)
     search_fields = ('^name',)
 
+    def list(self, request, *args, **kwargs):
+        name = request.query_params.get(IngredientSearchFilter.search_param)
+        if not name:
+            return super().list(request, *args, **kwargs)
+        return self.catalog_response(
+            request, lambda: Response(ingredient_index.search(name)))
+
 
 class RecipeViewSet(viewsets.ModelViewSet):
     queryset = Recipe.objects.all()
     permission_classes = (IsAdminAuthorOrReadPost, )
-    pagination_class = CustomPageSizePagination
+    pagination_class = CursorOrPageSizePagination
+    cursor_ordering = ('-pub_date', '-id')
     filter_backends = (IsFavoritedFilter, IsInShoppingCartFilter,
                        AuthorIdFilter, TagsSlugFilter)
     filterset_fields = ('is_favorited', 'is_in_shopping_cart',
                         'author', 'tags')
 
+    def initialize_request(self, request, *args, **kwargs):
+        request = super().initialize_request(request, *args, **kwargs)
+        if self.action in ('create', 'update', 'partial_update'):
+            # Картинка рецепта пишется на диск потоком, с лимитом;
+            # админка и прочие вью остаются с обработчиками Django
+            request._request.upload_handlers = [
+                LimitedTemporaryFileUploadHandler(request._request)]
+        return request
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action in ('retrieve', 'list'):
+            return queryset.with_user_flags(
+                self.request.user).with_related()
+        return queryset
+
     def get_serializer_class(self):
         if self.action in ('retrieve', 'list'):
             return RecipeReadSerializer
@@ -60,43 +99,65 @@ class RecipeViewSet(viewsets.ModelViewSet):
             return Response(status=status.HTTP_204_NO_CONTENT)
         return Response(status=status.HTTP_403_FORBIDDEN)
 
+    def add_recipe_to(self, model, pk, error):
+        """
+        Один INSERT: уникальный индекс сам отсекает повтор,
+        даже если два запроса пришли одновременно
+        """
+        recipe = get_object_or_404(Recipe, id=pk)
+        try:
+            with transaction.atomic():
+                model.objects.create(user=self.request.user, recipe=recipe)
+        except IntegrityError:
+            return Response(error.format(name=recipe.name, pk=pk),
+                            status=status.HTTP_400_BAD_REQUEST)
+        serializer = RecipeFavoriteSerializer(
+            recipe, context={'request': self.request})
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+    def remove_recipe_from(self, model, pk, error):
+        """Один DELETE: что удалять, решает число удаленных строк"""
+        deleted, _ = model.objects.filter(
+            user=self.request.user, recipe_id=pk).delete()
+        if deleted:
+            return Response(status=status.HTTP_204_NO_CONTENT)
+        recipe = get_object_or_404(Recipe, id=pk)
+        return Response(error.format(name=recipe.name, pk=pk),
+                        status=status.HTTP_400_BAD_REQUEST)
+
+    def change_recipes_in(self, model, request):
+        """
+        Массовое добавление (POST) или удаление (DELETE) рецептов
+        из тела {"recipes": [id, ...]}
+        """
+        serializer = RecipeIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        recipe_ids = serializer.validated_data['recipes']
+        if request.method == 'POST':
+            added = model.objects.add_recipes(request.user, recipe_ids)
+            bump_version(user_counts(request.user.pk))
+            return Response({'recipes': added},
+                            status=status.HTTP_201_CREATED)
+        removed = model.objects.remove_recipes(request.user, recipe_ids)
+        if not removed:
+            return Response('Error: Ни одного из рецептов не было в списке',
+                            status=status.HTTP_400_BAD_REQUEST)
+        bump_version(user_counts(request.user.pk))
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
     @action(detail=True, methods=('post', 'delete'),
             permission_classes=(IsAuthenticated, ))
     def favorite(self, request, pk):
         """
         Определили действия для api/recipes/{id}/favorite
         """
-        user = self.request.user
-        recipe = get_object_or_404(Recipe, id=pk)
-        is_already_follow = FollowOnRecipe.objects.filter(user=user,
-                                                          recipe=recipe)
         if request.method == 'POST':
-            if is_already_follow:
-                return Response('Error: Вы уже подписаны на рецепт '
-                                f'{recipe.name} (id - {pk})',
-                                status=status.HTTP_400_BAD_REQUEST)
-            else:
-                FollowOnRecipe.objects.create(user=user, recipe=recipe)
-                serializer = RecipeFavoriteSerializer(
-                    recipe, context={'request': request}
-                )
-                return Response(serializer.data,
-                                status=status.HTTP_201_CREATED
-                                )
-
-        if request.method == 'DELETE':
-            if is_already_follow:
-                following_recipe = get_object_or_404(
-                    FollowOnRecipe,
-                    user=user,
-                    recipe=recipe
-                )
-                following_recipe.delete()
-                return Response(status=status.HTTP_204_NO_CONTENT)
-            else:
-                return Response('Error: Вы не были подписаны на рецепт '
-                                f'{recipe.name} (id - {pk})',
-                                status=status.HTTP_400_BAD_REQUEST)
+            return self.add_recipe_to(
+                FollowOnRecipe, pk,
+                'Error: Вы уже подписаны на рецепт {name} (id - {pk})')
+        return self.remove_recipe_from(
+            FollowOnRecipe, pk,
+            'Error: Вы не были подписаны на рецепт {name} (id - {pk})')
 
     @action(detail=True, methods=('post', 'delete'),
             permission_classes=(IsAuthenticated,))
@@ -104,75 +165,184 @@ class RecipeViewSet(viewsets.ModelViewSet):
         """
         Определили действия при api/recipes/{id}/shopping_cart
         """
-        user = self.request.user
-        recipe = get_object_or_404(Recipe, id=pk)
-        in_shoplist = ShopList.objects.filter(
-            user=user, recipe=recipe).exists()
-
         if request.method == 'POST':
-            if in_shoplist:
-                return Response('Error: Вы уже добавили рецепт '
-                                f'{recipe.name} (id - {pk}) в список покупок',
-                                status=status.HTTP_400_BAD_REQUEST)
-            else:
-                ShopList.objects.create(user=user, recipe=recipe)
-                serializer = RecipeFavoriteSerializer(
-                    recipe, context={'request': request})
-                return Response(serializer.data,
-                                status=status.HTTP_201_CREATED)
-
-        if request.method == 'DELETE':
-            if in_shoplist:
-                ShopList.objects.filter(user=user, recipe=recipe).delete()
-                return Response(status=status.HTTP_204_NO_CONTENT)
-            else:
-                return Response(f'Error: Рецепта {recipe.name} (id - {pk}) '
-                                'нет в список покупок',
-                                status=status.HTTP_400_BAD_REQUEST)
-
-        return Response(status=status.HTTP_405_METHOD_NOT_ALLOWED)
-
-
-class DownloadShopGetView(APIView):
+            return self.add_recipe_to(
+                ShopList, pk,
+                'Error: Вы уже добавили рецепт {name} (id - {pk}) '
+                'в список покупок')
+        return self.remove_recipe_from(
+            ShopList, pk,
+            'Error: Рецепта {name} (id - {pk}) нет в список покупок')
+
+    @action(detail=False, methods=('post', 'delete'),
+            permission_classes=(IsAuthenticated, ),
+            url_path='favorite', url_name='favorite-bulk')
+    def favorite_bulk(self, request):
+        """
+        Определили действия для api/recipes/favorite
+        """
+        return self.change_recipes_in(FollowOnRecipe, request)
+
+    @action(detail=False, methods=('post', 'delete'),
+            permission_classes=(IsAuthenticated, ),
+            url_path='shopping_cart', url_name='shopping-cart-bulk')
+    def shopping_cart_bulk(self, request):
+        """
+        Определили действия для api/recipes/shopping_cart
+        """
+        return self.change_recipes_in(ShopList, request)
+
+
+class DownloadShopGetView(ShoppingListMixin, APIView):
     def get(self, request):
-        PDF = 'application/pdf'
         user = request.user
         if user.is_anonymous:
             return Response('Вы не авторизованы',
                             status=status.HTTP_401_UNAUTHORIZED)
-        shoplist_to_download = IngredientAmount.objects.filter(
-            recipe__users_shoplist__user=user).values(
-                'ingredient__name', 'ingredient__measurement_unit'
-        ).annotate(count=Sum('amount'))
-
-        file_name = f'Список покупок. Автор {user.first_name} {user.last_name}'
-        doc_title = f'Список покупок. Автор {user.first_name} {user.last_name}'
-        title = (f'Список покупок. Автор {user.first_name} {user.last_name}')
-        response = HttpResponse(content_type=PDF)
-        content_disposition = f'attachment; filename="{file_name}.pdf"'
+        if request.query_params.get('async') in ('1', 'true'):
+            return self.enqueue(request)
+        return self.shopping_list_response(request, 'pdf', self.render_pdf)
+
+    def enqueue(self, request):
+        """
+        ?async=1: вместо рендера в запросе ставит задание воркеру
+        (run_export_worker) и сразу отвечает 202 со ссылкой на статус
+        """
+        job, _ = enqueue_export(request.user)
+        serializer = ExportJobSerializer(job, context={'request': request})
+        return Response(serializer.data, status=status.HTTP_202_ACCEPTED,
+                        headers={'Location': serializer.data['url']})
+
+    def render_pdf(self, items):
+        title = shopping_list_title(self.request.user)
+        response = HttpResponse(content_type='application/pdf')
+        content_disposition = f'attachment; filename="{title}.pdf"'
         response['Content-Disposition'] = content_disposition
-        pdf = canvas.Canvas(response)
-        pdf.setTitle(doc_title)
-        pdfmetrics.registerFont(TTFont('DejaVuSans', 'DejaVuSans.ttf'))
-        pdf.setFont('DejaVuSans', 24)
-        pdf.drawCentredString(300, 770, title)
-        pdf.line(30, 710, 565, 710)
-        string_height = 650
-
-        for item in shoplist_to_download:
-            name = item["ingredient__name"].capitalize()
-            count = item["count"]
-            measurement_unit = item["ingredient__measurement_unit"]
-            pdf.drawString(
-                40,
-                string_height,
-                (f'{name} - '
-                 f'{count} '
-                 f'{measurement_unit}'
-                 )
-            )
-            string_height -= 50
-
-        pdf.showPage()
-        pdf.save()
+        render_shopping_list(response, title, items)
+        return response
+
+
+class ExportJobView(APIView):
+    """
+    api/recipes/download_shopping_cart/{id}/ - статус выгрузки,
+    а когда она готова - сам файл
+    """
+    permission_classes = (IsAuthenticated,)
+
+    def get(self, request, pk):
+        job = get_object_or_404(ExportJob, pk=pk, user=request.user)
+        if job.status == ExportJob.DONE:
+            return FileResponse(
+                job.file.open('rb'), as_attachment=True,
+                filename=f'{shopping_list_title(request.user)}.pdf',
+                content_type='application/pdf')
+        serializer = ExportJobSerializer(job, context={'request': request})
+        code = (status.HTTP_200_OK if job.status == ExportJob.FAILED
+                else status.HTTP_202_ACCEPTED)
+        return Response(serializer.data, status=code)
+
+
+class ShoppingListView(ShoppingListMixin, APIView):
+    """
+    api/recipes/shopping_list/ - список покупок в JSON, тексте или CSV:
+    по заголовку Accept или ?format=json|txt|csv
+    """
+    permission_classes = (IsAuthenticated,)
+    renderer_classes = (JSONRenderer, ShoppingListTextRenderer,
+                        ShoppingListCSVRenderer)
+
+    def get(self, request):
+        response = self.shopping_list_response(
+            request, request.accepted_renderer.format, self.render_items)
+        response['Vary'] = 'Accept, Authorization'
         return response
+
+    def render_items(self, items):
+        return Response([
+            {'name': item['ingredient__name'],
+             'measurement_unit': item['ingredient__measurement_unit'],
+             'amount': item['count']}
+            for item in items
+        ])
+
+
+class FeedView(APIView):
+    """
+    api/recipes/feed/ - рецепты авторов, на которых подписан
+    пользователь, от новых к старым. Страницы по курсору (?cursor=,
+    ?limit=), число запросов не зависит от числа подписок
+    """
+    permission_classes = (IsAuthenticated,)
+    pagination_class = FeedPagination
+
+    def get(self, request):
+        paginator = self.pagination_class()
+        rows = paginator.paginate_feed(
+            request,
+            lambda position, limit: feed.read(request.user, position, limit))
+        recipes = Recipe.objects.with_user_flags(
+            request.user).with_related().in_bulk([pk for _, pk in rows])
+        serializer = RecipeReadSerializer(
+            [recipes[pk] for _, pk in rows if pk in recipes],
+            many=True, context={'request': request})
+        return paginator.get_paginated_response(serializer.data)
+
+
+class BatchView(APIView):
+    """
+    POST api/batch/ {"requests": ["/api/users/me/", "/api/tags/", ...]}
+    Выполняет несколько GET-запросов к API за один HTTP-запрос.
+    Пользователь аутентифицируется один раз и передается во все
+    подзапросы, одинаковые адреса выполняются один раз
+    """
+    max_requests = 10
+
+    def post(self, request):
+        serializer = BatchSerializer(
+            data=request.data, context={'max_requests': self.max_requests})
+        serializer.is_valid(raise_exception=True)
+
+        responses = {}
+        for url in serializer.validated_data['requests']:
+            if url not in responses:
+                responses[url] = self.dispatch_get(request, url)
+        return Response(responses, status=status.HTTP_200_OK)
+
+    def dispatch_get(self, request, url):
+        path, _, query_string = url.partition('?')
+        try:
+            match = resolve(path)
+        except Resolver404:
+            return {'status': status.HTTP_404_NOT_FOUND, 'data': None}
+        if getattr(match.func, 'view_class', None) is type(self):
+            return {'status': status.HTTP_400_BAD_REQUEST, 'data': None}
+
+        sub_request = HttpRequest()
+        sub_request.method = 'GET'
+        sub_request.path = sub_request.path_info = path
+        sub_request.GET = QueryDict(query_string)
+        sub_request.COOKIES = request.COOKIES
+        sub_request.META = {
+            key: value for key, value in request.META.items()
+            if key not in ('CONTENT_LENGTH', 'CONTENT_TYPE')
+        }
+        sub_request.META.update({
+            'REQUEST_METHOD': 'GET',
+            'PATH_INFO': path,
+            'QUERY_STRING': query_string,
+            'HTTP_ACCEPT': 'application/json',
+        })
+        if request.user.is_authenticated:
+            # Тот же механизм, что у force_authenticate в тестах DRF:
+            # подзапрос не проверяет токен заново
+            sub_request._force_auth_user = request.user
+            sub_request._force_auth_token = request.auth
+
+        response = match.func(sub_request, *match.args, **match.kwargs)
+        if hasattr(response, 'data'):
+            data = response.data
+        elif response.get('Content-Type', '').startswith('application/json'):
+            data = json.loads(response.content)
+        else:
+            data = None
+        return {'status': response.status_code, 'data': data}
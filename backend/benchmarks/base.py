@@ -0,0 +1,231 @@
+"""
+Общие части бенчмарков API: тестовые данные, подсчет SQL-запросов
+и замер времени ответа.
+
+Запуск на SQLite:
+    ENV=LOCAL python manage.py test benchmarks
+Запуск на Postgres (без ENV=LOCAL, параметры базы из DB_*):
+    DB_ENGINE=django.db.backends.postgresql python manage.py test benchmarks
+
+Результаты (p50/p95 в миллисекундах, пик памяти в килобайтах) пишутся
+в BENCHMARK_OUTPUT, по умолчанию benchmark_results.json. Два файла
+можно сравнить:
+    python benchmarks/compare.py old.json new.json
+"""
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import tempfile
+import time
+import tracemalloc
+
+from django.apps import apps
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from api.authentication import token_cache
+from api.search import ingredient_index
+from recipes.counters import recount
+from recipes import feed
+from recipes.shopping import rebuild
+from recipes.models import (FollowOnRecipe, FollowOnUser, Ingredient,
+                            IngredientAmount, Recipe, ShopList, Tag)
+from users.models import User
+
+ROUNDS = int(os.getenv('BENCHMARK_ROUNDS', default=20))
+OUTPUT = os.getenv('BENCHMARK_OUTPUT', default='benchmark_results.json')
+MEDIA_ROOT = tempfile.mkdtemp(prefix='foodgram-benchmarks-')
+
+USERS = 12
+RECIPES_PER_AUTHOR = 8
+INGREDIENTS = 40
+INGREDIENTS_PER_RECIPE = 6
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ('git', 'rev-parse', '--short', 'HEAD'),
+            stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class APIBenchmark(TestCase):
+    """
+    Базовый класс: засевает базу и дает assertQueryBudget и measure
+    """
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.results = {}
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.tags = Tag.objects.bulk_create(
+            Tag(name=f'Тег {i}', slug=f'tag{i}', color=f'#00000{i}')
+            for i in range(3)
+        )
+        cls.ingredients = Ingredient.objects.bulk_create(
+            Ingredient(name=f'ингредиент {i}', measurement_unit='г')
+            for i in range(INGREDIENTS)
+        )
+        cls.users = [
+            User.objects.create_user(
+                username=f'user{i}', email=f'user{i}@foodgram.ru',
+                password='password', first_name='Имя', last_name='Фамилия')
+            for i in range(USERS)
+        ]
+        cls.user = cls.users[0]
+        cls.token = Token.objects.create(user=cls.user)
+
+        recipes = Recipe.objects.bulk_create(
+            Recipe(author=author, name=f'Рецепт {n} {author.username}',
+                   image='recipes/benchmark.png', text='Описание',
+                   cooking_time=n + 1)
+            for author in cls.users
+            for n in range(RECIPES_PER_AUTHOR)
+        )
+        cls.recipes = recipes
+        recipe_tags = Recipe.tags.through
+        recipe_tags.objects.bulk_create(
+            recipe_tags(recipe=recipe, tag=cls.tags[(recipe.pk + i) % 3])
+            for recipe in recipes
+            for i in range(2)
+        )
+        IngredientAmount.objects.bulk_create(
+            IngredientAmount(
+                recipe=recipe,
+                ingredient=cls.ingredients[(recipe.pk + i) % INGREDIENTS],
+                amount=i + 1)
+            for recipe in recipes
+            for i in range(INGREDIENTS_PER_RECIPE)
+        )
+        FollowOnRecipe.objects.bulk_create(
+            FollowOnRecipe(user=cls.user, recipe=recipe)
+            for recipe in recipes[::3]
+        )
+        ShopList.objects.bulk_create(
+            ShopList(user=cls.user, recipe=recipe)
+            for recipe in recipes[::5]
+        )
+        FollowOnUser.objects.bulk_create(
+            FollowOnUser(user=cls.user, author=author)
+            for author in cls.users[1:]
+        )
+        recount(apps)
+        rebuild()
+        feed.rebuild()
+
+    def setUp(self):
+        # Кеши переживают откат транзакции теста, а версии справочников
+        # после отката повторяются
+        cache.clear()
+        token_cache.clear()
+        ingredient_index.version = None
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+        if not cls.results:
+            return
+        report = {}
+        if os.path.exists(OUTPUT):
+            with open(OUTPUT, encoding='utf-8') as file:
+                report = json.load(file)
+        if report.get('revision') != git_revision():
+            report = {}
+        report['revision'] = git_revision()
+        report['database'] = connection.vendor
+        report['rounds'] = ROUNDS
+        report.setdefault('endpoints', {}).update(cls.results)
+        with open(OUTPUT, 'w', encoding='utf-8') as file:
+            json.dump(report, file, ensure_ascii=False, indent=2,
+                      sort_keys=True)
+
+    def count_queries(self, method, url, **kwargs):
+        # Бюджет считается на холодном кеше, включая кеш токенов
+        cache.clear()
+        token_cache.clear()
+        with CaptureQueriesContext(connection) as context:
+            response = getattr(self.client, method)(url, **kwargs)
+        return response, len(context.captured_queries)
+
+    def assertQueryBudget(self, url, budget, method='get', status=200,
+                          **kwargs):
+        """
+        Проверяет статус ответа и что число SQL-запросов не больше budget
+        """
+        response, queries = self.count_queries(method, url, **kwargs)
+        self.assertEqual(response.status_code, status, url)
+        self.assertLessEqual(
+            queries, budget,
+            f'{method.upper()} {url}: {queries} запросов, бюджет {budget}')
+        return queries
+
+    def assertPageSizeIndependent(self, url, budget, small=2, large=50):
+        """
+        Число запросов одинаково для маленькой и большой страницы
+        """
+        separator = '&' if '?' in url else '?'
+        small_queries = self.assertQueryBudget(
+            f'{url}{separator}limit={small}', budget)
+        large_queries = self.assertQueryBudget(
+            f'{url}{separator}limit={large}', budget)
+        self.assertEqual(
+            small_queries, large_queries,
+            f'{url}: {small_queries} запросов при limit={small}, '
+            f'{large_queries} при limit={large}')
+
+    def measure(self, name, *requests):
+        """
+        Выполняет последовательность запросов ROUNDS раз и сохраняет
+        p50/p95 времени одного прохода в миллисекундах
+        """
+        def run():
+            for method, url, kwargs in requests:
+                getattr(self.client, method)(url, **kwargs)
+        return self.measure_call(name, run)
+
+    def measure_call(self, name, func):
+        """То же для произвольной функции без аргументов"""
+        timings = []
+        for _ in range(ROUNDS):
+            start = time.perf_counter()
+            func()
+            timings.append((time.perf_counter() - start) * 1000)
+        timings.sort()
+        p95 = timings[-1]
+        if len(timings) > 1:
+            p95 = statistics.quantiles(timings, n=20, method='inclusive')[18]
+        self.results[name] = {
+            'p50': round(statistics.median(timings), 3),
+            'p95': round(p95, 3),
+        }
+        return self.results[name]
+
+    def measure_memory(self, name, view, request):
+        """
+        Пик памяти Python, выделенной view на обработку request, без
+        уже собранного тела запроса. Сохраняется в килобайтах
+        """
+        tracemalloc.start()
+        try:
+            response = view(request)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+            # Как обработчик Django: закрыть загруженные файлы запроса
+            request.close()
+        self.results.setdefault(name, {})['peak_kb'] = round(peak / 1024)
+        return response
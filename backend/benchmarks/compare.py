@@ -0,0 +1,36 @@
+"""
+Сравнение двух файлов с результатами бенчмарков:
+    python benchmarks/compare.py old.json new.json
+"""
+import json
+import sys
+
+
+def load(path):
+    with open(path, encoding='utf-8') as file:
+        return json.load(file)
+
+
+def main(old_path, new_path):
+    old, new = load(old_path), load(new_path)
+    print(f'{"endpoint":<28}{"p50 old":>10}{"p50 new":>10}'
+          f'{"p95 old":>10}{"p95 new":>10}{"p50 Δ%":>9}')
+    for name in sorted(set(old['endpoints']) | set(new['endpoints'])):
+        before = old['endpoints'].get(name)
+        after = new['endpoints'].get(name)
+        if not before or not after:
+            print(f'{name:<28}{"только в одном из файлов":>49}')
+            continue
+        if 'p50' not in before or 'p50' not in after:
+            print(f'{name:<28}{"пик, КБ":>10}{before.get("peak_kb", "-"):>10}'
+                  f'{after.get("peak_kb", "-"):>10}')
+            continue
+        delta = (after['p50'] - before['p50']) / before['p50'] * 100
+        print(f'{name:<28}{before["p50"]:>10.2f}{after["p50"]:>10.2f}'
+              f'{before["p95"]:>10.2f}{after["p95"]:>10.2f}{delta:>+9.1f}')
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3:
+        sys.exit(__doc__)
+    main(*sys.argv[1:])
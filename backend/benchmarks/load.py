@@ -0,0 +1,138 @@
+"""
+Нагрузочный прогон запущенного сервера: concurrency клиентов с
+keep-alive соединениями в течение duration секунд по кругу запрашивают
+paths. Печатает запросы в секунду, p50 и p99, ошибки:
+    python benchmarks/load.py wsgi=http://127.0.0.1:8000 \\
+        asgi=http://127.0.0.1:8001 --token ... --concurrency 50 200 1000
+Зависимостей, кроме стандартной библиотеки, нет
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from urllib.parse import urlsplit
+
+PATHS = ('/api/recipes/?limit=6', '/api/tags/',
+         '/api/ingredients/?name=%D1%81', '/api/users/me/')
+
+
+class Connection:
+    def __init__(self, host, port):
+        self.host, self.port = host, port
+        self.reader = self.writer = None
+
+    async def request(self, path, headers):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(
+                self.host, self.port, limit=1024 * 1024)
+        self.writer.write(
+            f'GET {path} HTTP/1.1\r\nHost: {self.host}\r\n{headers}\r\n'
+            .encode('latin1'))
+        status, close, length, chunked = await self.read_head()
+        if chunked:
+            while True:
+                size = int((await self.reader.readline()).split(b';')[0], 16)
+                await self.reader.readexactly(size + 2)
+                if not size:
+                    break
+        elif length is not None:
+            await self.reader.readexactly(length)
+        else:
+            await self.reader.read()
+            close = True
+        if close:
+            self.close()
+        return status
+
+    async def read_head(self):
+        head = await self.reader.readuntil(b'\r\n\r\n')
+        lines = head.decode('latin1').split('\r\n')
+        status = int(lines[0].split()[1])
+        fields = dict(
+            (name.strip().lower(), value.strip())
+            for name, _, value in (line.partition(':') for line in lines[1:])
+            if name)
+        length = fields.get('content-length')
+        return (status,
+                fields.get('connection', '').lower() == 'close',
+                int(length) if length is not None else None,
+                'chunked' in fields.get('transfer-encoding', '').lower())
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+
+async def client(url, paths, headers, deadline, latencies, errors):
+    parts = urlsplit(url)
+    connection = Connection(parts.hostname, parts.port or 80)
+    turn = 0
+    while time.monotonic() < deadline:
+        path = paths[turn % len(paths)]
+        turn += 1
+        started = time.monotonic()
+        try:
+            status = await connection.request(path, headers)
+        except (OSError, asyncio.IncompleteReadError, ValueError):
+            connection.close()
+            errors['connection'] += 1
+            continue
+        latencies.append(time.monotonic() - started)
+        if status >= 400:
+            errors[status] += 1
+    connection.close()
+
+
+async def run(url, paths, headers, concurrency, duration):
+    latencies, errors = [], {'connection': 0}
+    deadline = time.monotonic() + duration
+    await asyncio.gather(*(
+        client(url, paths, headers, deadline, latencies, errors)
+        for _ in range(concurrency)))
+    latencies.sort()
+    return {
+        'rps': round(len(latencies) / duration, 1),
+        'p50': round(statistics.median(latencies) * 1000, 2)
+        if latencies else None,
+        'p99': round(latencies[int(len(latencies) * 0.99)] * 1000, 2)
+        if latencies else None,
+        'errors': {str(key): value for key, value in errors.items() if value},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Нагрузочный прогон: имя=URL сервера')
+    parser.add_argument('targets', nargs='+', metavar='name=url')
+    parser.add_argument('--concurrency', type=int, nargs='+',
+                        default=[50, 200, 1000])
+    parser.add_argument('--duration', type=float, default=20)
+    parser.add_argument('--token', help='Токен для Authorization')
+    parser.add_argument('--path', action='append', dest='paths')
+    parser.add_argument('--output', help='Записать результаты в JSON')
+    options = parser.parse_args()
+    headers = 'Accept: application/json\r\n'
+    if options.token:
+        headers += f'Authorization: Token {options.token}\r\n'
+    paths = options.paths or PATHS
+    results = {}
+    print(f'{"server":<10}{"clients":>8}{"rps":>10}{"p50, мс":>10}'
+          f'{"p99, мс":>10}  ошибки')
+    for target in options.targets:
+        name, _, url = target.partition('=')
+        for concurrency in options.concurrency:
+            result = asyncio.run(
+                run(url, paths, headers, concurrency, options.duration))
+            results.setdefault(name, {})[concurrency] = result
+            print(f'{name:<10}{concurrency:>8}{result["rps"]:>10}'
+                  f'{result["p50"] or "-":>10}{result["p99"] or "-":>10}'
+                  f'  {result["errors"] or "-"}')
+    if options.output:
+        with open(options.output, 'w', encoding='utf-8') as file:
+            json.dump(results, file, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,1114 @@
+import base64
+import copy
+import io
+import json
+import os
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import F, Sum
+from django.test import AsyncClient, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+from rest_framework.test import (APIClient, APIRequestFactory,
+                                 force_authenticate)
+
+from api.authentication import TokenCache, token_cache
+from api.cache import bump_catalog_version, user_me_key
+from api.pdf import render_shopping_list
+from api.views import RecipeViewSet
+from benchmarks.base import RECIPES_PER_AUTHOR, USERS, APIBenchmark
+from recipes import feed
+from recipes.exports import claim, run_job
+from recipes.images import build_variants, save_variants
+from recipes.ingredients import import_ingredients, read_json
+from recipes.management.commands.gc_media import \
+    Command as GCMediaCommand
+from recipes.models import (ExportJob, FeedEntry, FollowOnRecipe,
+                            FollowOnUser, Ingredient, IngredientAmount,
+                            MediaBlob, Recipe, ShoppingListItem, Tag)
+from recipes.storage import recipe_files, touch_blob
+from users.models import User
+
+IMAGE = (
+    'data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABAgMAAABieywaAAAAC'
+    'VBMVEUAAAD///9fX1/S0ecCAAAACXBIWXMAAA7EAAAOxAGVKw4bAAAACklEQVQImWNoA'
+    'AAAggCByxOyYQAAAABJRU5ErkJggg=='
+)
+
+
+class RecipesBenchmark(APIBenchmark):
+    def test_recipes_list(self):
+        self.assertPageSizeIndependent('/api/recipes/?page=1', budget=5)
+        self.measure('recipes_list', ('get', '/api/recipes/?limit=6', {}))
+
+    def test_recipes_count_cached(self):
+        url = '/api/recipes/?tags=tag0&limit=6'
+        _, cold = self.count_queries('get', url)
+        with CaptureQueriesContext(connection) as context:
+            self.client.get(url)
+        warm = len(context.captured_queries)
+        self.assertLess(warm, cold)
+
+        # Избранное другого пользователя count этого списка не трогает
+        other = APIClient()
+        other.force_authenticate(self.users[1])
+        other.post(f'/api/recipes/{self.recipes[1].pk}/favorite/')
+        with CaptureQueriesContext(connection) as context:
+            self.client.get(url)
+        self.assertEqual(len(context.captured_queries), warm)
+
+        self.client.post(f'/api/recipes/{self.recipes[1].pk}/favorite/')
+        with CaptureQueriesContext(connection) as context:
+            self.client.get(url)
+        self.assertEqual(len(context.captured_queries), warm + 1)
+
+    def test_favorites_count_per_user(self):
+        url = '/api/recipes/?is_favorited=1&limit=6'
+        count = self.client.get(url).json()['count']
+        self.client.post(f'/api/recipes/{self.recipes[1].pk}/favorite/')
+        self.assertEqual(self.client.get(url).json()['count'], count + 1)
+        self.client.post('/api/recipes/favorite/',
+                         {'recipes': [self.recipes[2].pk]}, format='json')
+        self.assertEqual(self.client.get(url).json()['count'], count + 2)
+
+    def test_recipes_list_cursor(self):
+        self.assertPageSizeIndependent('/api/recipes/?cursor=', budget=4)
+        self.measure('recipes_list_cursor',
+                     ('get', '/api/recipes/?cursor=&limit=6', {}))
+
+    def test_recipes_cursor_walk(self):
+        url, seen = '/api/recipes/?cursor=&limit=7', []
+        while url:
+            page = self.client.get(url).json()
+            self.assertNotIn('count', page)
+            seen.extend(recipe['id'] for recipe in page['results'])
+            url = page['next']
+        expected = sorted(self.recipes, key=lambda r: (r.pub_date, r.pk),
+                          reverse=True)
+        self.assertEqual(seen, [recipe.pk for recipe in expected])
+
+    def test_recipes_list_filtered(self):
+        url = '/api/recipes/?page=1&tags=tag0&tags=tag1&is_favorited=1'
+        self.assertPageSizeIndependent(url, budget=6)
+        self.measure('recipes_list_filtered', ('get', f'{url}&limit=6', {}))
+
+    def test_recipes_list_anonymous(self):
+        self.client.credentials()
+        self.assertPageSizeIndependent('/api/recipes/?page=1', budget=4)
+        self.measure('recipes_list_anonymous',
+                     ('get', '/api/recipes/?limit=6', {}))
+
+    def test_recipe_detail(self):
+        url = f'/api/recipes/{self.recipes[-1].pk}/'
+        self.assertQueryBudget(url, budget=4)
+        self.measure('recipe_detail', ('get', url, {}))
+
+    def test_favorite(self):
+        url = f'/api/recipes/{self.recipes[1].pk}/favorite/'
+        self.assertQueryBudget(url, budget=6, method='post', status=201)
+        # Токен, строка для post_delete, DELETE и сдвиг favorites_count
+        self.assertQueryBudget(url, budget=4, method='delete', status=204)
+        self.measure('favorite', ('post', url, {}), ('delete', url, {}))
+
+    def test_shopping_cart(self):
+        url = f'/api/recipes/{self.recipes[1].pk}/shopping_cart/'
+        # +4 на сдвиг сумм в списке покупок и его версию
+        self.assertQueryBudget(url, budget=10, method='post', status=201)
+        self.assertQueryBudget(url, budget=9, method='delete', status=204)
+        self.measure('shopping_cart', ('post', url, {}), ('delete', url, {}))
+
+    def recipe_payload(self, ingredients, amount=1):
+        return {
+            'name': 'Новый рецепт',
+            'text': 'Описание',
+            'cooking_time': 10,
+            'image': IMAGE,
+            'tags': [tag.pk for tag in self.tags[:2]],
+            'ingredients': [
+                {'id': ingredient.pk, 'amount': amount}
+                for ingredient in ingredients
+            ],
+        }
+
+    def test_recipe_create(self):
+        payload = self.recipe_payload(self.ingredients[:30])
+        # 3 из них - MediaBlob: отметка при записи файла, строка и refcount
+        self.assertQueryBudget('/api/recipes/', budget=15, method='post',
+                               status=201, data=payload, format='json')
+        self.measure('recipe_create',
+                     ('post', '/api/recipes/',
+                      {'data': payload, 'format': 'json'}))
+
+    def test_recipe_update(self):
+        self.client.post(
+            '/api/recipes/', self.recipe_payload(self.ingredients[:30]),
+            format='json')
+        recipe = Recipe.objects.get(name='Новый рецепт')
+        url = f'/api/recipes/{recipe.pk}/'
+        payload = self.recipe_payload(self.ingredients[10:40], amount=2)
+        # Та же картинка получает то же имя, refcount не меняется,
+        # но updated ее строки MediaBlob обновляется;
+        # +1 на поиск корзин с этим рецептом
+        self.assertQueryBudget(url, budget=17, method='patch',
+                               data=payload, format='json')
+        self.assertEqual(
+            dict(recipe.ingredient_amounts.values_list(
+                'ingredient_id', 'amount')),
+            {ingredient.pk: 2 for ingredient in self.ingredients[10:40]})
+        self.measure('recipe_update',
+                     ('patch', url, {'data': payload, 'format': 'json'}))
+
+    def test_toggle_twice(self):
+        url = f'/api/recipes/{self.recipes[1].pk}/shopping_cart/'
+        self.assertEqual(self.client.post(url).status_code, 201)
+        self.assertEqual(self.client.post(url).status_code, 400)
+        self.assertEqual(self.client.delete(url).status_code, 204)
+        self.assertEqual(self.client.delete(url).status_code, 400)
+        self.assertEqual(
+            self.client.delete('/api/recipes/0/shopping_cart/').status_code,
+            404)
+        recipe = Recipe.objects.get(pk=self.recipes[1].pk)
+        self.assertEqual(recipe.in_carts_count, 0)
+
+    def test_shopping_cart_bulk(self):
+        url = '/api/recipes/shopping_cart/'
+        recipe_ids = [recipe.pk for recipe in self.recipes[:20]]
+        data = {'recipes': recipe_ids}
+        response = self.client.post(url, data, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.json()['recipes']), 16)
+        self.assertQueryBudget(url, budget=10, method='delete', status=204,
+                               data=data, format='json')
+        self.assertQueryBudget(url, budget=10, method='post', status=201,
+                               data=data, format='json')
+        self.assertEqual(
+            Recipe.objects.filter(pk__in=recipe_ids,
+                                  in_carts_count=1).count(), 20)
+        self.measure('shopping_cart_bulk',
+                     ('delete', url, {'data': data, 'format': 'json'}),
+                     ('post', url, {'data': data, 'format': 'json'}))
+
+    def test_bulk_counts_changed_rows(self):
+        # Повтор - как параллельный запрос с теми же рецептами:
+        # счетчики сдвигаются только по строкам, которые он изменил
+        ids = [recipe.pk for recipe in self.recipes[:6]]
+        favorited = set(FollowOnRecipe.objects.filter(
+            user=self.user, recipe_id__in=ids).values_list(
+            'recipe_id', flat=True))
+        counts = dict(Recipe.objects.filter(pk__in=ids).values_list(
+            'pk', 'favorites_count'))
+        added = FollowOnRecipe.objects.add_recipes(self.user, ids + ids)
+        self.assertEqual(added, sorted(set(ids) - favorited))
+        self.assertEqual(FollowOnRecipe.objects.add_recipes(self.user, ids),
+                         [])
+        self.assertEqual(FollowOnRecipe.objects.remove_recipes(
+            self.user, ids), ids)
+        self.assertEqual(FollowOnRecipe.objects.remove_recipes(
+            self.user, ids), [])
+        self.assertEqual(
+            dict(Recipe.objects.filter(pk__in=ids).values_list(
+                'pk', 'favorites_count')),
+            {pk: count - (pk in favorited) for pk, count in counts.items()})
+
+    def test_download_shopping_cart(self):
+        url = '/api/recipes/download_shopping_cart/'
+        self.assertQueryBudget(url, budget=2)
+        self.measure('download_shopping_cart', ('get', url, {}))
+
+
+class UploadBenchmark(APIBenchmark):
+    def setUp(self):
+        super().setUp()
+        self.payload = RecipesBenchmark.recipe_payload(
+            self, self.ingredients[:5])
+
+    def multipart_payload(self, content, name='image.png'):
+        payload = dict(self.payload)
+        payload['image'] = SimpleUploadedFile(name, content)
+        payload['ingredients'] = json.dumps(payload['ingredients'])
+        return payload
+
+    @staticmethod
+    def noise_png(side):
+        # Шум не сжимается: PNG весит около side * side * 3 байт
+        image = Image.frombytes(
+            'RGB', (side, side), os.urandom(side * side * 3))
+        buffer = io.BytesIO()
+        image.save(buffer, 'PNG', compress_level=0)
+        return buffer.getvalue()
+
+    def test_recipe_create_multipart(self):
+        content = base64.b64decode(IMAGE.split(',')[1])
+        self.assertQueryBudget(
+            '/api/recipes/', budget=15, method='post', status=201,
+            data=self.multipart_payload(content), format='multipart')
+        recipe = Recipe.objects.get(name='Новый рецепт')
+        self.assertTrue(recipe.image.name.endswith('.png'))
+        self.assertEqual(recipe.tags.count(), 2)
+        self.assertEqual(recipe.ingredient_amounts.count(), 5)
+        self.measure('recipe_create_multipart',
+                     ('post', '/api/recipes/',
+                      {'data': self.multipart_payload(content),
+                       'format': 'multipart'}))
+
+    def test_invalid_image(self):
+        response = self.client.post(
+            '/api/recipes/', self.multipart_payload(b'not an image'),
+            format='multipart')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('image', response.json())
+
+    @override_settings(IMAGE_UPLOAD_MAX_SIZE=64 * 1024)
+    def test_upload_too_large(self):
+        content = self.noise_png(200)
+        response = self.client.post(
+            '/api/recipes/', self.multipart_payload(content),
+            format='multipart')
+        self.assertEqual(response.status_code, 413)
+        payload = dict(self.payload)
+        payload['image'] = ('data:image/png;base64,'
+                            + base64.b64encode(content).decode())
+        response = self.client.post('/api/recipes/', payload, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Recipe.objects.filter(name='Новый рецепт').exists())
+
+    @override_settings(IMAGE_UPLOAD_MAX_SIZE=64 * 1024)
+    def test_upload_limit_only_for_recipes(self):
+        # Лимит картинки рецепта не действует на другие вью
+        response = APIClient().post('/api/users/', {
+            'email': 'new@foodgram.ru', 'username': 'new_user',
+            'first_name': 'Имя', 'last_name': 'Фамилия',
+            'password': 'Pa55word!',
+            'avatar': SimpleUploadedFile('a.png', self.noise_png(200)),
+        }, format='multipart')
+        self.assertEqual(response.status_code, 201)
+
+    def test_upload_memory(self):
+        """
+        Пик памяти на загрузку картинки ~3 МБ: base64 держит в памяти
+        строку, байты и копию файла, multipart - только текущий кусок
+        """
+        content = self.noise_png(1000)
+        factory = APIRequestFactory()
+        view = RecipeViewSet.as_view({'post': 'create'})
+        payload = dict(self.payload)
+        payload['image'] = ('data:image/png;base64,'
+                            + base64.b64encode(content).decode())
+        request = factory.post('/api/recipes/', payload, format='json')
+        force_authenticate(request, self.user, self.token)
+        response = self.measure_memory('upload_base64', view, request)
+        self.assertEqual(response.status_code, 201)
+
+        request = factory.post('/api/recipes/',
+                               self.multipart_payload(content),
+                               format='multipart')
+        force_authenticate(request, self.user, self.token)
+        response = self.measure_memory('upload_multipart', view, request)
+        self.assertEqual(response.status_code, 201)
+
+        base64_peak = self.results['upload_base64']['peak_kb']
+        multipart_peak = self.results['upload_multipart']['peak_kb']
+        self.assertLess(multipart_peak * 1024, len(content))
+        self.assertLess(multipart_peak, base64_peak)
+
+    def test_deduplicated_storage(self):
+        for _ in range(2):
+            self.client.post('/api/recipes/', self.payload, format='json')
+        first, second = Recipe.objects.filter(name='Новый рецепт')
+        self.assertEqual(first.image.name, second.image.name)
+        blob = MediaBlob.objects.get(name=first.image.name)
+        self.assertEqual(blob.refcount, 2)
+
+        self.client.delete(f'/api/recipes/{first.pk}/')
+        blob.refresh_from_db()
+        self.assertEqual(blob.refcount, 1)
+        call_command('gc_media', grace_hours=0, stdout=io.StringIO())
+        self.assertTrue(default_storage.exists(blob.name))
+
+        self.client.delete(f'/api/recipes/{second.pk}/')
+        call_command('gc_media', grace_hours=0, stdout=io.StringIO())
+        self.assertFalse(default_storage.exists(blob.name))
+        self.assertFalse(MediaBlob.objects.filter(name=blob.name).exists())
+
+    def test_rebuilt_variants_release_old(self):
+        self.client.post('/api/recipes/', self.multipart_payload(
+            self.noise_png(40)), format='multipart')
+        recipe = Recipe.objects.get(name='Новый рецепт')
+        save_variants([recipe.pk], build_variants(recipe.image.name))
+        recipe.refresh_from_db()
+        old = recipe_files(None, recipe.image_variants)
+
+        recipe.image = default_storage.save(
+            'recipes/image.png', io.BytesIO(self.noise_png(40)))
+        recipe.save()
+        save_variants([recipe.pk], build_variants(recipe.image.name))
+        recipe.refresh_from_db()
+        new = recipe_files(None, recipe.image_variants)
+        self.assertFalse(old & new)
+        refcounts = dict(MediaBlob.objects.filter(
+            name__in=old | new).values_list('name', 'refcount'))
+        self.assertEqual(refcounts, {**dict.fromkeys(old, 0),
+                                     **dict.fromkeys(new, 1)})
+
+    def test_gc_keeps_reuploaded_file(self):
+        self.client.post('/api/recipes/', self.payload, format='json')
+        recipe = Recipe.objects.get(name='Новый рецепт')
+        name = recipe.image.name
+        self.client.delete(f'/api/recipes/{recipe.pk}/')
+        deadline = timezone.now()
+        # Тот же файл загружают снова, пока gc_media выбирает кандидатов
+        touch_blob(name)
+        self.assertIsNone(GCMediaCommand.collect(name, deadline))
+        self.assertTrue(default_storage.exists(name))
+        self.assertTrue(MediaBlob.objects.filter(name=name).exists())
+
+
+class ShoppingListPDFBenchmark(APIBenchmark):
+    def items(self, count):
+        return [
+            {'ingredient__name': f'ингредиент с длинным названием {i}',
+             'ingredient__measurement_unit': 'г',
+             'count': i}
+            for i in range(count)
+        ]
+
+    def test_pdf_per_second(self):
+        """PDF в секунду на один воркер для 10, 100 и 1000 строк"""
+        for count in (10, 100, 1000):
+            items = self.items(count)
+            result = self.measure_call(
+                f'pdf_{count}',
+                lambda: render_shopping_list(io.BytesIO(), 'Список', items))
+            result['per_sec'] = round(1000 / result['p50'], 1)
+
+    def test_pagination(self):
+        self.assertEqual(
+            render_shopping_list(io.BytesIO(), 'Список', self.items(10)), 1)
+        pages = render_shopping_list(
+            io.BytesIO(), 'Список', self.items(1000))
+        # Две колонки по ~45 строк на странице
+        self.assertGreater(pages, 10)
+
+    def test_download_many_ingredients(self):
+        recipe = self.recipes[0]
+        present = set(recipe.ingredient_amounts.values_list(
+            'ingredient_id', flat=True))
+        IngredientAmount.objects.bulk_create(
+            IngredientAmount(recipe=recipe, ingredient=ingredient, amount=1)
+            for ingredient in self.ingredients
+            if ingredient.pk not in present
+        )
+        response = self.client.get('/api/recipes/download_shopping_cart/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertTrue(response.content.startswith(b'%PDF'))
+
+
+class ShoppingListBenchmark(APIBenchmark):
+    url = '/api/recipes/shopping_list/'
+
+    def assertListUpToDate(self):
+        expected = dict(IngredientAmount.objects.filter(
+            recipe__users_shoplist__user=self.user
+        ).order_by().values('ingredient').annotate(
+            total=Sum('amount')).values_list('ingredient', 'total'))
+        actual = dict(ShoppingListItem.objects.filter(
+            user=self.user).values_list('ingredient', 'total'))
+        self.assertEqual(actual, expected)
+
+    def test_formats(self):
+        self.assertQueryBudget(self.url, budget=2)
+        data = self.client.get(self.url).json()
+        self.assertEqual(
+            {item['name']: item['amount'] for item in data},
+            {item.ingredient.name: item.total
+             for item in ShoppingListItem.objects.filter(user=self.user)})
+        text = self.client.get(self.url, {'format': 'txt'})
+        self.assertEqual(text['Content-Type'], 'text/plain; charset=utf-8')
+        self.assertEqual(len(text.content.decode().splitlines()), len(data))
+        table = self.client.get(self.url, HTTP_ACCEPT='text/csv')
+        lines = table.content.decode().splitlines()
+        self.assertEqual(lines[0], 'name,measurement_unit,amount')
+        self.assertEqual(len(lines), len(data) + 1)
+        self.measure('shopping_list', ('get', self.url, {}))
+
+    def test_not_modified(self):
+        etag = self.client.get(self.url)['ETag']
+        self.assertQueryBudget(self.url, budget=1, status=304,
+                               HTTP_IF_NONE_MATCH=etag)
+        self.assertNotEqual(
+            self.client.get(self.url, {'format': 'csv'})['ETag'], etag)
+        self.client.post(f'/api/recipes/{self.recipes[1].pk}/shopping_cart/')
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.measure('shopping_list_not_modified',
+                     ('get', self.url, {'HTTP_IF_NONE_MATCH': etag}))
+
+    def test_incremental_updates(self):
+        self.assertListUpToDate()
+        cart_url = '/api/recipes/{}/shopping_cart/'
+        self.client.post(cart_url.format(self.recipes[1].pk))
+        self.assertListUpToDate()
+        self.client.delete(cart_url.format(self.recipes[0].pk))
+        self.assertListUpToDate()
+        self.client.post('/api/recipes/shopping_cart/',
+                         {'recipes': [r.pk for r in self.recipes[:12]]},
+                         format='json')
+        self.assertListUpToDate()
+        self.client.delete('/api/recipes/shopping_cart/',
+                           {'recipes': [r.pk for r in self.recipes[6:9]]},
+                           format='json')
+        self.assertListUpToDate()
+
+        # Рецепт в корзине меняют и удаляют
+        recipe = self.recipes[2]
+        payload = RecipesBenchmark.recipe_payload(
+            self, self.ingredients[:4], amount=7)
+        response = self.client.patch(f'/api/recipes/{recipe.pk}/', payload,
+                                     format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertListUpToDate()
+        IngredientAmount.objects.filter(recipe=recipe).first().delete()
+        self.assertListUpToDate()
+        self.client.delete(f'/api/recipes/{recipe.pk}/')
+        self.assertListUpToDate()
+
+
+class ExportJobBenchmark(APIBenchmark):
+    url = '/api/recipes/download_shopping_cart/?async=1'
+
+    def test_enqueue_coalesces(self):
+        # токен, версия задания (get_or_create) и вставка в savepoint
+        self.assertQueryBudget(self.url, budget=5, status=202)
+        first = self.client.get(self.url)
+        self.assertEqual(first.status_code, 202)
+        self.assertEqual(self.client.get(self.url).json()['id'],
+                         first.json()['id'])
+        self.assertEqual(ExportJob.objects.count(), 1)
+
+        self.client.post(f'/api/recipes/{self.recipes[1].pk}/shopping_cart/')
+        self.assertNotEqual(self.client.get(self.url).json()['id'],
+                            first.json()['id'])
+        self.measure('download_shopping_cart_async', ('get', self.url, {}))
+
+    def test_job_lifecycle(self):
+        job_url = self.client.get(self.url)['Location']
+        response = self.client.get(job_url)
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json()['status'], ExportJob.PENDING)
+
+        job_ids = claim(10)
+        self.assertEqual(len(job_ids), 1)
+        self.assertEqual(claim(10), [])
+        self.assertEqual(run_job(job_ids[0]), ExportJob.DONE)
+
+        response = self.client.get(job_url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertTrue(b''.join(response.streaming_content).startswith(
+            b'%PDF'))
+        other = APIClient()
+        other.force_authenticate(self.users[1])
+        self.assertEqual(other.get(job_url).status_code, 404)
+
+    def test_cart_changed_before_run(self):
+        job_url = self.client.get(self.url)['Location']
+        self.client.post(f'/api/recipes/{self.recipes[1].pk}/shopping_cart/')
+        self.assertEqual(run_job(claim(10)[0]), ExportJob.FAILED)
+        response = self.client.get(job_url)
+        self.assertEqual(response.json()['status'], ExportJob.FAILED)
+        # Новый запрос - задание для новой версии списка
+        new_url = self.client.get(self.url)['Location']
+        self.assertNotEqual(new_url, job_url)
+        self.assertEqual(run_job(claim(10)[0]), ExportJob.DONE)
+
+
+class TokenCacheBenchmark(APIBenchmark):
+    url = '/api/users/me/'
+
+    def queries(self, method='get', url=url, **kwargs):
+        with CaptureQueriesContext(connection) as context:
+            response = getattr(self.client, method)(url, **kwargs)
+        return response, len(context.captured_queries)
+
+    def test_saves_query(self):
+        self.client.get(self.url)
+        token_cache.clear()
+        _, cold = self.queries()
+        _, warm = self.queries()
+        self.assertEqual(cold - warm, 1)
+        self.assertEqual(token_cache.stats['misses'], 1)
+        self.assertEqual(token_cache.stats['hits'], 1)
+
+        def cold_request():
+            token_cache.clear()
+            self.client.get(self.url)
+        self.measure_call('auth_token_cold', cold_request)
+        self.measure('auth_token_cached', ('get', self.url, {}))
+
+    def test_logout(self):
+        self.client.get(self.url)
+        response = self.client.post('/api/auth/token/logout/')
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.client.get(self.url).status_code, 401)
+
+    def test_user_changes(self):
+        self.client.get(self.url)
+        self.user.role = User.ADMIN
+        self.user.save()
+        self.assertEqual(token_cache.stats['evictions'], 1)
+        self.client.get(self.url)
+        self.assertEqual(token_cache.stats['misses'], 2)
+
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get(self.url).status_code, 401)
+
+    def test_lru(self):
+        lru = TokenCache(size=2, ttl=60)
+        for key in 'abc':
+            lru.put(key, (self.user, None))
+        self.assertIsNone(lru.get('a'))
+        self.assertIsNotNone(lru.get('c'))
+        lru.ttl = 0
+        lru.put('d', (self.user, None))
+        self.assertIsNone(lru.get('d'))
+        lru.evict(user_id=self.user.pk)
+        self.assertEqual(len(lru.entries), 0)
+
+    def test_shared(self):
+        TokenCache(size=2, ttl=60, alias='default').put('a', (self.user, 1))
+        other = TokenCache(size=2, ttl=60, alias='default')
+        self.assertEqual(other.get('a')[1], 1)
+        self.assertEqual(other.stats['shared_hits'], 1)
+        other.evict(('a',))
+        self.assertIsNone(
+            TokenCache(size=2, ttl=60, alias='default').get('a'))
+
+
+@override_settings(ROOT_URLCONF='foodgram.asgi_urls')
+class AsyncViewsBenchmark(APIBenchmark):
+    """
+    Входы api.async_views. Запросы идут через AsyncClient, синхронные
+    вью выполняются в главном потоке теста и видят его транзакцию
+    """
+    def request(self, method, url, token=True, **headers):
+        # AsyncClient в Django 4.0 принимает заголовки ASGI-именами
+        if token:
+            headers['authorization'] = f'Token {self.token.key}'
+        client = getattr(AsyncClient(), method)
+
+        async def send():
+            return await client(url, **headers)
+        return async_to_sync(send)()
+
+    def queries(self, url, **headers):
+        with CaptureQueriesContext(connection) as context:
+            response = self.request('get', url, **headers)
+        return response, len(context.captured_queries)
+
+    def test_catalog_from_cache(self):
+        for url in ('/api/tags/', '/api/ingredients/?name=ингр',
+                    f'/api/ingredients/{self.ingredients[0].pk}/'):
+            first = self.request('get', url)
+            # И версия справочника, и ответ - из кеша
+            response, queries = self.queries(url)
+            self.assertEqual(queries, 0, url)
+            self.assertEqual(response.content, first.content)
+            response, queries = self.queries(
+                url, **{'if-none-match': first['ETag']})
+            self.assertEqual((response.status_code, queries), (304, 0))
+
+    def test_me_from_cache(self):
+        first = self.request('get', '/api/users/me/')
+        self.assertEqual(first.json()['id'], self.user.pk)
+        response, queries = self.queries('/api/users/me/')
+        self.assertEqual(queries, 0)
+        self.assertEqual(response.json(), first.json())
+        anonymous = self.request('get', '/api/users/me/', token=False)
+        self.assertEqual(anonymous.status_code, 401)
+
+    def test_sync_views_side_by_side(self):
+        url = f'/api/recipes/{self.recipes[0].pk}/'
+        response = self.request('get', url)
+        self.assertEqual(response.json(), self.client.get(url).json())
+        response = self.request('get', '/api/recipes/?limit=3')
+        self.assertEqual(len(response.json()['results']), 3)
+        # Запись и адреса без асинхронного входа - прежние вью
+        response = self.request('delete', url)
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.request('get', url).status_code, 404)
+        response = self.request('get', '/api/recipes/download_shopping_cart/')
+        self.assertEqual(response.status_code, 200)
+
+
+class BatchBenchmark(APIBenchmark):
+    urls = ['/api/users/me/', '/api/tags/', '/api/recipes/?page=1&limit=6']
+
+    def test_batch(self):
+        response, queries = self.count_queries(
+            'post', '/api/batch/', data={'requests': self.urls},
+            format='json')
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        for url in self.urls:
+            self.assertEqual(data[url]['status'], 200)
+            self.assertEqual(data[url]['data'],
+                             self.client.get(url).json())
+        # Токен проверяется один раз на весь пакет
+        self.assertLessEqual(queries, 1 + 1 + 2 + 4)
+        self.measure('batch', ('post', '/api/batch/',
+                               {'data': {'requests': self.urls},
+                                'format': 'json'}))
+        self.measure('batch_separate',
+                     *(('get', url, {}) for url in self.urls))
+
+    def test_batch_limits(self):
+        response = self.client.post(
+            '/api/batch/', {'requests': ['/api/tags/'] * 11}, format='json')
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post(
+            '/api/batch/', {'requests': ['/api/batch/', '/api/nope/']},
+            format='json')
+        self.assertEqual(response.json()['/api/batch/']['status'], 400)
+        self.assertEqual(response.json()['/api/nope/']['status'], 404)
+
+
+class FiltersBenchmark(APIBenchmark):
+    """
+    Время и число запросов не должны расти с числом тегов в фильтре
+    и с размером избранного
+    """
+    def test_tags_combinations(self):
+        budgets = set()
+        for count in range(1, len(self.tags) + 1):
+            tags = '&'.join(f'tags={tag.slug}' for tag in self.tags[:count])
+            url = f'/api/recipes/?{tags}&limit=6'
+            budgets.add(self.assertQueryBudget(url, budget=6))
+            self.measure(f'recipes_tags_{count}', ('get', url, {}))
+        self.assertEqual(len(budgets), 1)
+
+    def test_new_tag(self):
+        self.client.get('/api/recipes/?tags=tag0')
+        # Тег, созданный в другом процессе, виден без сброса кешей
+        tag = Tag.objects.bulk_create(
+            [Tag(name='Новый', color='#123456', slug='new')])[0]
+        self.recipes[0].tags.add(tag)
+        response = self.client.get('/api/recipes/?tags=new')
+        self.assertEqual([recipe['id'] for recipe in response.json()],
+                         [self.recipes[0].pk])
+
+    def test_no_distinct(self):
+        url = '/api/recipes/?tags=tag0&tags=tag1&is_favorited=1' \
+              '&is_in_shopping_cart=1&limit=6'
+        with CaptureQueriesContext(connection) as context:
+            self.client.get(url)
+        for query in context.captured_queries:
+            self.assertNotIn('DISTINCT', query['sql'])
+        # Slug -> id одним запросом, в EXISTS таблицы тегов уже нет
+        sql = [query['sql'] for query in context.captured_queries]
+        self.assertEqual(
+            len([query for query in sql
+                 if '"recipes_tag"."slug" IN' in query]),
+            1)
+        for query in sql:
+            if 'EXISTS' in query:
+                self.assertNotIn('"recipes_tag"', query)
+
+    def test_favorites_growth(self):
+        url = '/api/recipes/?is_favorited=1&limit=6'
+        FollowOnRecipe.objects.all().delete()
+        for size in (1, len(self.recipes) // 4, len(self.recipes)):
+            FollowOnRecipe.objects.bulk_create(
+                (FollowOnRecipe(user=self.user, recipe=recipe)
+                 for recipe in self.recipes[:size]),
+                ignore_conflicts=True)
+            self.assertQueryBudget(url, budget=5)
+            self.measure(f'recipes_favorited_{size}', ('get', url, {}))
+
+
+class CatalogBenchmark(APIBenchmark):
+    # +1 запрос в каждом бюджете - версия справочника (CatalogVersion):
+    # бюджет считается на холодном кеше
+    def test_tags(self):
+        self.assertQueryBudget('/api/tags/', budget=2)
+        self.measure('tags', ('get', '/api/tags/', {}))
+
+    def test_tags_not_modified(self):
+        etag = self.client.get('/api/tags/')['ETag']
+        self.assertQueryBudget('/api/tags/', budget=1, status=304,
+                               HTTP_IF_NONE_MATCH=etag)
+        self.measure('tags_not_modified',
+                     ('get', '/api/tags/', {'HTTP_IF_NONE_MATCH': etag}))
+        # С версией в кеше 304 обходится без запросов к базе
+        self.client.get('/api/tags/')
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get('/api/tags/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual((response.status_code, len(context.captured_queries)),
+                         (304, 0))
+
+        # Новая версия попадает в общий кеш после коммита
+        with self.captureOnCommitCallbacks(execute=True):
+            self.tags[0].name = 'Новое имя'
+            self.tags[0].save()
+        response = self.client.get('/api/tags/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertIn('Новое имя', response.content.decode())
+
+    def test_version_from_database(self):
+        # Запись сделал другой процесс: версия в базе, общего кеша нет
+        etag = self.client.get('/api/tags/')['ETag']
+        bump_catalog_version('tags')
+        cache.clear()
+        response = self.client.get('/api/tags/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_tag_detail(self):
+        url = f'/api/tags/{self.tags[0].pk}/'
+        self.assertQueryBudget(url, budget=2)
+        self.measure('tag_detail', ('get', url, {}))
+
+    def test_ingredients(self):
+        self.assertQueryBudget('/api/ingredients/', budget=2)
+        self.measure('ingredients', ('get', '/api/ingredients/', {}))
+
+    def test_ingredients_not_modified(self):
+        url = '/api/ingredients/?name=ингр'
+        etag = self.client.get(url)['ETag']
+        self.assertQueryBudget(url, budget=1, status=304,
+                               HTTP_IF_NONE_MATCH=etag)
+
+    def test_ingredients_search(self):
+        url = '/api/ingredients/?name=ингр'
+        # Индекс уже построен: только версия справочника, индекс
+        # берет ее уже из кеша
+        self.client.get(url)
+        self.assertQueryBudget(url, budget=1)
+        self.measure('ingredients_search', ('get', url, {}))
+
+    def test_ingredients_search_as_database(self):
+        Ingredient.objects.bulk_create((
+            Ingredient(name='Tofu', measurement_unit='г'),
+            Ingredient(name='шелковый tofu', measurement_unit='г'),
+        ))
+        # bulk_create не шлет сигналов, версию поднимает import_ingredients
+        bump_catalog_version('ingredients')
+        # Совпадения с начала названия - те же, что давал SearchFilter
+        # с '^name' до индекса, и в том же порядке; остальное - после
+        for query in ('ингредиент', 'TOF', 'ингр,ингредиент',
+                      'ингредиент ингр', ' '):
+            expected = Ingredient.objects.order_by('id')
+            for term in query.replace(',', ' ').split():
+                expected = expected.filter(name__istartswith=term)
+            expected = list(expected.values('id', 'name', 'measurement_unit'))
+            response = self.client.get('/api/ingredients/',
+                                       {'name': query})
+            self.assertEqual(response.json()[:len(expected)], expected, query)
+        response = self.client.get('/api/ingredients/?name=tof')
+        self.assertEqual([row['name'] for row in response.json()],
+                         ['Tofu', 'шелковый tofu'])
+
+    def test_ingredients_search_normalized(self):
+        Ingredient.objects.bulk_create((
+            Ingredient(name='Ёжевика', measurement_unit='г'),
+            Ingredient(name='лесная ежевика', measurement_unit='г'),
+            Ingredient(name='ежевичный  сироп', measurement_unit='мл'),
+        ))
+        bump_catalog_version('ingredients')
+        for query, expected in (
+                # ё = е, совпадения с начала названия раньше остальных
+                ('ежев', ['Ёжевика', 'ежевичный  сироп', 'лесная ежевика']),
+                ('ЁЖЕВИКА', ['Ёжевика', 'лесная ежевика']),
+                # Пробелы схлопываются, запрос целиком - начало названия
+                ('ежевичный   сир', ['ежевичный  сироп']),
+                ('лесн ежев', ['лесная ежевика'])):
+            response = self.client.get('/api/ingredients/',
+                                       {'name': query})
+            self.assertEqual([row['name'] for row in response.json()],
+                             expected, query)
+
+    def test_ingredient_detail(self):
+        url = f'/api/ingredients/{self.ingredients[0].pk}/'
+        self.assertQueryBudget(url, budget=2)
+        self.measure('ingredient_detail', ('get', url, {}))
+
+
+class SeedLoadBenchmark(APIBenchmark):
+    options = {'users': 5, 'recipes': 10, 'favorites': 2, 'carts': 1,
+               'subscriptions': 1, 'seed': 7}
+
+    @staticmethod
+    def links(names):
+        """Связи рецептов names, без id, которые меняются между запусками"""
+        return (
+            set(Recipe.tags.through.objects.filter(
+                recipe__name__in=names).values_list('recipe__name', 'tag_id')),
+            set(IngredientAmount.objects.filter(
+                recipe__name__in=names).values_list(
+                    'recipe__name', 'ingredient_id', 'amount')),
+            set(FollowOnRecipe.objects.filter(
+                recipe__name__in=names).values_list(
+                    'user__username', 'recipe__name')),
+        )
+
+    def test_rerun_without_duplicates(self):
+        output = io.StringIO()
+        call_command('seed_load', **self.options, stdout=output)
+        recipes = Recipe.objects.filter(name__startswith='seed7 рецепт')
+        first = list(recipes.order_by('name').values_list(
+            'name', 'author_id', 'cooking_time'))
+        call_command('seed_load', **{**self.options, 'recipes': 12},
+                     stdout=output)
+        second = list(recipes.order_by('name').values_list(
+            'name', 'author_id', 'cooking_time'))
+        self.assertEqual((len(first), len(second)), (10, 12))
+        self.assertLess(set(first), set(second))
+        # Отчет считает строки, которые действительно добавлены
+        self.assertIn('рецепты: добавлено 2 строк из 2', output.getvalue())
+
+    def test_rerun_links_as_clean_run(self):
+        new = ('seed7 рецепт 10', 'seed7 рецепт 11')
+        call_command('seed_load', **{**self.options, 'recipes': 12},
+                     stdout=io.StringIO())
+        clean = self.links(new)
+        User.objects.filter(username__startswith='seed7_user').delete()
+
+        call_command('seed_load', **self.options, stdout=io.StringIO())
+        old = [f'seed7 рецепт {i}' for i in range(10)]
+        loaded = self.links(old)
+        call_command('seed_load', **{**self.options, 'recipes': 12},
+                     stdout=io.StringIO())
+        # Новые рецепты - как при запуске с нуля, старые не тронуты
+        self.assertEqual(self.links(new), clean)
+        self.assertEqual(self.links(old), loaded)
+        self.assertTrue(all(clean[:2]))
+
+
+class IngredientImportBenchmark(APIBenchmark):
+    def import_file(self, name, *args):
+        output = io.StringIO()
+        call_command('import_ingredients',
+                     os.path.join(settings.BASE_DIR, 'data', name), *args,
+                     stdout=output)
+        return output.getvalue()
+
+    def test_import_idempotent(self):
+        before = Ingredient.objects.count()
+        self.import_file('ingredients.json', '--dry-run')
+        self.assertEqual(Ingredient.objects.count(), before)
+
+        # Один SELECT существующих ключей на пачку из 1000 строк,
+        # INSERT на SQLite дробится по лимиту числа параметров
+        with CaptureQueriesContext(connection) as context:
+            self.import_file('ingredients.json')
+        selects = [query for query in context.captured_queries
+                   if query['sql'].startswith('SELECT')]
+        self.assertEqual(len(selects), 3)
+        with open(os.path.join(settings.BASE_DIR, 'data',
+                               'ingredients.json'), encoding='utf-8') as file:
+            expected = len({(item['name'], item['measurement_unit'])
+                            for item in json.load(file)})
+        self.assertEqual(Ingredient.objects.count(), before + expected)
+
+        amounts = IngredientAmount.objects.count()
+        output = self.import_file('ingredients.csv')
+        self.assertIn('Добавлено: 0,', output)
+        self.assertEqual(Ingredient.objects.count(), before + expected)
+        self.assertEqual(IngredientAmount.objects.count(), amounts)
+        self.measure_call('import_ingredients_rerun',
+                          lambda: self.import_file('ingredients.csv'))
+
+    def test_read_json_streaming(self):
+        items = [{'name': f'ингредиент {i}', 'measurement_unit': 'г'}
+                 for i in range(50)]
+        file = io.StringIO(json.dumps(items, ensure_ascii=False, indent=1))
+        self.assertEqual(list(read_json(file, size=16)), items)
+        with self.assertRaises(ValueError):
+            list(read_json(io.StringIO('[{"name": "соль"}, {"na'), size=16))
+
+    def test_invalid_rows(self):
+        stats = import_ingredients([
+            {'name': ' соль ', 'measurement_unit': 'г'},
+            {'name': 'соль', 'measurement_unit': 'г'},
+            {'name': '', 'measurement_unit': 'г'},
+            {'name': 'перец'},
+            'строка',
+        ])
+        self.assertEqual(stats, {'inserted': 1, 'existing': 1, 'invalid': 3})
+
+
+class FeedBenchmark(APIBenchmark):
+    url = '/api/recipes/feed/'
+
+    def expected(self):
+        return list(Recipe.objects.filter(
+            author__followers__user=self.user
+        ).order_by('-pub_date', '-id').values_list('id', flat=True))
+
+    def walk(self, limit=5):
+        ids, url = [], f'{self.url}?limit={limit}'
+        while url:
+            data = self.client.get(url).json()
+            ids += [recipe['id'] for recipe in data['results']]
+            url = data['next']
+        return ids
+
+    def test_feed(self):
+        # Токен, страница ленты, «большие» авторы, рецепты, теги,
+        # ингредиенты - при любом числе подписок
+        self.assertPageSizeIndependent(self.url, budget=6)
+        self.assertEqual(self.walk(), self.expected())
+        self.assertEqual(self.client.get(
+            f'{self.url}?cursor=xyz').status_code, 404)
+        self.measure('feed', ('get', f'{self.url}?limit=6', {}))
+
+    def test_fan_out(self):
+        recipe = Recipe.objects.create(
+            author=self.users[1], name='Новый', image='recipes/new.png',
+            text='Описание', cooking_time=1)
+        self.assertEqual(feed.fan_out(recipe.pk), 1)
+        first = self.client.get(f'{self.url}?limit=1').json()['results']
+        self.assertEqual(first[0]['id'], recipe.pk)
+        with override_settings(FEED_FANOUT_LIMIT=0):
+            self.assertEqual(feed.fan_out(recipe.pk), 0)
+
+    def test_fan_out_on_read(self):
+        FeedEntry.objects.all().delete()
+        with override_settings(FEED_FANOUT_LIMIT=0):
+            self.assertEqual(self.walk(), self.expected())
+
+    def test_unfollow_and_follow(self):
+        author = self.users[1]
+        url = f'/api/users/{author.pk}/subscribe/'
+        self.assertEqual(self.client.delete(url).status_code, 204)
+        self.assertFalse(FeedEntry.objects.filter(
+            user=self.user, author=author).exists())
+        self.assertNotIn(author.recipes.first().pk, self.walk())
+
+        self.assertEqual(self.client.post(url).status_code, 201)
+        feed.fill(FollowOnUser.objects.filter(user=self.user, author=author))
+        self.assertEqual(self.walk(), self.expected())
+
+
+class UsersBenchmark(APIBenchmark):
+    def test_users_list(self):
+        self.assertPageSizeIndependent('/api/users/?page=1', budget=4)
+
+    def test_users_list_timing(self):
+        self.measure('users_list', ('get', '/api/users/?limit=6', {}))
+
+    def test_user_detail(self):
+        url = f'/api/users/{self.users[1].pk}/'
+        self.assertQueryBudget(url, budget=3)
+        self.measure('user_detail', ('get', url, {}))
+
+    def test_users_list_subscribed(self):
+        response = self.client.get('/api/users/?limit=20')
+        subscribed = {user['id']: user['is_subscribed']
+                      for user in response.json()['results']}
+        self.assertFalse(subscribed[self.user.pk])
+        self.assertTrue(subscribed[self.users[1].pk])
+        response = APIClient().get('/api/users/?limit=20')
+        self.assertFalse(any(user['is_subscribed']
+                             for user in response.json()['results']))
+
+    def test_me(self):
+        self.assertQueryBudget('/api/users/me/', budget=2)
+        # Повторный запрос: и токен, и ответ из кеша
+        with CaptureQueriesContext(connection) as context:
+            self.client.get('/api/users/me/')
+        self.assertEqual(len(context.captured_queries), 0)
+        self.measure('users_me', ('get', '/api/users/me/', {}))
+
+    def test_me_invalidation(self):
+        self.client.get('/api/users/me/')
+        self.user.first_name = 'Новое имя'
+        self.user.save()
+        self.assertEqual(self.client.get('/api/users/me/').json()[
+            'first_name'], 'Новое имя')
+
+        response = self.client.post('/api/users/set_password/', {
+            'current_password': 'password', 'new_password': 'Pa55word!'})
+        self.assertEqual(response.status_code, 201)
+        self.assertIsNone(cache.get(user_me_key(self.user.pk)))
+
+    def test_set_password_keeps_counters(self):
+        # Токен уже в кеше, счетчик меняется UPDATE после этого
+        self.client.get('/api/users/me/')
+        recipes_count = User.objects.get(pk=self.user.pk).recipes_count
+        User.objects.filter(pk=self.user.pk).update(
+            recipes_count=F('recipes_count') + 5)
+        response = self.client.post('/api/users/set_password/', {
+            'current_password': 'password', 'new_password': 'Pa55word!'})
+        self.assertEqual(response.status_code, 201)
+        user = User.objects.get(pk=self.user.pk)
+        self.assertEqual(user.recipes_count, recipes_count + 5)
+        self.assertTrue(user.check_password('Pa55word!'))
+
+        cached = copy.copy(user)
+        cached.from_token_cache = True
+        with self.assertRaises(ValueError):
+            cached.save()
+
+    def test_full_save_keeps_shopping_list_version(self):
+        stale = User.objects.get(pk=self.user.pk)
+        User.objects.filter(pk=self.user.pk).update(
+            shopping_list_version=F('shopping_list_version') + 1,
+            followers_count=F('followers_count') + 1)
+        stale.first_name = 'Новое имя'
+        stale.save()
+        user = User.objects.get(pk=self.user.pk)
+        self.assertEqual(user.first_name, 'Новое имя')
+        self.assertEqual(user.shopping_list_version,
+                         stale.shopping_list_version + 1)
+        self.assertEqual(user.followers_count, stale.followers_count + 1)
+
+    def test_me_dropped_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save()
+            # Параллельный запрос закешировал профиль до коммита
+            cache.set(user_me_key(self.user.pk), {'first_name': 'Старое'})
+        self.assertIsNone(cache.get(user_me_key(self.user.pk)))
+
+    def test_subscriptions(self):
+        self.assertPageSizeIndependent(
+            '/api/users/subscriptions/?page=1&recipes_limit=3', budget=5)
+
+    def test_subscriptions_recipes(self):
+        for recipes_limit, expected in (
+                ('3', 3), ('0', 0), ('', RECIPES_PER_AUTHOR)):
+            response = self.client.get(
+                '/api/users/subscriptions/?limit=20'
+                f'&recipes_limit={recipes_limit}')
+            self.assertEqual(response.json()['count'], USERS - 1)
+            for author in response.json()['results']:
+                latest = list(Recipe.objects.filter(
+                    author=author['id']
+                ).order_by('-pub_date', '-id').values_list(
+                    'id', flat=True)[:expected])
+                self.assertEqual(
+                    [recipe['id'] for recipe in author['recipes']], latest)
+                self.assertEqual(author['recipes_count'], RECIPES_PER_AUTHOR)
+                self.assertTrue(author['is_subscribed'])
+
+    def test_subscriptions_timing(self):
+        url = '/api/users/subscriptions/?limit=6&recipes_limit=3'
+        self.measure('subscriptions', ('get', url, {}))
+        self.measure('subscriptions_cursor',
+                     ('get', f'{url}&cursor=', {}))
+
+    def test_subscribe(self):
+        url = f'/api/users/{self.users[1].pk}/subscribe/?recipes_limit=3'
+        # +1 на чистку ленты от рецептов автора
+        self.assertQueryBudget(url, budget=5, method='delete', status=204)
+        self.assertQueryBudget(url, budget=8, method='post', status=201)
+        self.measure('subscribe', ('delete', url, {}), ('post', url, {}))
@@ -11,6 +11,8 @@ import os
 
 from django.core.asgi import get_asgi_application
 
-os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'foodgram.settings')
+# Экспериментальный режим: частые чтения через асинхронные входы
+# (foodgram.asgi_urls), см. foodgram.settings_asgi
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'foodgram.settings_asgi')
 
 application = get_asgi_application()
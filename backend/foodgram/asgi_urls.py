@@ -0,0 +1,19 @@
+"""
+Адреса для ASGI (foodgram/asgi.py): частые чтения идут через
+асинхронные входы api.async_views, все остальное - те же синхронные
+вью, что и под WSGI
+"""
+from django.urls import include, path
+
+from api import async_views
+
+urlpatterns = [
+    path('api/recipes/', async_views.recipes),
+    path('api/recipes/<int:pk>/', async_views.recipe_detail),
+    path('api/tags/', async_views.tags),
+    path('api/tags/<int:pk>/', async_views.tag_detail),
+    path('api/ingredients/', async_views.ingredients),
+    path('api/ingredients/<int:pk>/', async_views.ingredient_detail),
+    path('api/users/me/', async_views.users_me),
+    path('', include('foodgram.urls')),
+]
@@ -0,0 +1,19 @@
+class SyncChainMiddleware:
+    """
+    Только синхронная, стоит последней в MIDDLEWARE. Под ASGI Django
+    4.0 вызывает каждый метод middleware, умеющей оба режима, через
+    отдельный sync_to_async. С синхронной middleware в конце вся
+    цепочка работает в одном потоке: цикл событий -> поток
+    (middleware) -> цикл событий (async_to_sync, асинхронная вью
+    api.async_views) -> поток (sync_to_async во вью). Это два
+    перехода в поток на запрос вместо двух на каждую middleware.
+    Под WSGI ничего не меняет
+    """
+    sync_capable = True
+    async_capable = False
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        return self.get_response(request)
@@ -53,8 +53,10 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'foodgram.middleware.SyncChainMiddleware',
 ]
 
+# Под ASGI - foodgram.asgi_urls (foodgram.settings_asgi)
 ROOT_URLCONF = 'foodgram.urls'
 
 TEMPLATES_DIR = os.path.join(BASE_DIR, 'templates')
@@ -99,6 +101,23 @@ else:
         }
     }
 
+# Кеш общий для всех процессов (воркеры gunicorn, export_worker,
+# команды manage.py): в нем поколения api.cache, по которым
+# сбрасываются кеши счетчиков, справочников и списков покупок.
+# Кеш в памяти процесса - только для ENV=LOCAL (один процесс)
+if os.getenv('ENV') == 'LOCAL':
+    CACHE_BACKEND, CACHE_LOCATION = (
+        'django.core.cache.backends.locmem.LocMemCache', '')
+else:
+    CACHE_BACKEND, CACHE_LOCATION = (
+        'django.core.cache.backends.redis.RedisCache', 'redis://redis:6379')
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', default=CACHE_BACKEND),
+        'LOCATION': os.getenv('CACHE_LOCATION', default=CACHE_LOCATION),
+    }
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.0/ref/settings/#auth-password-validators
@@ -140,6 +159,36 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+# Файлы называются по хешу содержимого и хранятся один раз,
+# неиспользуемые удаляет manage.py gc_media
+DEFAULT_FILE_STORAGE = 'recipes.storage.HashedFileSystemStorage'
+
+# Потоки на процесс для фоновой обработки картинок (recipes.images)
+IMAGE_WORKERS = int(os.getenv('IMAGE_WORKERS', default=2))
+
+# Картинки в multipart-запросах к рецептам пишутся на диск кусками,
+# без буфера в памяти; больше IMAGE_UPLOAD_MAX_SIZE байт загрузка
+# обрывается с 413 (api.uploads, подключается в RecipeViewSet)
+IMAGE_UPLOAD_MAX_SIZE = int(os.getenv('IMAGE_UPLOAD_MAX_SIZE', default=10 * 1024 * 1024))
+
+# Кеш токенов (api.authentication): LRU на процесс и, если задан
+# псевдоним из CACHES, общий кеш между процессами
+TOKEN_CACHE_SIZE = int(os.getenv('TOKEN_CACHE_SIZE', default=10000))
+TOKEN_CACHE_TTL = int(os.getenv('TOKEN_CACHE_TTL', default=60))
+TOKEN_CACHE_ALIAS = os.getenv('TOKEN_CACHE_ALIAS') or None
+
+# Лента подписок (recipes.feed): рецепт раскладывается по лентам
+# подписчиков пачками по FEED_BATCH_SIZE; авторам, у которых больше
+# FEED_FANOUT_LIMIT подписчиков, ленты собираются при чтении.
+# При подписке в ленту попадают FEED_BACKFILL последних рецептов автора
+FEED_FANOUT_LIMIT = int(os.getenv('FEED_FANOUT_LIMIT', default=10000))
+FEED_BATCH_SIZE = int(os.getenv('FEED_BATCH_SIZE', default=1000))
+FEED_BACKFILL = int(os.getenv('FEED_BACKFILL', default=50))
+
+# Под ASGI (api.async_views): сколько запросов одного процесса
+# одновременно работают с базой, остальные ждут в цикле событий
+ASYNC_DB_CONCURRENCY = int(os.getenv('ASYNC_DB_CONCURRENCY', default=20))
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.0/ref/settings/#default-auto-field
 
@@ -150,7 +199,7 @@ AUTH_USER_MODEL = 'users.User'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': ('rest_framework.permissions.AllowAny', ),
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
@@ -0,0 +1,8 @@
+"""
+Настройки для ASGI (foodgram/asgi.py): те же, что foodgram.settings,
+но частые чтения идут через асинхронные входы foodgram.asgi_urls.
+Экспериментально, по умолчанию сервис работает под WSGI
+"""
+from foodgram.settings import *  # noqa: F401,F403
+
+ROOT_URLCONF = 'foodgram.asgi_urls'
@@ -31,7 +31,7 @@ class RecipeAdmin(admin.ModelAdmin):
     list_filter = ('tags', )
 
     def followers(self, obj):
-        return obj.followers.count()
+        return obj.favorites_count
     followers.short_description = 'Количество подписчиков'
 
 
@@ -0,0 +1,49 @@
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+# Счетчик -> (модель со счетчиком, поле, модель связи, FK связи)
+COUNTERS = (
+    ('recipes.Recipe', 'favorites_count', 'recipes.FollowOnRecipe', 'recipe'),
+    ('recipes.Recipe', 'in_carts_count', 'recipes.ShopList', 'recipe'),
+    ('users.User', 'recipes_count', 'recipes.Recipe', 'author'),
+    ('users.User', 'followers_count', 'recipes.FollowOnUser', 'author'),
+)
+
+
+def change_counter(model, pk, field, delta):
+    """
+    Сдвигает счетчик через F(), без чтения строки. Вызывается из
+    сигналов в той же транзакции, что и запись связи
+    """
+    if not delta:
+        return
+    queryset = model.objects.filter(pk=pk)
+    if delta < 0:
+        queryset = queryset.filter(**{f'{field}__gte': -delta})
+    queryset.update(**{field: F(field) + delta})
+
+
+def actual_count(relation, fk):
+    return Coalesce(
+        Subquery(
+            relation.objects.filter(**{fk: OuterRef('pk')})
+            .order_by().values(fk).annotate(total=Count('pk'))
+            .values('total')
+        ),
+        Value(0),
+    )
+
+
+def recount(apps):
+    """
+    Пересчитывает все счетчики одним UPDATE на счетчик, трогая только
+    разошедшиеся строки. Возвращает {поле: число исправленных строк}
+    """
+    fixed = {}
+    for model_label, field, relation_label, fk in COUNTERS:
+        model = apps.get_model(model_label)
+        relation = apps.get_model(relation_label)
+        expression = actual_count(relation, fk)
+        fixed[field] = model.objects.exclude(
+            **{field: expression}).update(**{field: expression})
+    return fixed
@@ -0,0 +1,119 @@
+"""
+Очередь выгрузок в базе: API ставит задание (enqueue), воркер
+(manage.py run_export_worker) забирает пачку (claim) и рендерит
+каждое задание в отдельном процессе (run_job)
+"""
+import tempfile
+from datetime import timedelta
+
+from django.core.files import File
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from api.pdf import render_shopping_list, shopping_list_title
+from recipes.models import ExportJob
+from recipes.shopping import current_version, shopping_list
+from users.models import User
+
+# Сколько хранить готовые выгрузки и ждать зависшие задания
+KEEP_FINISHED = timedelta(hours=24)
+STALE_AFTER = timedelta(minutes=10)
+
+
+def enqueue(user, fmt='pdf'):
+    """
+    Задание для текущей версии списка покупок. Повторный запрос
+    к той же версии вернет то же задание, упавшее - перезапустит
+    """
+    job, created = ExportJob.objects.get_or_create(
+        user=user, format=fmt, version=current_version(user))
+    if job.status == ExportJob.FAILED:
+        ExportJob.objects.filter(
+            pk=job.pk, status=ExportJob.FAILED
+        ).update(status=ExportJob.PENDING, error='')
+        job.status = ExportJob.PENDING
+    return job, created
+
+
+def claim(limit):
+    """
+    Переводит до limit старейших заданий в running и возвращает их id.
+    На Postgres SKIP LOCKED позволяет запускать несколько воркеров
+    """
+    with transaction.atomic():
+        ids = list(ExportJob.objects.select_for_update(
+            skip_locked=True
+        ).filter(status=ExportJob.PENDING).order_by('id').values_list(
+            'id', flat=True)[:limit])
+        ExportJob.objects.filter(pk__in=ids).update(
+            status=ExportJob.RUNNING, started=timezone.now())
+    return ids
+
+
+def requeue_stale(timeout=STALE_AFTER):
+    """Возвращает в очередь задания упавшего воркера"""
+    return ExportJob.objects.filter(
+        status=ExportJob.RUNNING,
+        started__lt=timezone.now() - timeout,
+    ).update(status=ExportJob.PENDING)
+
+
+def snapshot(job):
+    """
+    Строки списка покупок той версии, для которой поставлено задание.
+    Версия сверяется до и после чтения строк: правка списка между
+    постановкой и выполнением ее поднимает, и задание падает, а новый
+    запрос выгрузки поставит задание для новой версии
+    """
+    versions = User.objects.filter(pk=job.user_id).values_list(
+        'shopping_list_version', flat=True)
+    if versions.get() != job.version:
+        raise ValueError('Список покупок изменился, запросите выгрузку '
+                         'заново')
+    rows = list(shopping_list(job.user))
+    if versions.get() != job.version:
+        raise ValueError('Список покупок изменился во время выгрузки, '
+                         'запросите ее заново')
+    return rows
+
+
+def run_job(job_id):
+    """Рендерит задание. Выполняется в процессе пула воркера"""
+    close_old_connections()
+    job = ExportJob.objects.select_related('user').get(pk=job_id)
+    try:
+        rows = snapshot(job)
+        with tempfile.TemporaryFile() as output:
+            render_shopping_list(output, shopping_list_title(job.user),
+                                 rows)
+            job.file.save(f'shopping-list-{job.pk}.pdf', File(output),
+                          save=False)
+    except Exception as error:
+        job.status = ExportJob.FAILED
+        job.error = str(error)
+    else:
+        job.status = ExportJob.DONE
+    job.finished = timezone.now()
+    job.save(update_fields=('file', 'status', 'error', 'finished'))
+    return job.status
+
+
+def fail(job_id, error):
+    ExportJob.objects.filter(pk=job_id, status=ExportJob.RUNNING).update(
+        status=ExportJob.FAILED, error=str(error),
+        finished=timezone.now())
+    return ExportJob.FAILED
+
+
+def cleanup(keep=KEEP_FINISHED):
+    """Удаляет завершенные задания старше keep вместе с файлами"""
+    jobs = ExportJob.objects.filter(
+        status__in=(ExportJob.DONE, ExportJob.FAILED),
+        finished__lt=timezone.now() - keep)
+    for job in jobs.exclude(file=''):
+        # Хранилище по хешу могло отдать этот файл и другому заданию
+        shared = ExportJob.objects.filter(file=job.file.name).exclude(
+            pk__in=jobs.values('pk')).exists()
+        if not shared:
+            job.file.delete(save=False)
+    return jobs.delete()[0]
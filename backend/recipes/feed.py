@@ -0,0 +1,164 @@
+"""
+Лента «рецепты авторов, на которых я подписан».
+
+Fan-out on write: опубликованный рецепт раскладывается по лентам
+подписчиков (FeedEntry) в фоновом потоке после коммита, пачками по
+FEED_BATCH_SIZE строк. Авторы, у которых подписчиков больше
+FEED_FANOUT_LIMIT, в ленты не пишутся: их рецепты подмешиваются при
+чтении (fan-out on read). Подписка добавляет в ленту последние рецепты
+автора, отписка их удаляет.
+
+Страница ленты - диапазон индекса feedentry_user_pub_date_idx от
+курсора (pub_date, id) плюс рецепты «больших» авторов по индексу
+recipe_author_pub_date_idx, поэтому ее цена не зависит от числа
+подписок
+"""
+import itertools
+import logging
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+
+from recipes.models import FeedEntry, FollowOnUser, Recipe
+
+logger = logging.getLogger(__name__)
+
+
+def batches(iterable, size):
+    iterable = iter(iterable)
+    while True:
+        batch = list(itertools.islice(iterable, size))
+        if not batch:
+            return
+        yield batch
+
+
+def fan_out(recipe_id):
+    """Раскладывает рецепт по лентам подписчиков автора"""
+    recipe = Recipe.objects.filter(pk=recipe_id).values(
+        'author_id', 'pub_date', 'author__followers_count').first()
+    if (recipe is None
+            or recipe['author__followers_count'] > settings.FEED_FANOUT_LIMIT):
+        return 0
+    followers = FollowOnUser.objects.filter(
+        author_id=recipe['author_id']
+    ).order_by().values_list('user_id', flat=True).iterator(
+        chunk_size=settings.FEED_BATCH_SIZE)
+    written = 0
+    for batch in batches(followers, settings.FEED_BATCH_SIZE):
+        FeedEntry.objects.bulk_create(
+            (FeedEntry(user_id=user_id, recipe_id=recipe_id,
+                       author_id=recipe['author_id'],
+                       pub_date=recipe['pub_date'])
+             for user_id in batch),
+            ignore_conflicts=True)
+        written += len(batch)
+    return written
+
+
+def fill(follows):
+    """
+    Добавляет в ленты по подпискам follows (queryset FollowOnUser)
+    FEED_BACKFILL последних рецептов каждого автора
+    """
+    authors = follows.filter(
+        author__followers_count__lte=settings.FEED_FANOUT_LIMIT
+    ).order_by().values_list('author_id', flat=True).distinct()
+    written = 0
+    for chunk in batches(authors.iterator(), settings.FEED_BATCH_SIZE):
+        latest = defaultdict(list)
+        for recipe in Recipe.objects.only(
+                'id', 'author_id', 'pub_date').latest_by_author(
+                chunk, settings.FEED_BACKFILL):
+            latest[recipe.author_id].append(recipe)
+        pairs = follows.filter(author_id__in=chunk).order_by().values_list(
+            'user_id', 'author_id').iterator()
+        entries = (
+            FeedEntry(user_id=user_id, recipe_id=recipe.pk,
+                      author_id=author_id, pub_date=recipe.pub_date)
+            for user_id, author_id in pairs
+            for recipe in latest[author_id]
+        )
+        for batch in batches(entries, settings.FEED_BATCH_SIZE):
+            FeedEntry.objects.bulk_create(batch, ignore_conflicts=True)
+            written += len(batch)
+    return written
+
+
+def rebuild(user_ids=None):
+    """
+    Пересобирает ленты пользователей user_ids (None - всех) из
+    подписок. Нужна после массовых вставок в обход сигналов
+    """
+    entries = FeedEntry.objects.all()
+    follows = FollowOnUser.objects.all()
+    if user_ids is not None:
+        entries = entries.filter(user_id__in=user_ids)
+        follows = follows.filter(user_id__in=user_ids)
+    entries.delete()
+    return fill(follows)
+
+
+def prune(user_id, author_id):
+    """Отписка: рецепты автора уходят из ленты"""
+    return FeedEntry.objects.filter(
+        user_id=user_id, author_id=author_id).delete()[0]
+
+
+def read(user, position=None, limit=6):
+    """
+    До limit пар (pub_date, id) рецептов ленты старше position,
+    от новых к старым
+    """
+    entries = FeedEntry.objects.filter(user=user)
+    pulled = Recipe.objects.filter(author__in=FollowOnUser.objects.filter(
+        user=user,
+        author__followers_count__gt=settings.FEED_FANOUT_LIMIT,
+    ).values('author'))
+    if position is not None:
+        pub_date, pk = position
+        entries = entries.filter(
+            Q(pub_date__lt=pub_date) | Q(pub_date=pub_date, recipe_id__lt=pk))
+        pulled = pulled.filter(
+            Q(pub_date__lt=pub_date) | Q(pub_date=pub_date, id__lt=pk))
+    rows = set(entries.order_by('-pub_date', '-recipe_id').values_list(
+        'pub_date', 'recipe_id')[:limit])
+    # Автор мог стать «большим» уже после раскладки: дубли схлопываются
+    rows.update(pulled.order_by('-pub_date', '-id').values_list(
+        'pub_date', 'id')[:limit])
+    return sorted(rows, reverse=True)[:limit]
+
+
+def run(task, *args):
+    try:
+        task(*args)
+    except Exception:
+        logger.exception('Не удалось обновить ленты: %s%s',
+                         task.__name__, args)
+    finally:
+        # Поток пула держит свое соединение с базой
+        connection.close()
+
+
+class FeedPool:
+    """
+    Один фоновый поток на процесс: раскладка идет после ответа
+    и не конкурирует сама с собой за строки FeedEntry
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.executor = None
+
+    def submit(self, task, *args):
+        with self.lock:
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(
+                    max_workers=1, thread_name_prefix='feed')
+        return self.executor.submit(run, task, *args)
+
+
+feed_pool = FeedPool()
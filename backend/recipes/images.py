@@ -0,0 +1,123 @@
+import logging
+import os
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from PIL import Image, ImageOps
+from recipes.models import Recipe
+from recipes.storage import change_refcounts, recipe_files
+
+logger = logging.getLogger(__name__)
+
+# Вариант -> ширина в пикселях. Меньшие картинки не растягиваются
+VARIANTS = {
+    'thumbnail': 320,
+    'card': 640,
+}
+# Формат -> (расширение, параметры сохранения Pillow)
+FORMATS = {
+    'webp': ('webp', {'format': 'WEBP', 'quality': 80, 'method': 4}),
+    'jpeg': ('jpg', {'format': 'JPEG', 'quality': 82, 'optimize': True,
+                     'progressive': True}),
+}
+VARIANTS_DIR = 'recipes/variants/'
+
+
+def variant_name(source, variant, fmt):
+    stem = os.path.splitext(os.path.basename(source))[0]
+    return f'{VARIANTS_DIR}{stem}_{variant}.{FORMATS[fmt][0]}'
+
+
+def build_variants(source, storage=default_storage):
+    """
+    Строит все варианты картинки source и кладет их в storage.
+    Возвращает словарь для Recipe.image_variants. Рецепты не трогает
+    (в базу пишет только storage - строку MediaBlob), поэтому годится
+    и для потоков, и для отдельных процессов. Старые варианты здесь
+    не удаляются: ссылки на них снимает save_variants, файлы - gc_media
+    """
+    with storage.open(source, 'rb') as file:
+        image = Image.open(file)
+        image = ImageOps.exif_transpose(image)
+        image.load()
+    variants = {'source': source}
+    for variant, width in VARIANTS.items():
+        resized = image
+        if image.width > width:
+            height = round(image.height * width / image.width)
+            resized = image.resize((width, height), Image.LANCZOS)
+        variants[variant] = {}
+        for fmt, (_, options) in FORMATS.items():
+            frame = resized
+            if fmt == 'jpeg' and frame.mode != 'RGB':
+                frame = frame.convert('RGB')
+            elif frame.mode not in ('RGB', 'RGBA'):
+                frame = frame.convert('RGBA')
+            buffer = BytesIO()
+            frame.save(buffer, **options)
+            variants[variant][fmt] = storage.save(
+                variant_name(source, variant, fmt),
+                ContentFile(buffer.getvalue()))
+    return variants
+
+
+def save_variants(recipe_ids, variants):
+    """
+    Записывает варианты рецептам, у которых картинку не успели
+    поменять, пока они строились. update() не шлет post_save,
+    поэтому ссылки на файлы пересчитываются здесь же
+    """
+    with transaction.atomic():
+        rows = list(Recipe.objects.select_for_update().filter(
+            pk__in=recipe_ids, image=variants['source']
+        ).values_list('pk', 'image_variants'))
+        if not rows:
+            return 0
+        Recipe.objects.filter(
+            pk__in=[pk for pk, _ in rows]
+        ).update(image_variants=variants)
+        new = recipe_files(None, variants)
+        delta = Counter()
+        for _, image_variants in rows:
+            old = recipe_files(None, image_variants)
+            delta.update(new - old)
+            delta.subtract(old - new)
+        change_refcounts(delta)
+    return len(rows)
+
+
+def process_recipe_image(recipe_id, source):
+    try:
+        save_variants([recipe_id], build_variants(source))
+    except Exception:
+        logger.exception('Не удалось построить варианты %s', source)
+    finally:
+        # Поток пула держит свое соединение с базой
+        connection.close()
+
+
+class ImagePool:
+    """
+    Локальный пул потоков процесса. Pillow отпускает GIL на сжатии
+    и масштабировании, так что потоки не мешают обработке запросов
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.executor = None
+
+    def submit(self, recipe_id, source):
+        with self.lock:
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(
+                    max_workers=settings.IMAGE_WORKERS,
+                    thread_name_prefix='image')
+        return self.executor.submit(process_recipe_image, recipe_id, source)
+
+
+image_pool = ImagePool()
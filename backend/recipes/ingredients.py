@@ -0,0 +1,98 @@
+"""
+Импорт справочника ингредиентов из CSV (name,measurement_unit) или
+JSON (массив объектов с теми же ключами). Файл читается потоком
+и пишется пачками: на пачку один SELECT существующих ключей и один
+INSERT недостающих. Существующие строки не трогаются и не удаляются,
+поэтому импорт можно повторять на живой базе
+"""
+import csv
+import itertools
+import json
+import re
+from collections import Counter
+
+from recipes.models import Ingredient
+
+NAME_LENGTH = Ingredient._meta.get_field('name').max_length
+UNIT_LENGTH = Ingredient._meta.get_field('measurement_unit').max_length
+SEPARATOR = re.compile(r'[ \t\n\r]*,?[ \t\n\r]*')
+
+
+def read_csv(file):
+    yield from csv.DictReader(file)
+
+
+def read_json(file, size=64 * 1024):
+    """
+    Элементы JSON-массива по одному, не загружая файл целиком:
+    буфер дочитывается, пока очередной элемент не разберется
+    """
+    decoder = json.JSONDecoder()
+    buffer = file.read(size).lstrip()
+    if not buffer.startswith('['):
+        raise ValueError('Ожидался JSON-массив')
+    position, eof = 1, False
+    while True:
+        position = SEPARATOR.match(buffer, position).end()
+        if buffer.startswith(']', position):
+            return
+        try:
+            item, position = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            chunk = file.read(size)
+            eof = not chunk
+            buffer, position = buffer[position:] + chunk, 0
+        else:
+            yield item
+
+
+READERS = {'csv': read_csv, 'json': read_json}
+
+
+def clean(row):
+    """Ключ (name, measurement_unit) или None для битой строки"""
+    if not isinstance(row, dict):
+        return None
+    name = (row.get('name') or '').strip()
+    unit = (row.get('measurement_unit') or '').strip()
+    if (not name or not unit
+            or len(name) > NAME_LENGTH or len(unit) > UNIT_LENGTH):
+        return None
+    return name, unit
+
+
+def import_ingredients(rows, chunk_size=1000):
+    """
+    Добавляет ингредиенты, которых еще нет. Возвращает Counter:
+    inserted - добавлено, existing - уже были (в базе или выше
+    в файле), invalid - битые строки
+    """
+    stats = Counter()
+    rows = iter(rows)
+    while True:
+        chunk = list(itertools.islice(rows, chunk_size))
+        if not chunk:
+            return stats
+        keys = []
+        for row in chunk:
+            key = clean(row)
+            if key is None:
+                stats['invalid'] += 1
+            else:
+                keys.append(key)
+        unique = dict.fromkeys(keys)
+        stats['existing'] += len(keys) - len(unique)
+        existing = set(Ingredient.objects.filter(
+            name__in={name for name, _ in unique},
+            measurement_unit__in={unit for _, unit in unique},
+        ).values_list('name', 'measurement_unit').iterator())
+        new = [key for key in unique if key not in existing]
+        stats['existing'] += len(unique) - len(new)
+        # ignore_conflicts: строку мог успеть добавить админ
+        Ingredient.objects.bulk_create(
+            (Ingredient(name=name, measurement_unit=unit)
+             for name, unit in new),
+            ignore_conflicts=True)
+        stats['inserted'] += len(new)
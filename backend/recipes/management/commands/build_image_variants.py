@@ -0,0 +1,62 @@
+import os
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import connections
+from recipes.images import build_variants, save_variants
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    """
+    python manage.py build_image_variants --workers 8
+
+    Достраивает варианты картинок для рецептов, загруженных до
+    фоновой обработки. Картинки разбираются процессами по всем ядрам,
+    рецепты обновляет только основной процесс
+    """
+    help = 'Строит уменьшенные копии картинок рецептов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count())
+        parser.add_argument('--force', action='store_true',
+                            help='Перестроить и актуальные варианты')
+
+    def handle(self, *args, **options):
+        # Одна картинка может быть у многих рецептов, строим ее один раз
+        pending = defaultdict(list)
+        recipes = Recipe.objects.exclude(image='').values_list(
+            'pk', 'image', 'image_variants')
+        for pk, source, variants in recipes.iterator():
+            if options['force'] or variants.get('source') != source:
+                pending[source].append(pk)
+        if not pending:
+            self.stdout.write('Все варианты актуальны')
+            return
+
+        # Дочерним процессам не должны достаться открытые соединения
+        connections.close_all()
+        started = time.perf_counter()
+        built = failed = 0
+        with ProcessPoolExecutor(max_workers=options['workers'],
+                                 initializer=django.setup) as executor:
+            futures = {executor.submit(build_variants, source): source
+                       for source in pending}
+            for future in as_completed(futures):
+                source = futures[future]
+                try:
+                    variants = future.result()
+                except Exception as error:
+                    failed += 1
+                    self.stderr.write(f'{source}: {error}')
+                    continue
+                save_variants(pending[source], variants)
+                built += 1
+        elapsed = time.perf_counter() - started
+        rate = built / elapsed if elapsed else built
+        self.stdout.write(self.style.SUCCESS(
+            f'Картинок: {built}, ошибок: {failed}, '
+            f'{elapsed:.1f} с ({rate:.1f} картинок/с)'))
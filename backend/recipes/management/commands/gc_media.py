@@ -0,0 +1,96 @@
+import posixpath
+from datetime import timedelta
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from recipes.models import MediaBlob
+from recipes.storage import recount_refs
+
+
+class Command(BaseCommand):
+    """
+    python manage.py gc_media --scan
+
+    Удаляет файлы, на которые не ссылается ни один рецепт. Файл
+    должен пролежать без ссылок не меньше --grace-hours: так не
+    пострадают загрузки, чья транзакция еще не закоммичена.
+    Строка MediaBlob блокируется (select_for_update), refcount
+    проверяется заново, и файл удаляется только после строки -
+    под той же блокировкой, которую ждет загрузка того же файла
+    (HashedFileSystemStorage._save)
+    """
+    help = 'Удаляет из хранилища файлы без ссылок'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--grace-hours', type=float, default=24)
+        parser.add_argument('--scan', action='store_true',
+                            help='Искать и файлы, которых нет в MediaBlob '
+                                 '(загруженные до хранилища по хешу); они '
+                                 'регистрируются и удаляются следующим '
+                                 'запуском после --grace-hours')
+        parser.add_argument('--dry-run', action='store_true')
+
+    def handle(self, *args, **options):
+        deadline = timezone.now() - timedelta(hours=options['grace_hours'])
+        with transaction.atomic():
+            counts = recount_refs()
+
+        candidates = list(MediaBlob.objects.filter(
+            refcount=0, updated__lt=deadline
+        ).values_list('name', flat=True))
+        orphans = []
+        if options['scan']:
+            known = set(MediaBlob.objects.values_list('name', flat=True))
+            orphans = [name for name in self.walk('recipes')
+                       if name not in known]
+
+        if options['dry_run']:
+            unused = set(candidates) | {
+                name for name in orphans
+                if default_storage.get_modified_time(name) < deadline}
+            freed = sum(default_storage.size(name) for name in unused
+                        if default_storage.exists(name))
+        else:
+            # Файлы без строки получают строку с refcount=0 и
+            # отсчетом --grace-hours от текущего момента
+            MediaBlob.objects.bulk_create(
+                (MediaBlob(name=name) for name in orphans),
+                batch_size=1000, ignore_conflicts=True)
+            unused, freed = set(), 0
+            for name in candidates:
+                size = self.collect(name, deadline)
+                if size is not None:
+                    unused.add(name)
+                    freed += size
+
+        verb = 'Будет удалено' if options['dry_run'] else 'Удалено'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} файлов: {len(unused)}, {freed / 1024 / 1024:.1f} МБ; '
+            f'файлов со ссылками: {len(counts)}'))
+
+    @staticmethod
+    def collect(name, deadline):
+        """
+        Удаляет строку и файл, если на файл так и нет ссылок.
+        Возвращает размер удаленного файла или None
+        """
+        with transaction.atomic():
+            blob = MediaBlob.objects.select_for_update().filter(
+                name=name, refcount=0, updated__lt=deadline).first()
+            if blob is None:
+                return None
+            blob.delete()
+            if not default_storage.exists(name):
+                return 0
+            size = default_storage.size(name)
+            default_storage.delete(name)
+        return size
+
+    def walk(self, path):
+        directories, files = default_storage.listdir(path)
+        for name in files:
+            yield posixpath.join(path, name)
+        for directory in directories:
+            yield from self.walk(posixpath.join(path, directory))
@@ -0,0 +1,57 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from api.cache import bump_catalog_version
+from recipes.ingredients import READERS, import_ingredients
+
+
+class Command(BaseCommand):
+    """
+    python manage.py import_ingredients data/ingredients.csv
+
+    Добавляет недостающие ингредиенты из CSV или JSON. Уже
+    существующие (по name и measurement_unit) остаются как есть,
+    повторный запуск ничего не меняет
+    """
+    help = 'Импортирует справочник ингредиентов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?',
+                            default='data/ingredients.csv')
+        parser.add_argument('--format', choices=READERS,
+                            help='По умолчанию - по расширению файла')
+        parser.add_argument('--chunk-size', type=int, default=1000)
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Посчитать, но откатить изменения')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or os.path.splitext(path)[1][1:].lower()
+        if fmt not in READERS:
+            raise CommandError(f'Неизвестный формат файла: {path}')
+
+        started = time.perf_counter()
+        try:
+            with open(path, encoding='utf-8', newline='') as file:
+                with transaction.atomic():
+                    stats = import_ingredients(READERS[fmt](file),
+                                               options['chunk_size'])
+                    if options['dry_run']:
+                        transaction.set_rollback(True)
+                    elif stats['inserted']:
+                        # bulk_create не отправляет post_save
+                        bump_catalog_version('ingredients')
+        except (OSError, ValueError) as error:
+            raise CommandError(f'{path}: {error}')
+        elapsed = time.perf_counter() - started
+
+        total = sum(stats.values())
+        rate = total / elapsed if elapsed else total
+        verb = 'Будет добавлено' if options['dry_run'] else 'Добавлено'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb}: {stats["inserted"]}, уже были: {stats["existing"]}, '
+            f'пропущено битых строк: {stats["invalid"]}; {total} строк '
+            f'за {elapsed:.2f} с ({rate:.0f} строк/с)'))
@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from recipes.feed import rebuild
+
+
+class Command(BaseCommand):
+    """
+    python manage.py rebuild_feeds
+
+    Собирает ленты подписок заново: после миграции, массовой загрузки
+    подписок в обход сигналов или если фоновая раскладка не успела
+    до перезапуска процесса
+    """
+    help = 'Пересобирает ленты подписок'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append',
+                            dest='users', help='id пользователя, можно '
+                                               'несколько раз')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        with transaction.atomic():
+            written = rebuild(options['users'])
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Записей в лентах: {written} за {elapsed:.1f} с'))
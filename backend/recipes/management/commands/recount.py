@@ -0,0 +1,21 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from recipes.counters import recount
+from recipes.shopping import rebuild
+
+
+class Command(BaseCommand):
+    """
+    python manage.py recount
+    """
+    help = 'Пересчитывает денормализованные счетчики избранного, ' \
+           'корзин, рецептов и подписчиков и списки покупок'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            fixed = recount(apps)
+            rebuild()
+        for field, rows in fixed.items():
+            self.stdout.write(f'{field}: исправлено строк - {rows}')
+        self.stdout.write('списки покупок пересобраны')
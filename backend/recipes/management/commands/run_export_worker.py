@@ -0,0 +1,66 @@
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import connections
+from recipes import exports
+
+
+class Command(BaseCommand):
+    """
+    python manage.py run_export_worker --workers 4
+
+    Забирает задания выгрузки из базы и рендерит их в пуле процессов,
+    не занимая воркеры gunicorn. Несколько таких команд можно
+    запускать параллельно (на Postgres задания делятся через
+    SKIP LOCKED)
+    """
+    help = 'Обрабатывает очередь выгрузок списков покупок'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count())
+        parser.add_argument('--interval', type=float, default=1.0,
+                            help='Пауза между опросами очереди, с')
+        parser.add_argument('--once', action='store_true',
+                            help='Разобрать очередь и выйти')
+
+    def handle(self, *args, **options):
+        requeued = exports.requeue_stale()
+        if requeued:
+            self.stdout.write(f'Возвращено в очередь: {requeued}')
+        workers = options['workers']
+        running = {}
+        last_cleanup = 0
+        # Дочерним процессам не должны достаться открытые соединения
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=workers,
+                                 initializer=django.setup) as executor:
+            while True:
+                claimed = exports.claim(workers - len(running))
+                for job_id in claimed:
+                    future = executor.submit(exports.run_job, job_id)
+                    running[future] = (job_id, time.perf_counter())
+
+                if not running:
+                    if options['once']:
+                        break
+                    if time.monotonic() - last_cleanup > 3600:
+                        exports.cleanup()
+                        last_cleanup = time.monotonic()
+                    time.sleep(options['interval'])
+                    continue
+
+                done, _ = wait(running, timeout=options['interval'],
+                               return_when=FIRST_COMPLETED)
+                for future in done:
+                    job_id, started = running.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception as error:
+                        # Процесс пула упал, run_job не успел записать
+                        result = exports.fail(job_id, error)
+                    self.stdout.write(
+                        f'задание {job_id}: {result}, '
+                        f'{time.perf_counter() - started:.2f} с')
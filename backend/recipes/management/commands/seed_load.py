@@ -0,0 +1,262 @@
+import itertools
+import json
+import random
+import time
+from bisect import bisect_left
+
+from django.apps import apps
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from recipes.counters import recount
+from recipes import feed
+from recipes.shopping import rebuild
+from recipes.models import (FollowOnRecipe, FollowOnUser, Ingredient,
+                            IngredientAmount, Recipe, ShopList, Tag)
+from users.models import User
+
+DEFAULT_TAGS = (
+    ('Завтрак', '#E26C2D', 'breakfast'),
+    ('Обед', '#49B64E', 'lunch'),
+    ('Ужин', '#8775D2', 'dinner'),
+)
+
+
+class Zipf:
+    """
+    Выбор элементов с распределением Ципфа: первый элемент популярнее
+    всех, k-й выбирается в k**s раз реже
+    """
+    def __init__(self, population, rng, s=1.1):
+        self.population = population
+        self.rng = rng
+        total = 0
+        self.cum_weights = []
+        for rank in range(1, len(population) + 1):
+            total += 1 / rank ** s
+            self.cum_weights.append(total)
+        self.total = total
+
+    def choice(self):
+        point = self.rng.random() * self.total
+        return self.population[bisect_left(self.cum_weights, point)]
+
+    def sample(self, k):
+        """k разных элементов, популярные попадают чаще"""
+        k = min(k, len(self.population) // 2)
+        chosen = set()
+        while len(chosen) < k:
+            chosen.add(self.choice())
+        return chosen
+
+
+class Command(BaseCommand):
+    """
+    python manage.py seed_load --users 50000 --recipes 100000 --seed 1
+
+    Повторный запуск с тем же seed не создает дубликатов. Случайные
+    числа тратятся на все объекты и связи, как при запуске с нуля, а
+    вставляются только связи, у которых хотя бы один конец создан этим
+    запуском: новые рецепты и пользователи получают те же связи, что
+    при запуске с нуля с теми же параметрами, связи прошлых запусков
+    не трогаются
+    """
+    help = 'Генерирует синтетические данные для нагрузочного тестирования'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=5000)
+        parser.add_argument('--ingredients-per-recipe', type=int, default=8)
+        parser.add_argument('--favorites', type=int, default=20,
+                            help='Среднее число избранных на пользователя')
+        parser.add_argument('--carts', type=int, default=5,
+                            help='Среднее число рецептов в корзине')
+        parser.add_argument('--subscriptions', type=int, default=10,
+                            help='Среднее число подписок на пользователя')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--ingredients-file',
+                            default='data/ingredients.json')
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.prefix = f'seed{options["seed"]}'
+        started = time.perf_counter()
+
+        ingredient_ids = self.load_ingredients(options['ingredients_file'])
+        tag_ids = self.load_tags()
+        user_ids, self.new_user_ids = self.create_users(options['users'])
+        recipe_ids, self.new_recipe_ids = self.create_recipes(
+            user_ids, options['recipes'])
+
+        self.bulk(
+            Recipe.tags.through,
+            self.recipe_tags(recipe_ids, tag_ids),
+            'теги рецептов')
+        self.bulk(
+            IngredientAmount,
+            self.ingredient_amounts(
+                recipe_ids, ingredient_ids,
+                options['ingredients_per_recipe']),
+            'ингредиенты рецептов')
+
+        popular_recipes = Zipf(recipe_ids, self.rng)
+        self.bulk(
+            FollowOnRecipe,
+            self.pairs(FollowOnRecipe, 'recipe_id', user_ids,
+                       popular_recipes, options['favorites']),
+            'избранное')
+        self.bulk(
+            ShopList,
+            self.pairs(ShopList, 'recipe_id', user_ids,
+                       popular_recipes, options['carts']),
+            'списки покупок')
+        self.bulk(
+            FollowOnUser,
+            self.pairs(FollowOnUser, 'author_id', user_ids,
+                       Zipf(user_ids, self.rng), options['subscriptions']),
+            'подписки')
+
+        # bulk_create не отправляет сигналы, счетчики, списки
+        # покупок и ленты подписок считаем разом
+        started_recount = time.perf_counter()
+        with transaction.atomic():
+            recount(apps)
+            rebuild()
+            feed.rebuild()
+        self.stdout.write(
+            f'счетчики: {time.perf_counter() - started_recount:.1f} с')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово за {time.perf_counter() - started:.1f} с'))
+
+    def bulk(self, model, objects, label):
+        """
+        Вставляет объекты пачками по batch_size, каждая пачка
+        в своей транзакции. Добавленные строки считаются по таблице:
+        ignore_conflicts молча пропускает уже существующие
+        """
+        started = time.perf_counter()
+        before = model.objects.count()
+        processed = 0
+        while True:
+            batch = list(itertools.islice(objects, self.batch_size))
+            if not batch:
+                break
+            with transaction.atomic():
+                model.objects.bulk_create(
+                    batch, batch_size=self.batch_size,
+                    ignore_conflicts=True)
+            processed += len(batch)
+        inserted = model.objects.count() - before
+        elapsed = time.perf_counter() - started
+        rate = processed / elapsed if elapsed else processed
+        self.stdout.write(
+            f'{label}: добавлено {inserted} строк из {processed} за '
+            f'{elapsed:.1f} с ({rate:.0f} строк/с)')
+
+    def load_ingredients(self, file_path):
+        if not Ingredient.objects.exists():
+            with open(file_path, encoding='utf-8') as file:
+                data = json.load(file)
+            self.bulk(
+                Ingredient,
+                (Ingredient(name=item['name'],
+                            measurement_unit=item['measurement_unit'])
+                 for item in data),
+                'ингредиенты')
+        return list(Ingredient.objects.values_list('id', flat=True))
+
+    def load_tags(self):
+        if not Tag.objects.exists():
+            self.bulk(
+                Tag,
+                (Tag(name=name, color=color, slug=slug)
+                 for name, color, slug in DEFAULT_TAGS),
+                'теги')
+        return list(Tag.objects.values_list('id', flat=True))
+
+    def create_users(self, count):
+        """Все пользователи этого seed и созданные этим запуском"""
+        users = User.objects.filter(
+            username__startswith=f'{self.prefix}_user'
+        ).order_by('id').values_list('id', flat=True)
+        loaded = set(users)
+        # Хешировать пароль для каждого пользователя слишком долго
+        password = make_password('password')
+        self.bulk(
+            User,
+            (User(username=f'{self.prefix}_user{i}',
+                  email=f'{self.prefix}_user{i}@foodgram.ru',
+                  first_name='Имя', last_name='Фамилия',
+                  password=password)
+             for i in range(count)),
+            'пользователи')
+        user_ids = list(users.all())
+        return user_ids, set(user_ids) - loaded
+
+    def create_recipes(self, user_ids, count):
+        """Все рецепты этого seed и созданные этим запуском"""
+        recipes = Recipe.objects.filter(
+            name__startswith=f'{self.prefix} рецепт'
+        ).order_by('id')
+        loaded = dict(recipes.values_list('name', 'id'))
+        self.bulk(Recipe, self.new_recipes(user_ids, count, loaded),
+                  'рецепты')
+        recipe_ids = list(recipes.values_list('id', flat=True))
+        return recipe_ids, set(recipe_ids) - set(loaded.values())
+
+    def new_recipes(self, user_ids, count, loaded):
+        """
+        У Recipe нет уникального ключа, поэтому рецепты, загруженные
+        прошлым запуском с этим seed, пропускаются по имени. Случайные
+        числа тратятся и на них, чтобы новые рецепты вышли те же, что
+        при запуске с нуля
+        """
+        # Немногие активные авторы пишут большую часть рецептов
+        authors = Zipf(user_ids, self.rng, s=0.8)
+        for i in range(count):
+            recipe = Recipe(author_id=authors.choice(),
+                            name=f'{self.prefix} рецепт {i}',
+                            image='recipes/seed.png',
+                            text='Описание рецепта',
+                            cooking_time=self.rng.randint(5, 180))
+            if recipe.name not in loaded:
+                yield recipe
+
+    def recipe_tags(self, recipe_ids, tag_ids):
+        through = Recipe.tags.through
+        for recipe_id in recipe_ids:
+            count = self.rng.randint(1, len(tag_ids))
+            tags = self.rng.sample(tag_ids, count)
+            if recipe_id in self.new_recipe_ids:
+                for tag_id in tags:
+                    yield through(recipe_id=recipe_id, tag_id=tag_id)
+
+    def ingredient_amounts(self, recipe_ids, ingredient_ids, average):
+        popular_ingredients = Zipf(ingredient_ids, self.rng, s=0.9)
+        for recipe_id in recipe_ids:
+            count = max(1, int(self.rng.expovariate(1 / average)))
+            for ingredient_id in popular_ingredients.sample(count):
+                amount = self.rng.randint(1, 500)
+                if recipe_id in self.new_recipe_ids:
+                    yield IngredientAmount(recipe_id=recipe_id,
+                                           ingredient_id=ingredient_id,
+                                           amount=amount)
+
+    def pairs(self, model, field, user_ids, targets, average):
+        """
+        Связи пользователь -> объект: число связей у пользователя
+        экспоненциальное, объекты выбираются по Ципфу
+        """
+        new_targets = (self.new_user_ids if field == 'author_id'
+                       else self.new_recipe_ids)
+        for user_id in user_ids:
+            count = int(self.rng.expovariate(1 / average)) if average else 0
+            for target_id in targets.sample(count):
+                if field == 'author_id' and target_id == user_id:
+                    continue
+                if (user_id in self.new_user_ids
+                        or target_id in new_targets):
+                    yield model(user_id=user_id, **{field: target_id})
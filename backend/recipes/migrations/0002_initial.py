@@ -0,0 +1,84 @@
+# Generated by Django 4.0.2 on 2026-10-18 20:15
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipes', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='shoplist',
+            name='user',
+            field=models.ForeignKey(help_text='В списке покупок', on_delete=django.db.models.deletion.CASCADE, related_name='shoplist', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='author',
+            field=models.ForeignKey(help_text='Выбери автора рецепта', on_delete=django.db.models.deletion.CASCADE, related_name='recipes', to=settings.AUTH_USER_MODEL, verbose_name='Автор рецепта'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='ingredients',
+            field=models.ManyToManyField(related_name='recipes', through='recipes.IngredientAmount', to='recipes.Ingredient', verbose_name='Ингредиенты'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='tags',
+            field=models.ManyToManyField(related_name='recipes', to='recipes.Tag', verbose_name='Теги'),
+        ),
+        migrations.AddField(
+            model_name='ingredientamount',
+            name='ingredient',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ingredient_amounts', to='recipes.ingredient', verbose_name='Ингредиенты'),
+        ),
+        migrations.AddField(
+            model_name='ingredientamount',
+            name='recipe',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ingredient_amounts', to='recipes.recipe', verbose_name='Рецепты'),
+        ),
+        migrations.AddField(
+            model_name='followonuser',
+            name='author',
+            field=models.ForeignKey(help_text='На какого автора подписан', on_delete=django.db.models.deletion.CASCADE, related_name='followers', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='followonuser',
+            name='user',
+            field=models.ForeignKey(help_text='Кто подписан', on_delete=django.db.models.deletion.CASCADE, related_name='following', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='followonrecipe',
+            name='recipe',
+            field=models.ForeignKey(help_text='На какой рецепт подписан', on_delete=django.db.models.deletion.CASCADE, related_name='followers', to='recipes.recipe'),
+        ),
+        migrations.AddField(
+            model_name='followonrecipe',
+            name='user',
+            field=models.ForeignKey(help_text='Кто подписан', on_delete=django.db.models.deletion.CASCADE, related_name='following_recipe', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddConstraint(
+            model_name='shoplist',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='user_recipe_shoplist_relations'),
+        ),
+        migrations.AddConstraint(
+            model_name='ingredientamount',
+            constraint=models.UniqueConstraint(fields=('ingredient', 'recipe'), name='ingredient_recipe_relations'),
+        ),
+        migrations.AddConstraint(
+            model_name='followonuser',
+            constraint=models.UniqueConstraint(fields=('user', 'author'), name='user_author_relations'),
+        ),
+        migrations.AddConstraint(
+            model_name='followonrecipe',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='user_recipe_relations'),
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 4.0.2 on 2026-10-18 20:27
+
+from django.db import migrations, models
+from recipes.operations import AddIndexOnline, RunSQLPostgres
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY нельзя выполнять в транзакции
+    atomic = False
+
+    dependencies = [
+        ('recipes', '0002_initial'),
+    ]
+
+    operations = [
+        # EXISTS (SELECT 1 FROM recipes_followonrecipe
+        #         WHERE recipe_id = recipes_recipe.id AND user_id = %s)
+        # и подсчет добавлений в избранное по recipe_id
+        AddIndexOnline(
+            model_name='followonrecipe',
+            index=models.Index(fields=['recipe', 'user'], name='followonrecipe_recipe_user_idx'),
+        ),
+        # SELECT ... FROM recipes_recipe
+        # ORDER BY pub_date DESC, id DESC LIMIT 6 OFFSET ...
+        AddIndexOnline(
+            model_name='recipe',
+            index=models.Index(fields=['-pub_date', '-id'], name='recipe_pub_date_idx'),
+        ),
+        # SELECT ... FROM recipes_recipe WHERE author_id = %s
+        # ORDER BY pub_date DESC LIMIT %s
+        AddIndexOnline(
+            model_name='recipe',
+            index=models.Index(fields=['author', '-pub_date'], name='recipe_author_pub_date_idx'),
+        ),
+        # EXISTS (SELECT 1 FROM recipes_shoplist
+        #         WHERE recipe_id = recipes_recipe.id AND user_id = %s)
+        AddIndexOnline(
+            model_name='shoplist',
+            index=models.Index(fields=['recipe', 'user'], name='shoplist_recipe_user_idx'),
+        ),
+        # /api/ingredients/?name=x:
+        # WHERE UPPER(name::text) LIKE UPPER('x%')
+        # text_pattern_ops нужен, чтобы LIKE по префиксу шел по индексу
+        # при любой локали базы
+        RunSQLPostgres(
+            sql='CREATE INDEX CONCURRENTLY IF NOT EXISTS '
+                'ingredient_name_prefix_idx ON recipes_ingredient '
+                '(UPPER(name::text) text_pattern_ops);',
+            reverse_sql='DROP INDEX CONCURRENTLY IF EXISTS '
+                        'ingredient_name_prefix_idx;',
+        ),
+    ]
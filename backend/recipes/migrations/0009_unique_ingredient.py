@@ -0,0 +1,65 @@
+# Generated by Django 4.0.2 on 2026-10-18 20:53
+
+from django.db import migrations, models
+
+
+def merge_duplicates(apps, schema_editor):
+    """
+    Дубли ингредиентов (их мог завести админ или повторный импорт CSV)
+    сливаются в самый старый: ссылки переносятся, количества в рецепте
+    и в списке покупок складываются, версия списка покупок у владельцев
+    растет
+    """
+    User = apps.get_model('users', 'User')
+    Ingredient = apps.get_model('recipes', 'Ingredient')
+    IngredientAmount = apps.get_model('recipes', 'IngredientAmount')
+    ShoppingListItem = apps.get_model('recipes', 'ShoppingListItem')
+    duplicates = Ingredient.objects.values(
+        'name', 'measurement_unit'
+    ).annotate(
+        first=models.Min('id'), copies=models.Count('id')
+    ).filter(copies__gt=1)
+    changed_users = set()
+    for row in duplicates:
+        others = list(Ingredient.objects.filter(
+            name=row['name'], measurement_unit=row['measurement_unit']
+        ).exclude(pk=row['first']).values_list('id', flat=True))
+        for model, owner, field in (
+                (IngredientAmount, 'recipe_id', 'amount'),
+                (ShoppingListItem, 'user_id', 'total')):
+            for duplicate in model.objects.filter(ingredient_id__in=others):
+                kept, created = model.objects.get_or_create(
+                    **{owner: getattr(duplicate, owner)},
+                    ingredient_id=row['first'],
+                    defaults={field: getattr(duplicate, field)})
+                if not created:
+                    model.objects.filter(pk=kept.pk).update(
+                        **{field: models.F(field) + getattr(duplicate,
+                                                            field)})
+                if owner == 'user_id':
+                    changed_users.add(duplicate.user_id)
+                duplicate.delete()
+        Ingredient.objects.filter(pk__in=others).delete()
+    User.objects.filter(pk__in=changed_users).update(
+        shopping_list_version=models.F('shopping_list_version') + 1)
+    if schema_editor.connection.vendor == 'postgresql':
+        # Отложенные проверки внешних ключей после удалений не дают
+        # сделать ALTER TABLE в той же транзакции ("pending trigger
+        # events"), выполняем их сейчас
+        schema_editor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0008_export_jobs'),
+        ('users', '0003_shopping_list'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='ingredient',
+            constraint=models.UniqueConstraint(fields=('name', 'measurement_unit'), name='unique_ingredient'),
+        ),
+    ]
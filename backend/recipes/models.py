@@ -1,4 +1,5 @@
-from django.db import models
+from django.db import connections, models, transaction
+from django.db.models.functions import RowNumber
 from users.models import User
 from django.core import validators
 
@@ -56,11 +57,73 @@ class Ingredient(models.Model):
     class Meta:
         verbose_name = 'Ингредиент'
         verbose_name_plural = 'Ингредиенты'
+        constraints = (
+            models.UniqueConstraint(
+                fields=('name', 'measurement_unit'),
+                name='unique_ingredient'),
+        )
 
     def __str__(self):
         return self.name
 
 
+class RecipeQuerySet(models.QuerySet):
+    def with_user_flags(self, user):
+        """
+        Аннотирует is_favorited, is_in_shopping_cart и подписку на автора
+        для текущего пользователя, чтобы сериализатор не ходил в базу
+        """
+        if not user.is_authenticated:
+            return self.annotate(
+                is_favorited=models.Value(False),
+                is_in_shopping_cart=models.Value(False),
+                is_author_subscribed=models.Value(False),
+            )
+        return self.annotate(
+            is_favorited=models.Exists(FollowOnRecipe.objects.filter(
+                user=user, recipe=models.OuterRef('pk'))),
+            is_in_shopping_cart=models.Exists(ShopList.objects.filter(
+                user=user, recipe=models.OuterRef('pk'))),
+            is_author_subscribed=models.Exists(FollowOnUser.objects.filter(
+                user=user, author=models.OuterRef('author'))),
+        )
+
+    def with_related(self):
+        """
+        Подтягивает автора, теги и ингредиенты фиксированным
+        числом запросов независимо от размера страницы
+        """
+        return self.select_related('author').prefetch_related(
+            'tags',
+            models.Prefetch(
+                'ingredient_amounts',
+                queryset=IngredientAmount.objects.select_related(
+                    'ingredient')),
+        )
+
+    def latest_by_author(self, author_ids, limit=None):
+        """
+        Последние limit рецептов каждого из авторов author_ids одним
+        запросом: ROW_NUMBER() OVER (PARTITION BY author_id) по индексу
+        recipe_author_pub_date_idx. Срез в prefetch на Django 4.0
+        не работает, поэтому ранжирующий запрос оборачивается в raw
+        """
+        recipes = self.filter(author_id__in=author_ids).order_by(
+            '-pub_date', '-id')
+        if not limit:
+            return recipes
+        ranked = recipes.order_by().annotate(author_rank=models.Window(
+            RowNumber(),
+            partition_by=models.F('author_id'),
+            order_by=(models.F('pub_date').desc(), models.F('id').desc()),
+        ))
+        sql, params = ranked.query.sql_with_params()
+        return self.raw(
+            f'SELECT * FROM ({sql}) ranked WHERE author_rank <= %s '
+            f'ORDER BY author_rank',
+            (*params, limit))
+
+
 class Recipe(models.Model):
     author = models.ForeignKey(
         User,
@@ -78,6 +141,14 @@ class Recipe(models.Model):
         upload_to='recipes/',
         verbose_name='Картинка',
     )
+    # Уменьшенные копии картинки, строятся в фоне (recipes.images).
+    # source - имя картинки, из которой они построены
+    image_variants = models.JSONField(
+        default=dict,
+        blank=True,
+        editable=False,
+        verbose_name='Варианты картинки',
+    )
     text = models.TextField(
         verbose_name='Описание рецепта',
         help_text='Опишите рецепт'
@@ -97,15 +168,35 @@ class Recipe(models.Model):
     cooking_time = models.PositiveIntegerField(
         verbose_name='Время готовки, мин.'
     )
+    favorites_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Добавлений в избранное',
+    )
+    in_carts_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Добавлений в список покупок',
+    )
     pub_date = models.DateTimeField(
         auto_now_add=True,
         verbose_name='Дата публикации рецепта',
     )
 
+    objects = RecipeQuerySet.as_manager()
+
     class Meta:
         verbose_name = 'Рецепт',
         verbose_name_plural = 'Рецепты'
         ordering = ('-pub_date',)
+        indexes = (
+            # Лента и курсорная пагинация: ORDER BY pub_date DESC, id DESC
+            models.Index(fields=('-pub_date', '-id'),
+                         name='recipe_pub_date_idx'),
+            # ?author= и рецепты автора в подписках, по дате
+            models.Index(fields=('author', '-pub_date'),
+                         name='recipe_author_pub_date_idx'),
+        )
 
     def __str__(self):
         return self.name
@@ -146,6 +237,84 @@ class IngredientAmount(models.Model):
         return f'{self.ingredient.name} in {self.recipe.name}'
 
 
+class UserRecipeQuerySet(models.QuerySet):
+    """
+    Массовое добавление и удаление рецептов в избранное или список
+    покупок. Сигналы не отправляются, поэтому счетчик counter_field
+    у рецептов сдвигается здесь же одним UPDATE. Сдвигаются только
+    строки, которые вернул RETURNING самого INSERT или DELETE:
+    параллельный запрос с теми же рецептами их уже не получит
+    (PostgreSQL, SQLite с 3.35)
+    """
+    def returning(self, sql, params):
+        with connections[self.db].cursor() as cursor:
+            cursor.execute(sql, params)
+            return sorted(row[0] for row in cursor.fetchall())
+
+    def columns(self):
+        quote = connections[self.db].ops.quote_name
+        opts = self.model._meta
+        return (quote(opts.db_table),
+                quote(opts.get_field('user').column),
+                quote(opts.get_field('recipe').column))
+
+    def add_recipes(self, user, recipe_ids):
+        """Добавляет существующие рецепты, которых еще нет у user"""
+        if not recipe_ids:
+            return []
+        counter = self.model.counter_field
+        table, user_column, recipe_column = self.columns()
+        quote = connections[self.db].ops.quote_name
+        recipes = quote(Recipe._meta.db_table)
+        pk = quote(Recipe._meta.pk.column)
+        placeholders = ', '.join(['%s'] * len(recipe_ids))
+        with transaction.atomic(using=self.db):
+            new_ids = self.returning(
+                f'INSERT INTO {table} ({user_column}, {recipe_column}) '
+                f'SELECT %s, {pk} FROM {recipes} '
+                f'WHERE {pk} IN ({placeholders}) '
+                f'ON CONFLICT DO NOTHING RETURNING {recipe_column}',
+                [user.pk, *recipe_ids])
+            Recipe.objects.filter(pk__in=new_ids).update(
+                **{counter: models.F(counter) + 1})
+            self.recipes_changed(user, new_ids, 1)
+        return new_ids
+
+    def remove_recipes(self, user, recipe_ids):
+        if not recipe_ids:
+            return []
+        counter = self.model.counter_field
+        table, user_column, recipe_column = self.columns()
+        placeholders = ', '.join(['%s'] * len(recipe_ids))
+        with transaction.atomic(using=self.db):
+            # DELETE без сбора объектов для post_delete
+            removed_ids = self.returning(
+                f'DELETE FROM {table} WHERE {user_column} = %s '
+                f'AND {recipe_column} IN ({placeholders}) '
+                f'RETURNING {recipe_column}',
+                [user.pk, *recipe_ids])
+            Recipe.objects.filter(
+                pk__in=removed_ids, **{f'{counter}__gt': 0}
+            ).update(**{counter: models.F(counter) - 1})
+            self.recipes_changed(user, removed_ids, -1)
+        return removed_ids
+
+    def recipes_changed(self, user, recipe_ids, sign):
+        """
+        Вызывается в той же транзакции после добавления (sign=1)
+        или удаления (sign=-1) рецептов
+        """
+
+
+class ShopListQuerySet(UserRecipeQuerySet):
+    """То же для списка покупок, плюс сдвиг сумм в ShoppingListItem"""
+    def recipes_changed(self, user, recipe_ids, sign):
+        # shopping импортирует модели, поэтому импорт здесь
+        from recipes import shopping
+        shopping.apply_delta(
+            [user.pk], shopping.recipe_amounts(recipe_ids, sign))
+
+
 class FollowOnUser(models.Model):
     user = models.ForeignKey(
         User,
@@ -185,6 +354,9 @@ class FollowOnRecipe(models.Model):
         help_text='На какой рецепт подписан'
     )
 
+    counter_field = 'favorites_count'
+    objects = UserRecipeQuerySet.as_manager()
+
     class Meta:
         verbose_name = 'Подписка юзера на рецепт'
         verbose_name_plural = 'Подписки юзера на рецепт'
@@ -193,6 +365,11 @@ class FollowOnRecipe(models.Model):
                 fields=('user', 'recipe'),
                 name='user_recipe_relations'),
         )
+        indexes = (
+            # Обратный поиск: кто добавил рецепт в избранное
+            models.Index(fields=('recipe', 'user'),
+                         name='followonrecipe_recipe_user_idx'),
+        )
 
     def __str__(self):
         return f'{self.user.username} follows {self.recipe.name}'
@@ -212,6 +389,9 @@ class ShopList(models.Model):
         help_text='У кого в списке покупок'
     )
 
+    counter_field = 'in_carts_count'
+    objects = ShopListQuerySet.as_manager()
+
     class Meta:
         verbose_name = 'Рецепт в списке покупок'
         verbose_name_plural = 'Рецепты в списке покупок'
@@ -220,6 +400,233 @@ class ShopList(models.Model):
                 fields=('user', 'recipe'),
                 name='user_recipe_shoplist_relations'),
         )
+        indexes = (
+            # Обратный поиск: у кого рецепт в списке покупок
+            models.Index(fields=('recipe', 'user'),
+                         name='shoplist_recipe_user_idx'),
+        )
 
     def __str__(self):
         return f'{self.user.username} follows {self.recipe.name}'
+
+
+class MediaBlob(models.Model):
+    """
+    Файл в хранилище с именем по хешу содержимого (recipes.storage).
+    refcount - сколько раз на файл ссылаются рецепты (картинка и ее
+    варианты). Файлы с нулем удаляет manage.py gc_media
+    """
+    name = models.CharField(
+        max_length=255,
+        unique=True,
+        verbose_name='Имя файла',
+    )
+    refcount = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Число ссылок',
+    )
+    updated = models.DateTimeField(
+        auto_now=True,
+        verbose_name='Изменен',
+    )
+
+    class Meta:
+        verbose_name = 'Файл'
+        verbose_name_plural = 'Файлы'
+        indexes = (
+            # Кандидаты на удаление для gc_media
+            models.Index(fields=('refcount', 'updated'),
+                         name='mediablob_refcount_idx'),
+        )
+
+    def __str__(self):
+        return self.name
+
+
+class ShoppingListItem(models.Model):
+    """
+    Строка списка покупок: сумма ингредиента по всем рецептам
+    в корзине пользователя. Поддерживается при изменении корзины
+    и ингредиентов рецептов (recipes.shopping)
+    """
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='shopping_list_items',
+        verbose_name='Пользователь',
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Ингредиент',
+    )
+    total = models.IntegerField(
+        default=0,
+        verbose_name='Сколько всего',
+    )
+
+    class Meta:
+        verbose_name = 'Строка списка покупок'
+        verbose_name_plural = 'Список покупок'
+        constraints = (
+            models.UniqueConstraint(
+                fields=('user', 'ingredient'),
+                name='user_ingredient_shopping_list'),
+        )
+
+    def __str__(self):
+        return f'{self.user.username}: {self.ingredient.name} {self.total}'
+
+
+class FeedEntry(models.Model):
+    """
+    Строка ленты пользователя: рецепт автора, на которого он подписан.
+    Пишется при публикации рецепта (recipes.feed), pub_date и author
+    скопированы из рецепта, чтобы чтение ленты шло по одному индексу
+    """
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+        verbose_name='Читатель',
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Рецепт',
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Автор',
+    )
+    pub_date = models.DateTimeField(
+        verbose_name='Дата публикации рецепта',
+    )
+
+    class Meta:
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Лента'
+        constraints = (
+            models.UniqueConstraint(
+                fields=('user', 'recipe'),
+                name='user_recipe_feed'),
+        )
+        indexes = (
+            # Страница ленты: WHERE user_id = %s AND (pub_date, recipe_id)
+            # < курсор ORDER BY pub_date DESC, recipe_id DESC LIMIT n
+            models.Index(fields=('user', '-pub_date', '-recipe'),
+                         name='feedentry_user_pub_date_idx'),
+            # Отписка: DELETE WHERE user_id = %s AND author_id = %s
+            models.Index(fields=('user', 'author'),
+                         name='feedentry_user_author_idx'),
+        )
+
+    def __str__(self):
+        return f'{self.user.username}: {self.recipe_id}'
+
+
+class ExportJob(models.Model):
+    """
+    Задание на выгрузку списка покупок, которое рендерит
+    manage.py run_export_worker. Одинаковые запросы к одной версии
+    списка склеиваются в одно задание (уникальность user, format,
+    version)
+    """
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (PENDING, PENDING),
+        (RUNNING, RUNNING),
+        (DONE, DONE),
+        (FAILED, FAILED),
+    )
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='export_jobs',
+        verbose_name='Пользователь',
+    )
+    format = models.CharField(
+        max_length=10,
+        default='pdf',
+        verbose_name='Формат',
+    )
+    version = models.PositiveIntegerField(
+        verbose_name='Версия списка покупок',
+    )
+    status = models.CharField(
+        max_length=10,
+        choices=STATUS_CHOICES,
+        default=PENDING,
+        verbose_name='Статус',
+    )
+    file = models.FileField(
+        upload_to='exports/',
+        blank=True,
+        verbose_name='Файл',
+    )
+    error = models.TextField(
+        blank=True,
+        verbose_name='Ошибка',
+    )
+    created = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='Создано',
+    )
+    started = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name='Начато',
+    )
+    finished = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name='Завершено',
+    )
+
+    class Meta:
+        verbose_name = 'Выгрузка'
+        verbose_name_plural = 'Выгрузки'
+        constraints = (
+            models.UniqueConstraint(
+                fields=('user', 'format', 'version'),
+                name='export_job_user_format_version'),
+        )
+        indexes = (
+            # Очередь: старейшие задания в статусе pending
+            models.Index(fields=('status', 'id'),
+                         name='exportjob_status_idx'),
+        )
+
+    def __str__(self):
+        return f'{self.user.username}: {self.format} v{self.version}'
+
+
+class CatalogVersion(models.Model):
+    """
+    Версия справочника (теги, ингредиенты) в базе: ее видят все
+    процессы, а поднимается она в той же транзакции, что и запись
+    в справочник (api.cache.bump_catalog_version)
+    """
+    name = models.CharField(
+        max_length=32,
+        primary_key=True,
+        verbose_name='Справочник',
+    )
+    version = models.PositiveBigIntegerField(
+        default=1,
+        verbose_name='Версия',
+    )
+
+    class Meta:
+        verbose_name = 'Версия справочника'
+        verbose_name_plural = 'Версии справочников'
+
+    def __str__(self):
+        return f'{self.name} v{self.version}'
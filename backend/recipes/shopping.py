@@ -0,0 +1,125 @@
+"""
+Материализованный список покупок. ShoppingListItem хранит готовые
+суммы ингредиентов по корзине пользователя, чтобы чтение списка
+не пересчитывало Sum по всем рецептам корзины.
+
+Добавление и удаление рецептов сдвигает суммы на ингредиенты
+рецепта (apply_delta). Правка ингредиентов рецепта сдвигает суммы
+всем, у кого он в корзине. Удаление рецепта целиком пересобирает
+списки затронутых пользователей одним запросом (rebuild)
+"""
+import itertools
+import threading
+
+from django.db.models import Case, F, Sum, Value, When
+
+from recipes.models import IngredientAmount, ShopList, ShoppingListItem
+from users.models import User
+
+_state = threading.local()
+
+
+def deleting_recipes():
+    """Рецепты, которые сейчас удаляются в этом потоке"""
+    if not hasattr(_state, 'deleting'):
+        _state.deleting = set()
+    return _state.deleting
+
+
+def recipe_amounts(recipe_ids, sign=1):
+    """{ingredient_id: сумма количеств} по рецептам recipe_ids"""
+    if not recipe_ids:
+        return {}
+    rows = IngredientAmount.objects.filter(
+        recipe_id__in=recipe_ids
+    ).order_by().values('ingredient').annotate(total=Sum('amount'))
+    return {row['ingredient']: sign * row['total'] for row in rows}
+
+
+def cart_users(recipe_id):
+    return list(ShopList.objects.filter(
+        recipe_id=recipe_id).values_list('user_id', flat=True))
+
+
+def current_version(user):
+    """
+    Версия списка покупок. Ее поднимает UPDATE в обход save(), поэтому
+    у пользователя из кеша токенов (api.authentication) она читается
+    из базы
+    """
+    if not getattr(user, 'from_token_cache', False):
+        return user.shopping_list_version
+    return User.objects.filter(pk=user.pk).values_list(
+        'shopping_list_version', flat=True).get()
+
+
+def bump_versions(user_ids):
+    User.objects.filter(pk__in=user_ids).update(
+        shopping_list_version=F('shopping_list_version') + 1)
+
+
+def apply_delta(user_ids, deltas):
+    """
+    Сдвигает суммы ингредиентов у пользователей user_ids на deltas
+    ({ingredient_id: сдвиг}) одним UPDATE; обнулившиеся строки удаляются
+    """
+    deltas = {pk: delta for pk, delta in deltas.items() if delta}
+    if not deltas or not user_ids:
+        return
+    ShoppingListItem.objects.bulk_create(
+        (ShoppingListItem(user_id=user_id, ingredient_id=ingredient_id)
+         for user_id in user_ids
+         for ingredient_id, delta in deltas.items() if delta > 0),
+        ignore_conflicts=True)
+    items = ShoppingListItem.objects.filter(
+        user_id__in=user_ids, ingredient_id__in=deltas)
+    items.update(total=F('total') + Case(
+        *(When(ingredient_id=pk, then=Value(delta))
+          for pk, delta in deltas.items()),
+        default=Value(0)))
+    if any(delta < 0 for delta in deltas.values()):
+        items.filter(total__lte=0).delete()
+    bump_versions(user_ids)
+
+
+def rebuild(user_ids=None, batch_size=5000):
+    """
+    Пересобирает списки пользователей user_ids (None - всех) из
+    корзин. Нужна после массовых вставок в обход сигналов
+    """
+    items = ShoppingListItem.objects.all()
+    # Одно условие на корзину: два filter() дали бы два JOIN
+    in_cart = {'recipe__users_shoplist__isnull': False}
+    if user_ids is not None:
+        user_ids = list(user_ids)
+        items = items.filter(user_id__in=user_ids)
+        in_cart = {'recipe__users_shoplist__user__in': user_ids}
+    amounts = IngredientAmount.objects.filter(**in_cart).order_by()
+    items.delete()
+    rows = amounts.values(
+        'recipe__users_shoplist__user', 'ingredient'
+    ).annotate(total=Sum('amount')).iterator()
+    objects = (
+        ShoppingListItem(user_id=row['recipe__users_shoplist__user'],
+                         ingredient_id=row['ingredient'],
+                         total=row['total'])
+        for row in rows
+    )
+    while True:
+        batch = list(itertools.islice(objects, batch_size))
+        if not batch:
+            break
+        ShoppingListItem.objects.bulk_create(batch)
+    if user_ids is None:
+        User.objects.update(
+            shopping_list_version=F('shopping_list_version') + 1)
+    else:
+        bump_versions(user_ids)
+
+
+def shopping_list(user):
+    """Строки списка покупок в формате render_shopping_list"""
+    return ShoppingListItem.objects.filter(user=user).order_by(
+        'ingredient__name'
+    ).values('ingredient__name', 'ingredient__measurement_unit',
+             count=F('total'))
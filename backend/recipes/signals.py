@@ -0,0 +1,159 @@
+from django.db import transaction
+from collections import Counter
+
+from django.db.models.signals import (post_delete, post_save, pre_delete,
+                                      pre_save)
+from django.dispatch import receiver
+from users.models import User
+
+from recipes.counters import change_counter
+from recipes.images import image_pool
+from recipes.storage import change_refcounts, recipe_files
+from recipes import feed, shopping
+from recipes.feed import feed_pool
+from recipes.models import (FollowOnRecipe, FollowOnUser, IngredientAmount,
+                            Recipe, ShopList)
+
+
+def counter_delta(kwargs):
+    """+1 при создании, -1 при удалении, 0 при обычном сохранении"""
+    if 'created' not in kwargs:
+        return -1
+    return 1 if kwargs['created'] else 0
+
+
+@receiver(post_save, sender=FollowOnRecipe)
+@receiver(post_delete, sender=FollowOnRecipe)
+def update_favorites_count(sender, instance, **kwargs):
+    change_counter(Recipe, instance.recipe_id, 'favorites_count',
+                   counter_delta(kwargs))
+
+
+@receiver(post_save, sender=ShopList)
+@receiver(post_delete, sender=ShopList)
+def update_in_carts_count(sender, instance, **kwargs):
+    change_counter(Recipe, instance.recipe_id, 'in_carts_count',
+                   counter_delta(kwargs))
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+def update_recipes_count(sender, instance, **kwargs):
+    change_counter(User, instance.author_id, 'recipes_count',
+                   counter_delta(kwargs))
+
+
+@receiver(post_save, sender=FollowOnUser)
+@receiver(post_delete, sender=FollowOnUser)
+def update_followers_count(sender, instance, **kwargs):
+    change_counter(User, instance.author_id, 'followers_count',
+                   counter_delta(kwargs))
+
+
+@receiver(post_save, sender=Recipe)
+def schedule_image_variants(sender, instance, **kwargs):
+    """Новая картинка уходит в пул после коммита, ответ ее не ждет"""
+    source = instance.image.name
+    if not source or instance.image_variants.get('source') == source:
+        return
+    transaction.on_commit(
+        lambda: image_pool.submit(instance.pk, source))
+
+
+@receiver(post_save, sender=Recipe)
+def schedule_fan_out(sender, instance, created, **kwargs):
+    """Новый рецепт раскладывается по лентам подписчиков после ответа"""
+    if created:
+        transaction.on_commit(
+            lambda: feed_pool.submit(feed.fan_out, instance.pk))
+
+
+@receiver(post_save, sender=FollowOnUser)
+def schedule_feed_fill(sender, instance, created, **kwargs):
+    # Подписку могли отменить до запуска: fill увидит пустой queryset
+    if created:
+        follows = FollowOnUser.objects.filter(pk=instance.pk)
+        transaction.on_commit(lambda: feed_pool.submit(feed.fill, follows))
+
+
+@receiver(post_delete, sender=FollowOnUser)
+def prune_feed(sender, instance, **kwargs):
+    feed.prune(instance.user_id, instance.author_id)
+
+
+@receiver(pre_save, sender=Recipe)
+def remember_recipe_files(sender, instance, **kwargs):
+    instance._stored_files = set()
+    if instance.pk and not kwargs['raw']:
+        row = Recipe.objects.filter(pk=instance.pk).values_list(
+            'image', 'image_variants').first()
+        if row:
+            instance._stored_files = recipe_files(*row)
+
+
+@receiver(post_save, sender=Recipe)
+def update_recipe_refcounts(sender, instance, **kwargs):
+    """Новые файлы рецепта +1, те, на которые он больше не ссылается, -1"""
+    old = getattr(instance, '_stored_files', set())
+    new = recipe_files(instance.image.name, instance.image_variants)
+    delta = Counter(new - old)
+    delta.subtract(old - new)
+    change_refcounts(delta)
+
+
+@receiver(post_delete, sender=Recipe)
+def release_recipe_files(sender, instance, **kwargs):
+    change_refcounts(Counter({
+        name: -1
+        for name in recipe_files(instance.image.name,
+                                 instance.image_variants)
+    }))
+
+
+@receiver(post_save, sender=ShopList)
+def add_to_shopping_list(sender, instance, created, **kwargs):
+    if created:
+        shopping.apply_delta(
+            [instance.user_id], shopping.recipe_amounts([instance.recipe_id]))
+
+
+@receiver(post_delete, sender=ShopList)
+def remove_from_shopping_list(sender, instance, **kwargs):
+    if instance.recipe_id in shopping.deleting_recipes():
+        return
+    shopping.apply_delta(
+        [instance.user_id],
+        shopping.recipe_amounts([instance.recipe_id], sign=-1))
+
+
+@receiver(post_save, sender=IngredientAmount)
+@receiver(post_delete, sender=IngredientAmount)
+def update_shopping_lists(sender, instance, **kwargs):
+    """
+    Правка ингредиентов по одному (админка). API меняет их пачками
+    и сдвигает суммы сам в RecipeCreateSerializer.update
+    """
+    if instance.recipe_id in shopping.deleting_recipes():
+        return
+    users = shopping.cart_users(instance.recipe_id)
+    if users:
+        shopping.rebuild(users)
+
+
+@receiver(pre_delete, sender=Recipe)
+def start_recipe_delete(sender, instance, **kwargs):
+    """
+    Каскад удалит корзины и ингредиенты рецепта в неизвестном порядке,
+    поэтому их сигналы пропускаются, а списки затронутых пользователей
+    пересобираются один раз после удаления
+    """
+    instance._cart_users = shopping.cart_users(instance.pk)
+    shopping.deleting_recipes().add(instance.pk)
+
+
+@receiver(post_delete, sender=Recipe)
+def finish_recipe_delete(sender, instance, **kwargs):
+    shopping.deleting_recipes().discard(instance.pk)
+    users = getattr(instance, '_cart_users', None)
+    if users:
+        shopping.rebuild(users)
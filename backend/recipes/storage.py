@@ -0,0 +1,115 @@
+import hashlib
+import os
+import posixpath
+from collections import Counter
+
+from django.core.files.storage import FileSystemStorage
+from django.db import connection, models
+from django.utils import timezone
+
+from recipes.models import MediaBlob, Recipe
+
+
+class HashedFileSystemStorage(FileSystemStorage):
+    """
+    Хранит файл под именем <каталог>/<ab>/<sha256><расширение>.
+    Одинаковые файлы пишутся один раз, а имя меняется вместе
+    с содержимым, поэтому nginx отдает их с Cache-Control: immutable
+    """
+    def hashed_name(self, name, content):
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        digest = digest.hexdigest()
+        extension = os.path.splitext(name)[1].lower()
+        return posixpath.join(
+            posixpath.dirname(name), digest[:2], digest + extension)
+
+    def _save(self, name, content):
+        name = self.hashed_name(name, content)
+        # Сначала строка MediaBlob: свежий updated не дает gc_media
+        # удалить файл, а если gc_media уже держит строку, запрос
+        # дождется его коммита и увидит, что файла больше нет
+        touch_blob(name)
+        if self.exists(name):
+            return name
+        saved = super()._save(name, content)
+        if saved != name:
+            # Тот же файл успел записать параллельный запрос
+            self.delete(saved)
+        return name
+
+
+def touch_blob(name):
+    """Создает строку MediaBlob или обновляет ее updated, один запрос"""
+    quote = connection.ops.quote_name
+    opts = MediaBlob._meta
+    table = quote(opts.db_table)
+    name_column, refcount_column, updated_column = (
+        quote(opts.get_field(field).column)
+        for field in ('name', 'refcount', 'updated'))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {table} '
+            f'({name_column}, {refcount_column}, {updated_column}) '
+            f'VALUES (%s, 0, %s) ON CONFLICT ({name_column}) '
+            f'DO UPDATE SET {updated_column} = EXCLUDED.{updated_column}',
+            [name, timezone.now()])
+
+
+def recipe_files(image, image_variants):
+    """Имена файлов, на которые ссылается рецепт"""
+    names = set()
+    if image:
+        names.add(str(image))
+    for variant, formats in image_variants.items():
+        if variant != 'source':
+            names.update(formats.values())
+    return names
+
+
+def change_refcounts(delta):
+    """
+    delta: Counter имя -> сдвиг. Недостающие строки создаются,
+    счетчики сдвигаются через F() одним UPDATE на значение сдвига
+    """
+    delta = {name: value for name, value in delta.items() if value}
+    if not delta:
+        return
+    MediaBlob.objects.bulk_create(
+        (MediaBlob(name=name) for name, value in delta.items() if value > 0),
+        ignore_conflicts=True)
+    by_value = {}
+    for name, value in delta.items():
+        by_value.setdefault(value, []).append(name)
+    for value, names in by_value.items():
+        queryset = MediaBlob.objects.filter(name__in=names)
+        if value < 0:
+            queryset = queryset.filter(refcount__gte=-value)
+        queryset.update(refcount=models.F('refcount') + value,
+                        updated=timezone.now())
+
+
+def recount_refs():
+    """
+    Пересчитывает refcount по рецептам: массовые вставки (seed_load)
+    и ручные правки базы обходят сигналы. Возвращает Counter
+    имя -> число ссылок
+    """
+    counts = Counter()
+    recipes = Recipe.objects.values_list('image', 'image_variants')
+    for image, image_variants in recipes.iterator():
+        counts.update(recipe_files(image, image_variants))
+    MediaBlob.objects.bulk_create(
+        (MediaBlob(name=name) for name in counts),
+        batch_size=1000, ignore_conflicts=True)
+    now = timezone.now()
+    stale = []
+    for blob in MediaBlob.objects.iterator():
+        if blob.refcount != counts[blob.name]:
+            blob.refcount = counts[blob.name]
+            blob.updated = now
+            stale.append(blob)
+    MediaBlob.objects.bulk_update(stale, ('refcount', 'updated'),
+                                  batch_size=1000)
+    return counts
@@ -44,6 +44,44 @@ class User(AbstractUser):
         default=USER,
         verbose_name='Пользовательские роли',
     )
+    recipes_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Количество рецептов',
+    )
+    followers_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Количество подписчиков',
+    )
+    # Растет при каждом изменении списка покупок, из нее строится ETag
+    shopping_list_version = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Версия списка покупок',
+    )
+
+    # Меняются только UPDATE с F() (сигналы recipes), полное сохранение
+    # их не пишет: иначе устаревший объект откатил бы счетчики, а
+    # shopping_list_version пошла бы назад (ETag, ключ ExportJob)
+    COUNTER_FIELDS = ('recipes_count', 'followers_count',
+                      'shopping_list_version')
+
+    def save(self, *args, **kwargs):
+        if kwargs.get('update_fields') is None:
+            # Копия из кеша токенов (api.authentication) может
+            # отставать от базы и по остальным полям
+            if getattr(self, 'from_token_cache', False):
+                raise ValueError(
+                    'Пользователь из кеша токенов сохраняется только '
+                    'с update_fields')
+            if (not self._state.adding and not args
+                    and not kwargs.get('force_insert')):
+                kwargs['update_fields'] = [
+                    field.name for field in self._meta.concrete_fields
+                    if not field.primary_key
+                    and field.name not in self.COUNTER_FIELDS]
+        super().save(*args, **kwargs)
 
     @property
     def is_admin(self):
@@ -3,6 +3,7 @@ from django.shortcuts import get_object_or_404
 from django.db import IntegrityError, transaction
 from drf_extra_fields.fields import Base64ImageField
 from rest_framework import serializers
+from api.fields import ImageVariantsField
 from recipes.models import FollowOnRecipe, FollowOnUser, Recipe
 from users.models import User
 
@@ -22,6 +23,8 @@ class CustomUserSerializer(serializers.ModelSerializer):
         }
 
     def get_is_subscribed(self, obj):
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         user = self.context.get('request').user
         if user.is_authenticated:
             return FollowOnUser.objects.filter(
@@ -51,6 +54,28 @@ class ChangePasswordSerializer(serializers.Serializer):
         return super().validate(obj)
 
 
+def prefetch_author_recipes(follows, recipes_limit):
+    """
+    Раскладывает по подпискам последние рецепты их авторов
+    (author.latest_recipes) одним запросом на всю страницу
+    """
+    authors = {follow.author_id: follow.author for follow in follows}
+    for author in authors.values():
+        author.latest_recipes = []
+    # recipes_limit=0 - пустые списки, без запроса
+    if recipes_limit == 0:
+        return
+    for recipe in Recipe.objects.latest_by_author(authors, recipes_limit):
+        authors[recipe.author_id].latest_recipes.append(recipe)
+
+
+class FollowOnUserListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        follows = list(data)
+        prefetch_author_recipes(follows, self.child.recipes_limit)
+        return super().to_representation(follows)
+
+
 class FollowOnUserSerializer(serializers.ModelSerializer):
     email = serializers.EmailField(source='author.email')
     id = serializers.EmailField(source='author.id')
@@ -71,9 +96,20 @@ class FollowOnUserSerializer(serializers.ModelSerializer):
         model = FollowOnUser
         fields = ('email', 'id', 'username', 'first_name',
                   'last_name', 'is_subscribed', 'recipes', 'recipes_count')
+        list_serializer_class = FollowOnUserListSerializer
+
+    @property
+    def recipes_limit(self):
+        recipes_limit = self.context.get('recipes_limit')
+        if recipes_limit and str(recipes_limit).isdigit():
+            return int(recipes_limit)
+        return None
 
     def get_is_subscribed(self, obj):
         user = self.context['request'].user
+        # Подписка текущего пользователя - подписан по определению
+        if obj.user_id == user.id:
+            return True
         if user.is_authenticated:
             return FollowOnUser.objects.filter(
                 user=user, author=obj.author
@@ -81,15 +117,13 @@ class FollowOnUserSerializer(serializers.ModelSerializer):
         return False
 
     def get_recipes_count(self, obj):
-        return obj.author.recipes.count()
+        return obj.author.recipes_count
 
     def get_recipes(self, obj):
-        recipes_limit = self.context['recipes_limit']
-        if recipes_limit:
-            recipes = obj.author.recipes.all()[:int(recipes_limit)]
-        else:
-            recipes = obj.author.recipes.all()
-        return FollowOnRecipeSerializer(recipes, many=True).data
+        if not hasattr(obj.author, 'latest_recipes'):
+            prefetch_author_recipes([obj], self.recipes_limit)
+        return FollowOnRecipeSerializer(obj.author.latest_recipes,
+                                        many=True).data
 
 
 class SubscribeSerializer(serializers.ModelSerializer):
@@ -116,10 +150,11 @@ class SubscribeSerializer(serializers.ModelSerializer):
 
 class FollowOnRecipeSerializer(serializers.ModelSerializer):
     image = Base64ImageField()
+    image_variants = ImageVariantsField()
 
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'image_variants', 'cooking_time')
         read_only_fields = ('id', 'name', 'image', 'cooking_time')
 
     def validate(self, data):
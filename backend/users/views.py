@@ -1,3 +1,6 @@
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import Exists, OuterRef, Value
 from django.shortcuts import get_object_or_404
 from django_filters import rest_framework
 from recipes.models import FollowOnUser
@@ -5,11 +8,13 @@ from rest_framework import status, viewsets
 from rest_framework.decorators import action
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
-from api.pagination import CustomPageSizePagination
+from api.cache import user_me_key
+from api.pagination import (CursorOrPageSizePagination,
+                            CustomPageSizePagination)
 from api.permissions import AllowAnyGetPost, CurrentUserOrAdmin
 from users.models import User
 from users.serializers import (ChangePasswordSerializer, CustomUserSerializer,
-                               FollowOnUserSerializer, SubscribeSerializer)
+                               FollowOnUserSerializer)
 
 
 class UserViewSet(viewsets.ModelViewSet):
@@ -17,15 +22,34 @@ class UserViewSet(viewsets.ModelViewSet):
     serializer_class = CustomUserSerializer
     permission_classes = (AllowAnyGetPost, )
     pagination_class = CustomPageSizePagination
+    # Правки в обход save() (update()) видны не позже чем через TTL
+    me_cache_timeout = 60 * 5
+
+    def get_queryset(self):
+        """
+        is_subscribed одним подзапросом вместо EXISTS на каждого
+        пользователя в CustomUserSerializer
+        """
+        user = self.request.user
+        if not user.is_authenticated:
+            return self.queryset.annotate(is_subscribed=Value(False))
+        return self.queryset.annotate(is_subscribed=Exists(
+            FollowOnUser.objects.filter(user=user, author=OuterRef('pk'))))
 
     @action(detail=False, methods=('get', ),
             permission_classes=[IsAuthenticated])
     def me(self, request):
         """
-        Опеределили действие при api/users/me
+        Опеределили действие при api/users/me. Ответ кешируется
+        на пользователя в общем кеше, сигналы api.signals сбрасывают
+        его при сохранении пользователя
         """
-        serializer = self.get_serializer(self.request.user)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        key = user_me_key(request.user.pk)
+        data = cache.get(key)
+        if data is None:
+            data = dict(self.get_serializer(request.user).data)
+            cache.set(key, data, self.me_cache_timeout)
+        return Response(data, status=status.HTTP_200_OK)
 
     @action(detail=False, methods=('post', ),
             permission_classes=(CurrentUserOrAdmin, ))
@@ -42,7 +66,8 @@ class UserViewSet(viewsets.ModelViewSet):
         user = self.request.user
         new_password = serializer.data.get("new_password")
         user.set_password(new_password)
-        user.save()
+        # request.user может быть копией из кеша токенов
+        user.save(update_fields=('password', ))
         return Response(status=status.HTTP_201_CREATED)
 
     @action(detail=True,
@@ -52,42 +77,37 @@ class UserViewSet(viewsets.ModelViewSet):
         """
         Определили действия при api/users/{id}/subscribe
         """
-        author = get_object_or_404(User, id=pk)
         user = self.request.user
-        is_already_follow = FollowOnUser.objects.filter(
-            user=user, author=author).exists()
-        data = {
-            'user': user.pk,
-            'author': author.pk,
-        }
-        serializer = SubscribeSerializer(data=data,
-                                         context={'request': request}
-                                         )
         if request.method == 'POST':
-            if not is_already_follow:
-                new_following = FollowOnUser.objects.create(
-                    user=user,
-                    author=author
-                )
-                recipes_limit = self.request.query_params.get('recipes_limit')
-                serializer = FollowOnUserSerializer(
-                    new_following,
-                    context={'request': request,
-                             'recipes_limit': recipes_limit}
-                )
-                return Response(
-                    data=serializer.data,
-                    status=status.HTTP_201_CREATED
-                )
-            return Response('Error: Вы уже подписаны на автора '
-                            f'{author.username} (id - {pk})',
-                            status=status.HTTP_400_BAD_REQUEST)
+            author = get_object_or_404(User, id=pk)
+            try:
+                with transaction.atomic():
+                    new_following = FollowOnUser.objects.create(
+                        user=user,
+                        author=author
+                    )
+            except IntegrityError:
+                return Response('Error: Вы уже подписаны на автора '
+                                f'{author.username} (id - {pk})',
+                                status=status.HTTP_400_BAD_REQUEST)
+            recipes_limit = self.request.query_params.get('recipes_limit')
+            serializer = FollowOnUserSerializer(
+                new_following,
+                context={'request': request,
+                         'recipes_limit': recipes_limit}
+            )
+            return Response(
+                data=serializer.data,
+                status=status.HTTP_201_CREATED
+            )
 
         if request.method == 'DELETE':
-            if is_already_follow:
-                FollowOnUser.objects.filter(user=user, author=author).delete()
+            deleted, _ = FollowOnUser.objects.filter(
+                user=user, author_id=pk).delete()
+            if deleted:
                 return Response('Подписка удалена',
                                 status=status.HTTP_204_NO_CONTENT)
+            author = get_object_or_404(User, id=pk)
             return Response('Error: Вы не были подписаны на автора '
                             f'{author.username} (id - {pk})',
                             status=status.HTTP_400_BAD_REQUEST)
@@ -97,14 +117,15 @@ class UserViewSet(viewsets.ModelViewSet):
 
 class SubscriptionsViewSet(viewsets.ModelViewSet):
     serializer_class = FollowOnUserSerializer
-    pagination_class = CustomPageSizePagination
+    pagination_class = CursorOrPageSizePagination
+    cursor_ordering = ('-id',)
     filter_backends = (rest_framework.DjangoFilterBackend,)
     permission_classes = (IsAuthenticated, )
 
     def get_queryset(self):
         user = self.request.user
         return FollowOnUser.objects.filter(
-            user=user).select_related('author')
+            user=user).select_related('author').order_by('-id')
 
     def get_serializer_context(self):
         """Передали в сериализатор параметр recipes_limit"""